@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class DbmanageConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dbmanage'
+
+    def ready(self):
+        # connect the signal receivers
+        from dbmanage import dispatcher, perf, signals  # noqa: F401
+        perf.install()
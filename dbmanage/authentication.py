@@ -0,0 +1,68 @@
+from django.utils.functional import SimpleLazyObject
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from dbmanage.models import User
+
+ROLE_CLAIM = 'role'
+OIL_MILL_CLAIM = 'oil_mill_id'
+
+
+def token_claims(user):
+    """
+    The claims describing `user` in its tokens: its role and, for a mill manager, its oil mill.
+    """
+    return {ROLE_CLAIM: user.role, OIL_MILL_CLAIM: user.oil_mill_id if user.role == 'mill manager' else None}
+
+
+def tokens_for(user):
+    """
+    Refresh token of `user` with the role and mill claims, its access token gets a copy of them.
+    """
+    refresh = RefreshToken.for_user(user)
+    for claim, value in token_claims(user).items():
+        refresh[claim] = value
+    return refresh
+
+
+def _load_user(user_id):
+    try:
+        return User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+
+
+class TokenUser(SimpleLazyObject):
+    """
+    request.user of a token with claims: id, role and oil_mill_id are read from the signed claims
+    without a query. Any other attribute loads the User row once, so views needing the model
+    instance keep working.
+    """
+
+    def __init__(self, token):
+        user_id = token[api_settings.USER_ID_CLAIM]
+        super().__init__(lambda: _load_user(user_id))
+        role = token[ROLE_CLAIM]
+        claims = {'id': user_id, 'pk': user_id, 'role': role, 'is_authenticated': True, 'is_anonymous': False}
+        # a mill manager whose token predates the mill loads it from the database
+        if role != 'mill manager' or token.get(OIL_MILL_CLAIM) is not None:
+            claims[OIL_MILL_CLAIM] = token.get(OIL_MILL_CLAIM)
+        self.__dict__.update(claims)
+
+    def __bool__(self):
+        return True
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication without the User query: tokens issued by tokens_for() authenticate a
+    TokenUser. Tokens without claims load the user as before.
+    """
+
+    def get_user(self, validated_token):
+        if ROLE_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        return TokenUser(validated_token)
+
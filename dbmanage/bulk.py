@@ -0,0 +1,63 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# adapted values remembered per field: choices, dates and quantities repeat across the rows
+MAX_CACHED_VALUES = 10000
+# internal types whose Python values the database driver takes as they are
+PLAIN_TYPES = {
+    'AutoField', 'BigAutoField', 'SmallAutoField', 'IntegerField', 'BigIntegerField', 'SmallIntegerField',
+    'PositiveIntegerField', 'PositiveBigIntegerField', 'PositiveSmallIntegerField', 'FloatField', 'BooleanField',
+    'CharField', 'TextField', 'SlugField',
+}
+_missing = object()
+
+
+def _is_plain(field):
+    # a foreign key is saved as the value of the field it points to
+    field = field.target_field if field.is_relation else field
+    return field.get_internal_type() in PLAIN_TYPES
+
+
+class RawInsert:
+    """
+    The INSERT bulk_create() would issue for `fields` of `model` (model fields or their names),
+    executed with one executemany() per batch of rows, tuples of values in the order of `fields`.
+    No model instance is built and no value compiled: the values of the fields that need it (dates,
+    decimals, ...) go through get_db_prep_save() once per distinct value, the others are passed as
+    they are. Signals are not sent and versions are not bumped, callers do what they need of it.
+    """
+
+    def __init__(self, model, fields, using=DEFAULT_DB_ALIAS):
+        opts = model._meta
+        # the connection itself, not the proxy: its attributes are looked up for every adapted value
+        self.connection = connections[using]
+        self.fields = [opts.get_field(field) if isinstance(field, str) else field for field in fields]
+        quote = self.connection.ops.quote_name
+        self.sql = (f"INSERT INTO {quote(opts.db_table)} ({', '.join(quote(field.column) for field in self.fields)}) "
+                    f"VALUES ({', '.join(['%s'] * len(self.fields))})")
+        self.adapted = [(index, field, {}) for index, field in enumerate(self.fields) if not _is_plain(field)]
+
+    def adapt(self, row):
+        connection, row = self.connection, list(row)
+        for index, field, values in self.adapted:
+            value = row[index]
+            adapted = values.get(value, _missing)
+            if adapted is _missing:
+                if len(values) >= MAX_CACHED_VALUES:
+                    values.clear()
+                adapted = values[value] = field.get_db_prep_save(value, connection)
+            row[index] = adapted
+        return row
+
+    def execute(self, rows, cursor=None):
+        """
+        Inserts `rows`, in the given cursor or a new one, and returns their number.
+        """
+        if not rows:
+            return 0
+        adapted = [self.adapt(row) for row in rows] if self.adapted else rows
+        if cursor is None:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, adapted)
+        else:
+            cursor.executemany(self.sql, adapted)
+        return len(rows)
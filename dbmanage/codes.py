@@ -0,0 +1,106 @@
+import threading
+
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F
+from django.dispatch import receiver
+
+DEFAULT_SETTINGS = {
+    # numbers reserved per round trip by the save() of a single object, outside of a transaction
+    'BLOCK_SIZE': 100,
+}
+
+
+def get_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'CODE_ALLOCATOR', {}))
+
+
+def _sequences(using=None):
+    model = apps.get_model('dbmanage', 'CodeSequence')
+    return model, model.objects.using(using or router.db_for_write(model))
+
+
+def allocate(prefix, count=1, using=None):
+    """
+    Reserves `count` consecutive numbers of the sequence of `prefix` and returns them as a range.
+    The sequence row is incremented in place, so concurrent callers wait on its lock and never get
+    the same numbers; numbers of a rolled back transaction go back to the sequence with the rows
+    that used them.
+    """
+    model, sequences = _sequences(using)
+    with transaction.atomic(using=sequences.db):
+        if not sequences.filter(prefix=prefix).update(last_value=F('last_value') + count):
+            try:
+                with transaction.atomic(using=sequences.db):
+                    sequences.create(prefix=prefix, last_value=count)
+            except IntegrityError:
+                # created meanwhile by another caller
+                sequences.filter(prefix=prefix).update(last_value=F('last_value') + count)
+        last = sequences.filter(prefix=prefix).values_list('last_value', flat=True).get()
+    return range(last - count + 1, last + 1)
+
+
+class CodeAllocator:
+    """
+    Hands out sequence numbers from blocks reserved with one round trip each. Blocks are only kept
+    for later calls once their reservation is committed: a block reserved in a transaction which
+    may still roll back is never reused, the numbers left in it are skipped.
+    """
+
+    def __init__(self, block_size=100):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def numbers(self, prefix, count=1, using=None):
+        using = using or router.db_for_write(apps.get_model('dbmanage', 'CodeSequence'))
+        if count >= self.block_size or connections[using].in_atomic_block:
+            return allocate(prefix, count, using)
+        key = (using, prefix)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or len(block) < count:
+                block = allocate(prefix, self.block_size, using)
+            self._blocks[key] = block[count:]
+            return block[:count]
+
+    def reset(self):
+        with self._lock:
+            self._blocks.clear()
+
+
+_allocator = None
+_allocator_lock = threading.Lock()
+
+
+def get_allocator():
+    global _allocator
+    if _allocator is None:
+        with _allocator_lock:
+            if _allocator is None:
+                _allocator = CodeAllocator(block_size=get_settings()['BLOCK_SIZE'])
+    return _allocator
+
+
+def assign(objs, using=None):
+    """
+    Gives a code to the objects (CodedModel instances) which have none yet, with one sequence round
+    trip per code prefix: objects built for bulk_create() go through this first. Returns `objs`.
+    """
+    uncoded = {}
+    for obj in objs:
+        if not getattr(obj, obj.code_field):
+            uncoded.setdefault(obj.get_code_prefix(), []).append(obj)
+    for prefix, group in uncoded.items():
+        for obj, number in zip(group, get_allocator().numbers(prefix, len(group), using)):
+            setattr(obj, obj.code_field, obj.build_code(prefix, str(number).zfill(6)))
+    return objs
+
+
+@receiver(setting_changed)
+def reset_allocator(setting, **kwargs):
+    global _allocator
+    if setting == 'CODE_ALLOCATOR':
+        _allocator = None
@@ -0,0 +1,167 @@
+import atexit
+import json
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.signals import request_started, setting_changed
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.dispatch import receiver
+
+from dbmanage.models import Notification, NotificationOutbox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    # 'thread': one outbox row per call in the transaction of the caller, written to Notification in
+    # batches by a background thread
+    # 'sync': written at once, in the transaction of the caller
+    'MODE': 'thread',
+    # outbox rows read at once
+    'BATCH_SIZE': 500,
+    # seconds between two reads of the outbox when no commit wakes the thread up: the rows of other
+    # processes, stopped before writing them, and of failed flushes
+    'FLUSH_INTERVAL': 5,
+}
+
+INTENT_FIELDS = ('user_id', 'oil_mill_id', 'message')
+
+
+def get_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'NOTIFICATION_DISPATCHER', {}))
+
+
+class NotificationDispatcher:
+    """
+    Takes the notification rows off the request path: notify_many() writes its intents as one
+    NotificationOutbox row in the transaction of the caller, so they are committed, or rolled back,
+    with what they notify of, and a background thread writes them to Notification in batches with
+    bulk_create. Delivery is at least once from the outbox, and exactly once in the database: every
+    intent carries a unique intent_id and intents written again after a crash between the insert and
+    the removal of their outbox rows are skipped by the unique constraint.
+    """
+
+    def __init__(self, batch_size=500, flush_interval=5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        self.start()
+        self._wakeup.set()
+
+    def flush(self):
+        """
+        Writes every committed outbox row, returns the number of written intents.
+        """
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = list(NotificationOutbox.objects.order_by('id').values_list('id', 'payload')[:self.batch_size])
+                if not batch:
+                    return written
+                notifications = [Notification(**intent) for row_id, payload in batch for intent in json.loads(payload)]
+                try:
+                    with transaction.atomic():
+                        Notification.objects.bulk_create(notifications, batch_size=self.batch_size,
+                                                         ignore_conflicts=True)
+                except IntegrityError:
+                    # a recipient was deleted meanwhile: write one by one and drop the dead intents
+                    for notification in notifications:
+                        try:
+                            with transaction.atomic():
+                                Notification.objects.bulk_create([notification], ignore_conflicts=True)
+                        except IntegrityError:
+                            logger.warning('Dropped notification %s, its recipient does not exist',
+                                           notification.intent_id)
+                # removed only once the notifications are committed
+                NotificationOutbox.objects.filter(pk__in=[row_id for row_id, payload in batch]).delete()
+                written += len(notifications)
+
+    def start(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                    self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                close_old_connections()
+                self.flush()
+            except Exception:
+                # the intents stay in the outbox and are retried on the next round
+                logger.exception('Notification flush failed')
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Final notification flush failed')
+        finally:
+            connection.close()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                config = get_settings()
+                _dispatcher = NotificationDispatcher(batch_size=config['BATCH_SIZE'],
+                                                     flush_interval=config['FLUSH_INTERVAL'])
+                atexit.register(_dispatcher.stop)
+    return _dispatcher
+
+
+def notify_many(intents):
+    """
+    Sends notifications, given as dicts with `message` and `user_id` and/or `oil_mill_id`. In thread
+    mode they are written as one outbox row in the current transaction, so the caller pays for one
+    INSERT whatever the number of recipients, and the dispatcher thread is woken up once the
+    transaction commits.
+    """
+    intents = [dict({name: intent.get(name) for name in INTENT_FIELDS}, intent_id=uuid.uuid4().hex)
+               for intent in intents]
+    if not intents:
+        return
+    if get_settings()['MODE'] == 'sync':
+        Notification.objects.bulk_create([Notification(**intent) for intent in intents])
+        return
+    NotificationOutbox.objects.create(payload=json.dumps(intents))
+    transaction.on_commit(lambda: get_dispatcher().wake())
+
+
+def notify(message, user_id=None, oil_mill_id=None):
+    notify_many([{'message': message, 'user_id': user_id, 'oil_mill_id': oil_mill_id}])
+
+
+@receiver(request_started)
+def start_dispatcher(**kwargs):
+    # outbox rows left by a previous run are written from the first request on
+    if _dispatcher is None and get_settings()['MODE'] != 'sync':
+        get_dispatcher().start()
+
+
+@receiver(setting_changed)
+def reset_dispatcher(setting, **kwargs):
+    global _dispatcher
+    if setting == 'NOTIFICATION_DISPATCHER' and _dispatcher is not None:
+        _dispatcher.stop()
+        _dispatcher = None
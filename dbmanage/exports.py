@@ -0,0 +1,125 @@
+import csv
+import io
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from dbmanage.models import ExtractionOperation, OilProduct, OilPurchaseRequest, Packaging, PurchasedOlive
+
+CHUNK_SIZE = 2000
+
+
+class Export:
+    """
+    A flat dump of a model: the `columns` (lookups, related ones included) of the rows whose
+    `date_field` is in a range, read with values_list() in chunks of a server side iterator, so the
+    memory used does not grow with the number of rows.
+    """
+
+    def __init__(self, model, date_field, columns, owners):
+        self.model = model
+        self.date_field = date_field
+        self.columns = columns
+        # user id -> Q of the rows the user takes part in
+        self.owners = owners
+
+    @property
+    def headers(self):
+        return [column.replace('__', '.') for column in self.columns]
+
+    def queryset(self, user=None, start=None, end=None):
+        # user None: every row (administrators)
+        queryset = self.model.objects.all()
+        if user is not None:
+            queryset = queryset.filter(self.owners(user.id))
+        if start is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__lte': end})
+        # primary key order: rows stream from the first one, without sorting the range first
+        return queryset.order_by('id')
+
+    def rows(self, queryset, chunk_size=CHUNK_SIZE):
+        return queryset.values_list(*self.columns).iterator(chunk_size=chunk_size)
+
+
+EXPORTS = {
+    'extraction-operations': Export(
+        ExtractionOperation, 'finish_date',
+        ('id', 'oil_mill__name', 'external_oil_mill', 'harvest__harvest_code', 'extraction_offer__offer_code',
+         'reception_date', 'start_date', 'finish_date', 'olives_quantity', 'quantity_unit', 'water_per_100kg',
+         'mixing_duration', 'time_unit', 'press_temperature', 'filtration_considered', 'separate_mixing_by_variety',
+         'method', 'produced_quantity', 'produced_quantity_unit', 'oilproduct__oil_product_code'),
+        lambda user_id: (Q(oil_mill__mill_manager_id=user_id) | Q(harvest__grove__farmer_id=user_id) |
+                         Q(extraction_offer__extraction_request__farmer_id=user_id)),
+    ),
+    'oil-products': Export(
+        OilProduct, 'production_date',
+        ('id', 'oil_product_code', 'production_date', 'creation_cause', 'produced_quantity', 'remaining_quantity',
+         'quantity_unit', 'oil_quality', 'quality_control_performed', 'owner_category', 'owner__email',
+         'owner_mill__name', 'is_packaged', 'is_stored', 'mother_product__oil_product_code',
+         'extraction_operation_id'),
+        lambda user_id: Q(owner_id=user_id),
+    ),
+    'packagings': Export(
+        Packaging, 'packaging_date',
+        ('id', 'packaging_reference', 'packaging_date', 'packaged_quantity', 'packaged_quantity_unit',
+         'type_of_packaging', 'packaging_volume', 'packaging_factory_name', 'factory_address', 'factory_certificate',
+         'oil_product__oil_product_code', 'oil_mill__name', 'packaging_offer__offer_code'),
+        lambda user_id: Q(oil_mill__mill_manager_id=user_id) | Q(oil_product__owner_id=user_id),
+    ),
+    'purchased-olives': Export(
+        PurchasedOlive, 'purchase_date',
+        ('id', 'purchase_date', 'olive_quantity', 'quantity_unit', 'olives_variety', 'maturity_index',
+         'characterization', 'classification_by_maturity', 'cropping_system', 'practice', 'mill__name',
+         'olive_purchase_request__request_code', 'olive_purchase_request__requested_price',
+         'olive_purchase_request__olive_sale_offer__offer_code'),
+        lambda user_id: (Q(mill__mill_manager_id=user_id) |
+                         Q(olive_purchase_request__olive_sale_offer__harvest__grove__farmer_id=user_id)),
+    ),
+    'oil-purchase-requests': Export(
+        OilPurchaseRequest, 'request_date',
+        ('id', 'request_code', 'request_date', 'requested_quantity', 'quantity_unit', 'requested_price', 'price_unit',
+         'buyer_category', 'oil_mill__name', 'consumer__email', 'request_status', 'status_update_date',
+         'oil_sale_offer__offer_code', 'oil_sale_offer__oil_product__oil_product_code'),
+        lambda user_id: (Q(oil_mill__mill_manager_id=user_id) | Q(consumer_id=user_id) |
+                         Q(oil_sale_offer__oil_mill__mill_manager_id=user_id) | Q(oil_sale_offer__farmer_id=user_id)),
+    ),
+}
+
+
+def csv_chunks(headers, rows, chunk_size=CHUNK_SIZE):
+    """
+    Yields the CSV text of `rows`, header line first, `chunk_size` rows at a time.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def ndjson_chunks(headers, rows, chunk_size=CHUNK_SIZE):
+    """
+    Yields `rows` as NDJSON objects keyed by `headers`, `chunk_size` lines at a time.
+    """
+    encoder = DjangoJSONEncoder()
+    lines = []
+    for row in rows:
+        lines.append(encoder.encode(dict(zip(headers, row))))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+WRITERS = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+}
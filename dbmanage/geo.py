@@ -0,0 +1,171 @@
+import csv
+import math
+import os
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from dbmanage.matching import normalize
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+# above every geohash character, closes the index range of a prefix
+_PREFIX_END = '~'
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(__file__), 'data', 'gazetteer.csv')
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """
+    Geohash of a point: nearby points share a prefix, so the points of a cell are an index range.
+    """
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (latitude, longitude) size in degrees of the cells of a precision
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def neighbours(latitude, longitude, precision):
+    """
+    The geohashes of the 3 x 3 cells around a point, at a precision.
+    """
+    lat_size, lon_size = cell_size(precision)
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lon_step in (-1, 0, 1):
+            lat = min(max(latitude + lat_step * lat_size, -90.0), 90.0)
+            lon = (longitude + lon_step * lon_size + 180.0) % 360.0 - 180.0
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def covered_radius(latitude, precision):
+    """
+    Distance in km from a point within which every point lies in the 3 x 3 cells around it: one
+    cell, in its narrowest direction.
+    """
+    lat_size, lon_size = cell_size(precision)
+    return min(lat_size * _KM_PER_DEGREE, lon_size * _KM_PER_DEGREE * math.cos(math.radians(min(abs(latitude), 89.9))))
+
+
+def precision_for(latitude, radius_km):
+    """
+    The finest precision whose 3 x 3 cells around a point cover `radius_km`, None when even the
+    coarsest cells are too small.
+    """
+    for precision in range(PRECISION, 0, -1):
+        if covered_radius(latitude, precision) >= radius_km:
+            return precision
+    return None
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    # haversine
+    lat1, lat2 = math.radians(latitude1), math.radians(latitude2)
+    d_lat, d_lon = lat2 - lat1, math.radians(longitude2 - longitude1)
+    a = math.sin(d_lat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cells_q(cells, field='geohash'):
+    # one index range per cell, not a LIKE (case insensitive on SQLite, so never an index range)
+    condition = Q()
+    for cell in cells:
+        condition |= Q(**{f'{field}__gte': cell, f'{field}__lt': cell + _PREFIX_END})
+    return condition
+
+
+def _with_distances(queryset, latitude, longitude, radius_km=None):
+    results = []
+    for obj in queryset:
+        distance = distance_km(latitude, longitude, obj.latitude, obj.longitude)
+        if radius_km is None or distance <= radius_km:
+            obj.distance_km = distance
+            results.append(obj)
+    return sorted(results, key=lambda obj: (obj.distance_km, obj.pk))
+
+
+def within(queryset, latitude, longitude, radius_km):
+    """
+    The objects of `queryset` (a model with latitude, longitude and an indexed geohash) within
+    `radius_km` of a point, nearest first, with a `distance_km` attribute. Only the 3 x 3 cells
+    covering the radius are read.
+    """
+    precision = precision_for(latitude, radius_km)
+    if precision is not None:
+        queryset = queryset.filter(cells_q(neighbours(latitude, longitude, precision)))
+    return _with_distances(queryset.exclude(geohash=None), latitude, longitude, radius_km)
+
+
+def nearest(queryset, latitude, longitude, k):
+    """
+    The `k` objects of `queryset` nearest to a point, with a `distance_km` attribute. Starts with
+    the finest cells and widens them until the k-th nearest is within the radius they cover.
+    """
+    queryset = queryset.exclude(geohash=None)
+    for precision in range(PRECISION - 3, 0, -1):
+        candidates = _with_distances(queryset.filter(cells_q(neighbours(latitude, longitude, precision))),
+                                     latitude, longitude)
+        if len(candidates) >= k and candidates[k - 1].distance_km <= covered_radius(latitude, precision):
+            return candidates[:k]
+    return _with_distances(queryset, latitude, longitude)[:k]
+
+
+class Gazetteer:
+    """
+    Offline geocoder over a CSV file of places (name, latitude, longitude, optional country): an
+    address is located at the most specific place it names.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or getattr(settings, 'GAZETTEER_PATH', None) or DEFAULT_GAZETTEER
+        self.places = {}
+        with open(self.path, newline='', encoding='utf-8') as gazetteer:
+            for row in csv.DictReader(gazetteer):
+                place = (float(row['latitude']), float(row['longitude']))
+                self.places.setdefault((normalize(row['name']), normalize(row.get('country'))), place)
+                self.places.setdefault((normalize(row['name']), ''), place)
+        self.longest = max((len(name.split()) for name, country in self.places), default=0)
+
+    def locate(self, address, country=''):
+        """
+        Returns the (latitude, longitude) of the longest place name found in the address, the last
+        one on ties (addresses end with their town), in the country when known, or None.
+        """
+        words = normalize(address.replace(',', ' ')).split()
+        country = normalize(country)
+        for size in range(min(self.longest, len(words)), 0, -1):
+            for start in range(len(words) - size, -1, -1):
+                name = ' '.join(words[start:start + size])
+                place = self.places.get((name, country)) or self.places.get((name, ''))
+                if place is not None:
+                    return place
+        return None
+
+
+def get_geocoder():
+    # settings.GEOCODER: dotted path of a class with locate(address, country), a Gazetteer by default
+    return import_string(getattr(settings, 'GEOCODER', 'dbmanage.geo.Gazetteer'))()
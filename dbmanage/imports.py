@@ -0,0 +1,277 @@
+import csv
+from abc import ABC, abstractmethod
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
+
+from dbmanage import bulk, codes, geo, ingest, matching, search, versions
+from dbmanage.models import CodedModel, Farmer, Harvest, OliveGrove, OliveSaleOffer
+
+CHUNK_SIZE = 2000
+# cleaned values remembered per field: choices, dates and quantities repeat across the rows
+MAX_CACHED_VALUES = 10000
+
+
+class ImportReport(ingest.IngestReport):
+    def __init__(self, resume_after=0):
+        super().__init__()
+        self.skipped = 0
+        # last line of the last committed chunk: an interrupted import is resumed after it
+        self.committed_line = resume_after
+        self.failed = None
+
+    def as_dict(self):
+        return dict(super().as_dict(), skipped=self.skipped, committed_line=self.committed_line, failed=self.failed)
+
+
+def iter_csv(lines):
+    """
+    Yields (line number, row dict or error message) for a CSV stream whose first line names the columns.
+    """
+    reader = csv.reader(lines)
+    header = None
+    for values in reader:
+        if not values:
+            continue
+        if header is None:
+            header = [value.strip() for value in values]
+            continue
+        if len(values) != len(header):
+            yield reader.line_num, f'expected {len(header)} columns'
+            continue
+        yield reader.line_num, dict(zip(header, values))
+
+
+def insert_objects(model, objs):
+    """
+    Inserts model instances with one parameterized statement executed per row batch, see
+    bulk.RawInsert, and bumps the version of the model.
+    """
+    if not objs:
+        return
+    fields = [field for field in model._meta.concrete_fields if not field.primary_key]
+    bulk.RawInsert(model, fields).execute([[field.pre_save(obj, True) for field in fields] for obj in objs])
+    versions.bump(model)
+
+
+class RecordImporter(ABC):
+    """
+    Validates and writes the rows of one model, a chunk at a time: the rows are checked with the
+    model fields, their reference column is resolved through a lookup map filled with one query per
+    chunk, and the valid rows are inserted together. Rows whose natural key already exists are
+    skipped, so an import can be run again.
+    """
+    model = None
+    # column of the natural key of the rows
+    key_field = None
+    # column naming the parent of a row, resolved in reference_queryset()
+    reference = None
+    # set by prepare(), never read from the rows
+    derived = ()
+
+    def __init__(self, farmer=None):
+        # the farmer the rows belong to, None when importing for every farmer (administrators)
+        self.farmer = farmer
+        self.fields = [field for field in self.model._meta.concrete_fields
+                       if field.editable and not field.primary_key and not field.is_relation
+                       and field.name not in self.derived]
+        self.references = {}
+        self.seen_keys = set()
+        self.cleaned = {field.name: {} for field in self.fields}
+
+    @abstractmethod
+    def reference_queryset(self, keys):
+        # (key, referenced object) pairs of the given reference values
+        pass
+
+    def referenced(self, row):
+        return self.references.get(str(row.get(self.reference) or ''))
+
+    @abstractmethod
+    def set_reference(self, obj, referenced):
+        pass
+
+    def prepare(self, obj):
+        pass
+
+    def written(self, objs):
+        pass
+
+    def build(self, row):
+        values = {}
+        for field in self.fields:
+            raw = row.get(field.name)
+            if raw is None or raw == '':
+                if isinstance(field, models.FileField):
+                    # pictures are uploaded afterwards
+                    values[field.name] = ''
+                elif not (field.has_default() or field.null or field.blank):
+                    return f'{field.name} is required'
+                continue
+            raw = raw if isinstance(raw, str) else str(raw)
+            cleaned = self.cleaned[field.name]
+            if raw not in cleaned:
+                try:
+                    value = field.clean(raw, None)
+                except ValidationError:
+                    value = ValidationError
+                if len(cleaned) >= MAX_CACHED_VALUES:
+                    cleaned.clear()
+                cleaned[raw] = value
+            value = cleaned[raw]
+            if value is ValidationError:
+                return f'invalid {field.name}'
+            values[field.name] = value
+        return self.model(**values)
+
+    def write_chunk(self, chunk, report):
+        rows = [row for line, row in chunk if isinstance(row, dict)]
+        unknown = {str(row.get(self.reference) or '') for row in rows} - self.references.keys()
+        if unknown:
+            self.references.update(dict.fromkeys(unknown))
+            self.references.update(self.reference_queryset(unknown))
+        keys = {str(row.get(self.key_field)) for row in rows if row.get(self.key_field)}
+        existing = set(self.model.objects.filter(**{f'{self.key_field}__in': keys}).values_list(
+            self.key_field, flat=True)) if keys else set()
+
+        objs = []
+        for line, row in chunk:
+            if isinstance(row, str):
+                report.reject(line, row)
+                continue
+            key = str(row.get(self.key_field) or '')
+            if key in existing:
+                report.skipped += 1
+                continue
+            if key and key in self.seen_keys:
+                report.reject(line, f'duplicate {self.key_field}')
+                continue
+            referenced = self.referenced(row)
+            if referenced is None:
+                report.reject(line, f'unknown {self.reference}')
+                continue
+            obj = self.build(row)
+            if isinstance(obj, str):
+                report.reject(line, obj)
+                continue
+            self.set_reference(obj, referenced)
+            self.prepare(obj)
+            if key:
+                self.seen_keys.add(key)
+            objs.append(obj)
+
+        with transaction.atomic():
+            if issubclass(self.model, CodedModel):
+                codes.assign(objs)
+            insert_objects(self.model, objs)
+            self.written(objs)
+        report.accepted += len(objs)
+        report.committed_line = chunk[-1][0]
+
+
+class OliveGroveImporter(RecordImporter):
+    model = OliveGrove
+    key_field = 'name'
+    # email of the farmer, for administrators
+    reference = 'farmer'
+
+    def reference_queryset(self, keys):
+        if self.farmer is not None:
+            return {}
+        return dict(Farmer.objects.filter(email__in=keys).values_list('email', 'id'))
+
+    def referenced(self, row):
+        return self.farmer.id if self.farmer is not None else super().referenced(row)
+
+    def set_reference(self, obj, referenced):
+        obj.farmer_id = referenced
+
+    def prepare(self, obj):
+        # what the set_geohash signal does on save()
+        if obj.latitude is not None and obj.longitude is not None:
+            obj.geohash = geo.encode(obj.latitude, obj.longitude)
+
+
+class HarvestImporter(RecordImporter):
+    model = Harvest
+    key_field = 'harvest_code'
+    # name of the grove
+    reference = 'grove'
+    derived = ('remaining_quantity',)
+
+    def reference_queryset(self, keys):
+        groves = OliveGrove.objects.filter(name__in=keys).only('id', 'name')
+        if self.farmer is not None:
+            groves = groves.filter(farmer_id=self.farmer.id)
+        return {grove.name: grove for grove in groves}
+
+    def set_reference(self, obj, referenced):
+        # the grove name is part of the harvest code
+        obj.grove = referenced
+
+    def prepare(self, obj):
+        obj.remaining_quantity = obj.initial_quantity
+
+
+class OliveSaleOfferImporter(RecordImporter):
+    model = OliveSaleOffer
+    key_field = 'offer_code'
+    # code of the harvest
+    reference = 'harvest'
+    derived = ('available_quantity_for_sell', 'update_date')
+
+    def reference_queryset(self, keys):
+        harvests = Harvest.objects.filter(harvest_code__in=keys)
+        if self.farmer is not None:
+            harvests = harvests.filter(grove__farmer_id=self.farmer.id)
+        return dict(harvests.values_list('harvest_code', 'id'))
+
+    def set_reference(self, obj, referenced):
+        obj.harvest_id = referenced
+
+    def prepare(self, obj):
+        obj.available_quantity_for_sell = obj.initial_quantity_for_sell if obj.offer_status == 'A' else 0
+        obj.update_date = obj.creation_date
+
+    def written(self, objs):
+        # what the post_save signals do for a saved offer: codes are known before the insert, the
+        # primary keys are read back from them
+        offers = OliveSaleOffer.objects.filter(offer_code__in=[obj.offer_code for obj in objs])
+        search.index_olive_offers(offers)
+        pks = list(offers.values_list('id', flat=True))
+        transaction.on_commit(lambda: matching.get_engine().refresh_offers(pks))
+
+
+IMPORTERS = {
+    'olive-groves': OliveGroveImporter,
+    'harvests': HarvestImporter,
+    'olive-sale-offers': OliveSaleOfferImporter,
+}
+
+
+def import_records(importer, rows, chunk_size=CHUNK_SIZE, resume_after=0, on_commit=None):
+    """
+    Imports an iterable of (line number, row) with `importer`, one transaction per chunk of
+    `chunk_size` rows. Lines up to `resume_after` were committed by a previous run and are passed
+    over. `on_commit(report)` is called after each committed chunk. A database failure stops the
+    import: the report tells the error and the line to resume after. Returns an ImportReport.
+    """
+    report = ImportReport(resume_after)
+    chunk = []
+    try:
+        for item in rows:
+            if item[0] <= resume_after:
+                continue
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                importer.write_chunk(chunk, report)
+                chunk = []
+                if on_commit is not None:
+                    on_commit(report)
+        if chunk:
+            importer.write_chunk(chunk, report)
+            if on_commit is not None:
+                on_commit(report)
+    except DatabaseError as error:
+        report.failed = str(error)
+    return report
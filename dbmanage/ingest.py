@@ -0,0 +1,185 @@
+import csv
+import json
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from dbmanage import bulk, rollups, series
+from dbmanage.models import IoTSensor, SensorMeasurement
+
+FIELDS = ('sensor_id', 'parameter', 'value', 'date')
+CHUNK_SIZE = 5000
+MAX_REPORTED_REJECTS = 1000
+
+_value_field = SensorMeasurement._meta.get_field('value')
+_parameter_max_length = SensorMeasurement._meta.get_field('parameter').max_length
+# DecimalField(max_digits, decimal_places): largest accepted absolute value
+_value_limit = Decimal(10) ** (_value_field.max_digits - _value_field.decimal_places)
+_value_quantum = Decimal(1).scaleb(-_value_field.decimal_places)
+
+
+class IngestReport:
+    def __init__(self):
+        self.accepted = 0
+        self.rejected_count = 0
+        self.rejected = []
+
+    def reject(self, line, error):
+        self.rejected_count += 1
+        if len(self.rejected) < MAX_REPORTED_REJECTS:
+            self.rejected.append({'line': line, 'error': error})
+
+    def as_dict(self):
+        return {'accepted': self.accepted, 'rejected_count': self.rejected_count, 'rejected': self.rejected}
+
+
+def iter_ndjson(lines):
+    """
+    Yields (line number, row dict or error message) for an NDJSON stream, one measurement per line.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, 'invalid JSON'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'expected a JSON object'
+
+
+def iter_csv(lines):
+    """
+    Yields (line number, row dict or error message) for a compact CSV stream:
+    sensor_id,parameter,value,date with an optional header line.
+    """
+    for line_number, values in enumerate(csv.reader(lines), start=1):
+        if not values:
+            continue
+        if line_number == 1 and values[0].strip() == 'sensor_id':
+            continue
+        if len(values) != len(FIELDS):
+            yield line_number, f'expected {len(FIELDS)} columns ({",".join(FIELDS)})'
+            continue
+        yield line_number, dict(zip(FIELDS, values))
+
+
+def _parse_value(raw):
+    try:
+        value = Decimal(str(raw))
+    except (InvalidOperation, ValueError):
+        return None
+    if not value.is_finite() or abs(value) >= _value_limit:
+        return None
+    return value.quantize(_value_quantum)
+
+
+def _parse_timestamp(raw):
+    """
+    Returns the aware timestamp of an ISO date or timestamp, naive timestamps are UTC. A bare date
+    is midnight UTC.
+    """
+    if isinstance(raw, str):
+        raw = raw.strip()
+        try:
+            timestamp = datetime.fromisoformat(raw.replace('Z', '+00:00'))
+        except ValueError:
+            try:
+                return rollups.measurement_time(date.fromisoformat(raw))
+            except ValueError:
+                return None
+        if timestamp.tzinfo is None:
+            return timestamp.replace(tzinfo=dt_timezone.utc)
+        return timestamp.astimezone(dt_timezone.utc)
+    return None
+
+
+def validate_chunk(chunk, sensors, report):
+    """
+    Validates a chunk of (line number, row) column by column and returns the valid rows as
+    (parameter, value, date, sensor pk, timestamp) tuples. `sensors` maps sensor_id to the IoTSensor primary key.
+    """
+    lines = [line for line, row in chunk]
+    rows = [row for line, row in chunk]
+    errors = [row if isinstance(row, str) else None for row in rows]
+    rows = [row if isinstance(row, dict) else {} for row in rows]
+
+    sensor_ids = [sensors.get(str(row.get('sensor_id', ''))) for row in rows]
+    parameters = [str(row.get('parameter') or '').strip() for row in rows]
+    values = [_parse_value(row.get('value')) for row in rows]
+    timestamps = [_parse_timestamp(row.get('date')) for row in rows]
+
+    measurements = []
+    for index, line in enumerate(lines):
+        error = errors[index]
+        if error is None:
+            if sensor_ids[index] is None:
+                error = 'unknown sensor'
+            elif not parameters[index] or len(parameters[index]) > _parameter_max_length:
+                error = 'invalid parameter'
+            elif values[index] is None:
+                error = 'invalid value'
+            elif timestamps[index] is None:
+                error = 'invalid date'
+        if error is not None:
+            report.reject(line, error)
+            continue
+        timestamp = timestamps[index]
+        measurements.append((parameters[index], values[index], timestamp.date(), sensor_ids[index], timestamp))
+    return measurements
+
+
+def insert_measurements(measurements):
+    """
+    Inserts validated (parameter, value, date, sensor pk, timestamp) tuples with one parameterized statement
+    executed per row batch, see bulk.RawInsert: building a model instance and compiling every value
+    would dominate the cost at this volume.
+    """
+    bulk.RawInsert(SensorMeasurement, ('parameter', 'value', 'date', 'sensor', 'measured_at')).execute(measurements)
+
+
+def ingest_measurements(rows, sensor_queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Validates and writes an iterable of (line number, row) in chunks of `chunk_size`, all inside one
+    transaction. Only sensors of `sensor_queryset` are accepted. Returns an IngestReport.
+    """
+    if sensor_queryset is None:
+        sensor_queryset = IoTSensor.objects.all()
+    report = IngestReport()
+    sensors, chunked = {}, set()
+    with transaction.atomic():
+        chunk = []
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                _write_chunk(chunk, sensor_queryset, sensors, chunked, report)
+                chunk = []
+        if chunk:
+            _write_chunk(chunk, sensor_queryset, sensors, chunked, report)
+    return report
+
+
+def _write_chunk(chunk, sensor_queryset, sensors, chunked, report):
+    # resolve the sensor ids of the chunk that were not seen yet, in one query
+    unknown = {str(row.get('sensor_id', '')) for line, row in chunk if isinstance(row, dict)} - sensors.keys()
+    if unknown:
+        sensors.update(dict.fromkeys(unknown))
+        for sensor_id, pk, storage in sensor_queryset.filter(sensor_id__in=unknown).values_list(
+                'sensor_id', 'id', 'series_storage'):
+            sensors[sensor_id] = pk
+            if storage == IoTSensor.CHUNKED:
+                chunked.add(pk)
+    measurements = validate_chunk(chunk, sensors, report)
+    if chunked:
+        series.append_readings([(sensor_pk, parameter, value, timestamp)
+                                for parameter, value, day, sensor_pk, timestamp in measurements
+                                if sensor_pk in chunked])
+        insert_measurements([measurement for measurement in measurements if measurement[3] not in chunked])
+    else:
+        insert_measurements(measurements)
+    # hourly and daily rollups are kept current in the same transaction
+    rollups.apply_measurements([(sensor_pk, parameter, value, timestamp)
+                                for parameter, value, day, sensor_pk, timestamp in measurements])
+    report.accepted += len(measurements)
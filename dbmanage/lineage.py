@@ -0,0 +1,131 @@
+from django.db import connection
+from django.db.models import F, Sum
+from rest_framework.exceptions import ValidationError
+
+from dbmanage.models import OilProduct, OilProductLineage
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, name):
+    return connection.ops.quote_name(model._meta.get_field(name).column)
+
+
+def _subtree(pk):
+    return OilProductLineage.objects.filter(ancestor_id=pk).values('descendant_id')
+
+
+def attach(pk, parent_pk=None):
+    """
+    Adds a new product to the closure table: its own row and one row per ancestor of its mother
+    product, in one statement.
+    """
+    table = _table(OilProductLineage)
+    ancestor, descendant, depth = (_column(OilProductLineage, name) for name in ('ancestor', 'descendant', 'depth'))
+    sql = f"INSERT INTO {table} ({ancestor}, {descendant}, {depth}) SELECT %s, %s, 0"
+    params = [pk, pk]
+    if parent_pk is not None:
+        sql += f" UNION ALL SELECT {ancestor}, %s, {depth} + 1 FROM {table} WHERE {descendant} = %s"
+        params += [pk, parent_pk]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def detach(pk):
+    """
+    Cuts the subtree of a product from the ancestors of the product, which becomes a root.
+    """
+    OilProductLineage.objects.filter(descendant_id__in=_subtree(pk)).exclude(ancestor_id__in=_subtree(pk)).delete()
+
+
+def move(pk, parent_pk):
+    """
+    Re-parents a product with its whole subtree: the links to its former ancestors are removed and
+    every (ancestor of the new mother, member of the subtree) pair is added.
+    """
+    detach(pk)
+    if parent_pk is None:
+        return
+    table = _table(OilProductLineage)
+    ancestor, descendant, depth = (_column(OilProductLineage, name) for name in ('ancestor', 'descendant', 'depth'))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} ({ancestor}, {descendant}, {depth}) "
+            f"SELECT a.{ancestor}, d.{descendant}, a.{depth} + d.{depth} + 1 FROM {table} a, {table} d "
+            f"WHERE a.{descendant} = %s AND d.{ancestor} = %s",
+            [parent_pk, pk],
+        )
+
+
+def check_parent(pk, parent_pk):
+    # a product cannot be split from itself or from one of its own descendants
+    if pk is not None and parent_pk is not None and _subtree(pk).filter(descendant_id=parent_pk).exists():
+        raise ValidationError('An oil product cannot descend from itself.')
+
+
+def ancestors(pk):
+    """
+    The ancestors of a product, root first, annotated with their distance `depth` to it.
+    """
+    return OilProduct.objects.filter(descendant_links__descendant_id=pk, descendant_links__depth__gt=0).annotate(
+        depth=F('descendant_links__depth')).order_by('-depth')
+
+
+def descendants(pk):
+    """
+    The descendants of a product, nearest first, annotated with their distance `depth` to it.
+    """
+    return OilProduct.objects.filter(ancestor_links__ancestor_id=pk, ancestor_links__depth__gt=0).annotate(
+        depth=F('ancestor_links__depth')).order_by('depth', 'id')
+
+
+def root_id(pk):
+    """
+    The pk of the product the lineage of `pk` starts from (usually an extraction), `pk` for a root.
+    """
+    return OilProductLineage.objects.filter(descendant_id=pk).order_by('-depth').values_list(
+        'ancestor_id', flat=True).first()
+
+
+def subtree_quantities(pks):
+    """
+    Remaining quantity of the subtree of each product, the product included, per quantity unit:
+    {pk: {'kg': 120.0, 'l': 30.0}}.
+    """
+    quantities = {pk: {} for pk in pks}
+    rows = OilProductLineage.objects.filter(ancestor_id__in=pks).values(
+        'ancestor_id', 'descendant__quantity_unit').annotate(total=Sum('descendant__remaining_quantity'))
+    for row in rows:
+        quantities[row['ancestor_id']][row['descendant__quantity_unit']] = row['total']
+    return quantities
+
+
+def rebuild(product_model=OilProduct, lineage_model=OilProductLineage):
+    """
+    Recomputes the closure table from mother_product, one INSERT ... SELECT per tree level (after a
+    queryset update() of mother_product, which sends no signal). Returns the number of rows.
+    """
+    table, products = _table(lineage_model), _table(product_model)
+    ancestor, descendant, depth = (_column(lineage_model, name) for name in ('ancestor', 'descendant', 'depth'))
+    product_id, mother = _column(product_model, 'id'), _column(product_model, 'mother_product')
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} ({ancestor}, {descendant}, {depth}) "
+                       f"SELECT {product_id}, {product_id}, 0 FROM {products}")
+        total = count = level_rows = cursor.rowcount
+        level = 0
+        while level_rows > 0:
+            if level >= count:
+                raise ValueError('The mother_product links of the oil products contain a cycle.')
+            cursor.execute(
+                f"INSERT INTO {table} ({ancestor}, {descendant}, {depth}) "
+                f"SELECT l.{ancestor}, p.{product_id}, l.{depth} + 1 FROM {table} l "
+                f"JOIN {products} p ON p.{mother} = l.{descendant} WHERE l.{depth} = %s",
+                [level],
+            )
+            level_rows = cursor.rowcount
+            total += level_rows
+            level += 1
+    return total
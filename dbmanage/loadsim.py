@@ -0,0 +1,329 @@
+import http.client
+import json
+import random
+import threading
+import time
+from bisect import bisect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate
+from urllib.parse import urlencode, urlsplit
+
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Abs, Coalesce
+
+from dbmanage.models import OlivePurchaseRequest, OliveSaleOffer, PurchasedOlive
+from dbmanage.perf import PERCENTILES, percentile
+from dbmanage.purchases import QUANTITY_TOLERANCE
+
+ROLES = ('farmer', 'mill', 'consumer')
+DEFAULT_MIX = {'farmer': 2, 'mill': 3, 'consumer': 5}
+# offer ids per invariant query
+CHECK_CHUNK_SIZE = 500
+
+
+class Client:
+    """
+    JSON over HTTP to the server under test, one keep-alive connection per thread.
+    request() returns (status, parsed body, or the raw bytes when it is not JSON); status 0 when the
+    connection failed.
+    """
+
+    def __init__(self, base_url, timeout=30):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.host, self.port = parts.hostname, parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, data=None, token=None):
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request(method, self.prefix + path, body, headers)
+            response = connection.getresponse()
+            content = response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            return 0, b''
+        try:
+            return response.status, json.loads(content)
+        except ValueError:
+            return response.status, content
+
+
+def outcome(status, body):
+    """
+    The class of a response: 'ok', 'conflict' (409, the stock was taken by a concurrent purchase),
+    'locked' (a 5xx for a database lock held too long, or a 503 of a saturated server), 'rejected'
+    (other 4xx) or 'error' (other 5xx, or no response).
+    """
+    if 200 <= status < 300:
+        return 'ok'
+    if status == 409:
+        return 'conflict'
+    if status == 503 or (status >= 500 and b'database is locked' in (body if isinstance(body, bytes) else b'')):
+        return 'locked'
+    if 400 <= status < 500:
+        return 'rejected'
+    return 'error'
+
+
+class Recorder:
+    """
+    Latencies and outcomes of the requests, by operation.
+    """
+    outcomes = ('ok', 'conflict', 'locked', 'rejected', 'error')
+
+    def __init__(self):
+        self._latencies = {}
+        self._outcomes = {}
+        self._lags = []
+        self._lock = threading.Lock()
+
+    def add(self, operation, status, body, elapsed):
+        kind = outcome(status, body)
+        with self._lock:
+            self._latencies.setdefault(operation, []).append(elapsed * 1000)
+            counts = self._outcomes.setdefault(operation, dict.fromkeys(self.outcomes, 0))
+            counts[kind] += 1
+        return kind
+
+    def add_lag(self, lag):
+        # how late a step started after its arrival, a saturated client shows here first
+        with self._lock:
+            self._lags.append(lag * 1000)
+
+    def summary(self, duration):
+        with self._lock:
+            latencies = {operation: sorted(values) for operation, values in self._latencies.items()}
+            outcomes = {operation: dict(counts) for operation, counts in self._outcomes.items()}
+            lags = sorted(self._lags)
+        operations = {}
+        for operation, ordered in sorted(latencies.items()):
+            entry = {'requests': len(ordered), **outcomes[operation]}
+            entry.update({f'p{rank}_ms': round(percentile(ordered, rank), 1) for rank in PERCENTILES})
+            operations[operation] = entry
+        total = sum(entry['requests'] for entry in operations.values())
+        rates = {kind: round(sum(entry[kind] for entry in operations.values()) / total, 4) if total else 0.0
+                 for kind in self.outcomes if kind != 'ok'}
+        return {
+            'duration_s': round(duration, 2),
+            'requests': total,
+            'throughput_rps': round(total / duration, 1) if duration else 0.0,
+            'rates': rates,
+            'start_lag_ms': {f'p{rank}': round(percentile(lags, rank), 1) for rank in PERCENTILES} if lags else {},
+            'operations': operations,
+        }
+
+
+class Actor:
+    __slots__ = ('id', 'role', 'email', 'harvests', 'token', 'lock')
+
+    def __init__(self, user_id, role, email, harvests=()):
+        self.id = user_id
+        self.role = role
+        self.email = email
+        self.harvests = list(harvests)
+        self.token = None
+        self.lock = threading.Lock()
+
+
+class Simulation:
+    """
+    The olive marketplace season played against a server through its API, by farmer, mill and
+    consumer actors:
+
+    - a farmer approves the oldest purchase request sent to it, or publishes a sale offer on one of
+      its harvests when it has none;
+    - a mill confirms the oldest of its approved requests, or browses the available offers and sends
+      a purchase request for one of them;
+    - a consumer searches and browses the offers and the oil products.
+
+    Each arrival is one step of an actor, the requests between actors (what the notifications tell
+    them) are passed in memory. Arrivals follow a Poisson process of `rate` per second, shared by the
+    roles according to `mix`, and run on `concurrency` threads: the arrivals are open loop, a slow
+    server makes steps start late instead of slowing the arrivals down.
+    """
+
+    def __init__(self, client, actors, password, mix=None, seed=0):
+        self.client = client
+        self.password = password
+        self.actors = {role: list(actors.get(role, ())) for role in ROLES}
+        mix = {role: weight for role, weight in (mix or DEFAULT_MIX).items() if weight > 0 and self.actors.get(role)}
+        if not mix:
+            raise ValueError('No actor to simulate: every role of the mix has no weight or no actor.')
+        self.roles, self.cumulative = tuple(mix), tuple(accumulate(mix.values()))
+        self.rng = random.Random(seed)
+        self.recorder = Recorder()
+        self.by_id = {actor.id: actor for actors in self.actors.values() for actor in actors}
+        # request ids waiting for the farmer (by farmer id), approved ones waiting for the mill (by manager id)
+        self.pending = {}
+        self.approved = {}
+        self.requesters = {}
+        # offers published or requested during the run, for check_inventory()
+        self.offers = set()
+        self._lock = threading.Lock()
+
+    def call(self, operation, actor, method, path, data=None):
+        token = self.token(actor)
+        if token is None:
+            return 0, None
+        started = time.perf_counter()
+        status, body = self.client.request(method, path, data, token)
+        if status == 401:
+            # expired access token
+            with actor.lock:
+                actor.token = None
+            token = self.token(actor)
+            started = time.perf_counter()
+            status, body = self.client.request(method, path, data, token)
+        self.recorder.add(operation, status, body, time.perf_counter() - started)
+        return status, body
+
+    def token(self, actor):
+        with actor.lock:
+            if actor.token is None:
+                started = time.perf_counter()
+                status, body = self.client.request('POST', '/login/', {'email': actor.email,
+                                                                       'password': self.password})
+                self.recorder.add('login', status, body, time.perf_counter() - started)
+                if status == 200:
+                    actor.token = body['access']
+            return actor.token
+
+    def push(self, mailbox, key, value):
+        with self._lock:
+            mailbox.setdefault(key, deque()).append(value)
+
+    def pop(self, mailbox, key):
+        with self._lock:
+            queue = mailbox.get(key)
+            return queue.popleft() if queue else None
+
+    def farmer_step(self, actor, rng):
+        request_id = self.pop(self.pending, actor.id)
+        if request_id is not None:
+            status, body = self.call('approve_request', actor, 'POST', f'/approve-olive-purchase-request/{request_id}/')
+            if status == 200:
+                with self._lock:
+                    mill_manager_id = self.requesters.pop(request_id)
+                self.push(self.approved, mill_manager_id, request_id)
+            return
+        if not actor.harvests:
+            return
+        status, body = self.call('publish_offer', actor, 'POST', '/olive-sale-offers/create/', {
+            'harvest': rng.choice(actor.harvests),
+            'initial_quantity_for_sell': round(rng.uniform(1, 20), 2),
+            'offer_price': f'{max(rng.gauss(2.6, 0.4), 0.5):.2f}',
+            'price_unit': 'TND',
+            'availability_date': time.strftime('%Y-%m-%d'),
+            'transportation': rng.choice(('D', 'R')),
+        })
+        if status == 201:
+            with self._lock:
+                self.offers.add(body['id'])
+
+    def mill_step(self, actor, rng):
+        request_id = self.pop(self.approved, actor.id)
+        if request_id is not None:
+            self.call('confirm_purchase', actor, 'POST', f'/confirm-olive-purchase/{request_id}/')
+            return
+        query = {'offer_status': 'A', 'page_size': 20,
+                 'sort_by': rng.choice(('price_asc', 'quantity_desc'))}
+        status, body = self.call('browse_offers', actor, 'GET', f'/olive-sale-offers/?{urlencode(query)}')
+        if status != 200:
+            return
+        # offers of the simulated farmers, someone has to answer the request
+        offers = [offer for offer in body['results']
+                  if offer['harvest']['grove']['farmer']['id'] in self.by_id and offer['available_quantity_for_sell'] > 0]
+        if not offers:
+            return
+        offer = rng.choice(offers)
+        quantity = min(offer['available_quantity_for_sell'], round(rng.uniform(0.5, 5), 2))
+        status, body = self.call('request_olives', actor, 'POST', '/olive-purchase-request/create/', {
+            'olive_sale_offer': offer['id'],
+            'requested_quantity': quantity,
+            'requested_price': offer['offer_price'],
+            'price_unit': offer['price_unit'],
+        })
+        if status == 201:
+            with self._lock:
+                self.offers.add(offer['id'])
+                self.requesters[body['id']] = actor.id
+            self.push(self.pending, offer['harvest']['grove']['farmer']['id'], body['id'])
+
+    def consumer_step(self, actor, rng):
+        action = rng.random()
+        if action < 0.4:
+            query = {'q': rng.choice(('chemlali', 'chetoui', 'sfax', 'organic', 'extra virgin')), 'limit': 20}
+            self.call('search', actor, 'GET', f'/search/?{urlencode(query)}')
+        elif action < 0.7:
+            query = {'offer_status': 'A', 'page_size': 20, 'sort_by': rng.choice(('price_asc', 'price_desc'))}
+            self.call('browse_offers', actor, 'GET', f'/olive-sale-offers/?{urlencode(query)}')
+        else:
+            self.call('list_oil_products', actor, 'GET', '/oil-products/?page_size=20')
+
+    def step(self, role, actor, rng, arrival=None):
+        if arrival is not None:
+            self.recorder.add_lag(time.perf_counter() - arrival)
+        getattr(self, f'{role}_step')(actor, rng)
+
+    def run(self, duration, rate, concurrency):
+        """
+        Plays arrivals for `duration` seconds and waits for the steps started. Returns the summary of
+        the recorder.
+        """
+        started = time.perf_counter()
+        arrival = started
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='simulated-actor') as executor:
+            while True:
+                arrival += self.rng.expovariate(rate)
+                if arrival - started >= duration:
+                    break
+                role = self.roles[bisect(self.cumulative, self.rng.random() * self.cumulative[-1])]
+                actor = self.rng.choice(self.actors[role])
+                rng = random.Random(self.rng.getrandbits(64))
+                delay = arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.step, role, actor, rng, arrival)
+        return self.recorder.summary(time.perf_counter() - started)
+
+
+def check_inventory(offer_ids):
+    """
+    Counts the olive sale offers of `offer_ids` breaking an inventory invariant: more purchased than
+    offered, a negative available quantity, or an available quantity other than what is left after
+    the purchases. Also counts, among their requests, the bought ones without purchased olives and the
+    purchased olives of requests not bought. A consistent marketplace gives only zeros.
+    """
+    offer_ids = sorted(offer_ids)
+    violations = dict.fromkeys(('oversold', 'negative_available', 'unbalanced', 'bought_without_olives',
+                                'olives_without_purchase'), 0)
+    for start in range(0, len(offer_ids), CHECK_CHUNK_SIZE):
+        chunk = offer_ids[start:start + CHECK_CHUNK_SIZE]
+        offers = OliveSaleOffer.objects.filter(pk__in=chunk).annotate(
+            purchased=Coalesce(Sum('olive_purchase_requests__purchasedolive__olive_quantity'), Value(0.0)))
+        violations['oversold'] += offers.filter(
+            purchased__gt=F('initial_quantity_for_sell') + QUANTITY_TOLERANCE).count()
+        violations['negative_available'] += offers.filter(available_quantity_for_sell__lt=-QUANTITY_TOLERANCE).count()
+        violations['unbalanced'] += offers.annotate(
+            gap=Abs(F('initial_quantity_for_sell') - F('purchased') - F('available_quantity_for_sell')),
+        ).filter(gap__gt=1e-6).count()
+        violations['bought_without_olives'] += OlivePurchaseRequest.objects.filter(
+            olive_sale_offer__in=chunk, request_status='B', purchasedolive__isnull=True).count()
+        violations['olives_without_purchase'] += PurchasedOlive.objects.filter(
+            olive_purchase_request__olive_sale_offer__in=chunk).exclude(
+            olive_purchase_request__request_status='B').count()
+    return violations
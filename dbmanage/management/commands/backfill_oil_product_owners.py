@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dbmanage import ownership
+
+
+class Command(BaseCommand):
+    help = "Stores the resolved owner (user and mill) of every oil product, from its extraction or its mother " \
+           "product. Bought products without a resolvable origin keep their owner."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = ownership.backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Resolved the owner of {changed} oil products.'))
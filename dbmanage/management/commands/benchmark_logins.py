@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory
+
+from dbmanage import passwords
+from dbmanage.models import User
+from dbmanage.views import login
+
+
+class Command(BaseCommand):
+    help = "Sends concurrent requests to the login view and reports the logins per second, per core used " \
+           "for hashing. Creates its own users, deleted at the end (--keep to leave them)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32, help='Logins in flight at once.')
+        parser.add_argument('--legacy-hashes', action='store_true',
+                            help='Store SHA1 hashes, so that each first login upgrades its hash.')
+        parser.add_argument('--keep', action='store_true')
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        password = f'bench-{tag}'
+        # a single hash for every user: hashing them one by one would take longer than the benchmark
+        encoded = make_password(password, hasher='sha1' if options['legacy_hashes'] else 'default')
+        emails = [f'bench-login-{tag}-{index}@example.com' for index in range(max(options['users'], 1))]
+        User.objects.bulk_create([User(email=email, role='farmer', password=encoded) for email in emails])
+        try:
+            started = time.perf_counter()
+            statuses = async_to_sync(self.run)(emails, password, options['logins'], max(options['concurrency'], 1))
+            elapsed = time.perf_counter() - started
+        finally:
+            if not options['keep']:
+                User.objects.filter(email__startswith=f'bench-login-{tag}-').delete()
+
+        settings = passwords.get_settings()
+        cores = min(settings['WORKERS'], os.cpu_count() or 1)
+        succeeded = statuses.count(200)
+        self.stdout.write(f'{options["logins"]} logins, {options["concurrency"]} at once, in {elapsed:.2f}s; '
+                          f'{settings["ITERATIONS"]} PBKDF2 iterations, {settings["WORKERS"]} hashing threads')
+        self.stdout.write(f'succeeded {succeeded}, refused (503) {statuses.count(503)}, '
+                          f'other {len(statuses) - succeeded - statuses.count(503)}')
+        self.stdout.write(self.style.SUCCESS(f'{succeeded / elapsed:.1f} logins/s, '
+                                             f'{succeeded / elapsed / cores:.1f} logins/s per core'))
+
+    async def run(self, emails, password, logins, concurrency):
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def attempt(index):
+            async with semaphore:
+                request = factory.post('/login/', json.dumps({'email': emails[index % len(emails)],
+                                                              'password': password}),
+                                       content_type='application/json')
+                return (await login(request)).status_code
+
+        return await asyncio.gather(*(attempt(index) for index in range(logins)))
@@ -0,0 +1,118 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from dbmanage import codes, dispatcher, purchases
+from dbmanage.models import (Farmer, Harvest, MillManager, OilMill, OlivePurchaseRequest, OliveGrove, OliveSaleOffer,
+                             PurchasedOlive)
+
+
+class Command(BaseCommand):
+    help = "Confirms many approved purchase requests of a single olive sale offer from parallel workers, " \
+           "reports the confirmations per second and checks that the offer was not oversold. Creates its " \
+           "own data, deleted at the end (--keep to leave it). Use a database file, not an in-memory one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=400, help='Approved purchase requests to confirm.')
+        parser.add_argument('--offer-quantity', type=float, default=250.0)
+        parser.add_argument('--request-quantity', type=float, default=1.0)
+        parser.add_argument('--keep', action='store_true')
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        tag = uuid.uuid4().hex[:8]
+        offer, mills, request_ids = self.create_data(tag, workers, options)
+        shares = [request_ids[index::workers] for index in range(workers)]
+        managers = [mill.mill_manager_id for mill in mills]
+        try:
+            started = time.perf_counter()
+            if workers == 1:
+                results = [self.confirm(shares[0], managers[0])]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(self.confirm_and_close, shares, managers))
+            elapsed = time.perf_counter() - started
+
+            confirmed = sum(result[0] for result in results)
+            refused = sum(result[1] for result in results)
+            errors = sum(result[2] for result in results)
+            offer.refresh_from_db()
+            purchased = PurchasedOlive.objects.filter(
+                olive_purchase_request__olive_sale_offer=offer).aggregate(total=Sum('olive_quantity'))['total'] or 0
+            self.stdout.write(f'{workers} workers, {len(request_ids)} requests in {elapsed:.2f}s: '
+                              f'{confirmed / elapsed:.0f} confirmations/s')
+            self.stdout.write(f'confirmed {confirmed}, refused (sold out) {refused}, errors {errors}')
+            self.stdout.write(f'offer: {options["offer_quantity"]} initially, {purchased} purchased, '
+                              f'{offer.available_quantity_for_sell} left, status {offer.offer_status}')
+
+            oversold = purchased - options['offer_quantity'] > purchases.QUANTITY_TOLERANCE
+            inconsistent = abs(options['offer_quantity'] - purchased - offer.available_quantity_for_sell) > 1e-6
+            if oversold or inconsistent or offer.available_quantity_for_sell < 0:
+                raise CommandError('The offer was oversold or its quantity is inconsistent.')
+            self.stdout.write(self.style.SUCCESS('No oversell.'))
+        finally:
+            if dispatcher.get_settings()['MODE'] != 'sync':
+                dispatcher.get_dispatcher().flush()
+            if not options['keep']:
+                Farmer.objects.filter(email=f'bench-farmer-{tag}@example.com').delete()
+                MillManager.objects.filter(email__startswith=f'bench-{tag}-').delete()
+
+    def create_data(self, tag, workers, options):
+        farmer = Farmer.objects.create(email=f'bench-farmer-{tag}@example.com', role='farmer')
+        grove = OliveGrove.objects.create(
+            farmer=farmer, name=f'bench-{tag}', address='Sfax', trees_age=20, area=3.5, density=120,
+            olives_variety='Chemlali', soil_type='SN', fertilizers_used='none', cropping_system='R', practice='O',
+            grove_picture='images/grove.png')
+        today = date.today()
+        harvest = Harvest.objects.create(
+            grove=grove, harvest_date=today, harvest_method='Mn', initial_quantity=options['offer_quantity'],
+            remaining_quantity=options['offer_quantity'], maturity_index='G', characterization='Mono',
+            containers='Bg', harvest_picture='images/harvest.png')
+        offer = OliveSaleOffer.objects.create(
+            harvest=harvest, initial_quantity_for_sell=options['offer_quantity'],
+            available_quantity_for_sell=options['offer_quantity'], offer_price=2.5, availability_date=today,
+            transportation='D', creation_date=today, update_date=today, offer_status='A')
+        mills = []
+        for index in range(workers):
+            manager = MillManager.objects.create(email=f'bench-{tag}-{index}@example.com', role='mill manager')
+            mills.append(OilMill.objects.create(
+                mill_manager=manager, name=f'bench-{tag}-{index}', address='Sfax', country='Tunisia', fax='0',
+                website='https://example.com', creation_date=today, milling_capacity=10,
+                transformation_capacity_unit='t', chains_number=1, storage_capacity=10, storage_capacity_unit='t',
+                practice='C', quality_certificate='', agreement_date=today))
+        # requests are dealt to the workers round robin, request i belongs to the mill of worker i % workers
+        OlivePurchaseRequest.objects.bulk_create(codes.assign([
+            OlivePurchaseRequest(
+                olive_sale_offer=offer, mill=mills[index % workers], requested_quantity=options['request_quantity'],
+                requested_price=2.5, request_date=today, buyer_appreciation=0, buyer_feedback='',
+                request_status='A', status_update_date=today)
+            for index in range(options['requests'])
+        ]))
+        request_ids = list(OlivePurchaseRequest.objects.filter(olive_sale_offer=offer).order_by('id')
+                           .values_list('id', flat=True))
+        return offer, mills, request_ids
+
+    def confirm(self, request_ids, mill_manager_id):
+        confirmed = refused = errors = 0
+        for request_id in request_ids:
+            try:
+                purchases.confirm_olive_purchases([request_id], mill_manager_id=mill_manager_id)
+                confirmed += 1
+            except purchases.PurchaseConfirmationError:
+                refused += 1
+            except OperationalError:
+                # e.g. SQLite "database is locked" after the busy timeout
+                errors += 1
+        return confirmed, refused, errors
+
+    def confirm_and_close(self, request_ids, mill_manager_id):
+        try:
+            return self.confirm(request_ids, mill_manager_id)
+        finally:
+            connection.close()
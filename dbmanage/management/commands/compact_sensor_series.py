@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dbmanage import series
+from dbmanage.models import IoTSensor
+
+
+class Command(BaseCommand):
+    help = "Moves the readings of sensors from SensorMeasurement rows to compressed daily chunks and " \
+           "switches them to chunked storage."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sensor_ids', nargs='*', help='sensor_id of the sensors to compact.')
+        parser.add_argument('--all', action='store_true', help='Compact every sensor still stored as rows.')
+
+    def handle(self, *args, **options):
+        sensors = IoTSensor.objects.filter(series_storage=IoTSensor.ROWS)
+        if options['sensor_ids']:
+            sensors = sensors.filter(sensor_id__in=options['sensor_ids'])
+        elif not options['all']:
+            raise CommandError('Give sensor ids or --all.')
+        for sensor in sensors.order_by('id'):
+            with transaction.atomic():
+                moved = series.compact_sensor(sensor)
+            self.stdout.write(f'{sensor.sensor_id}: {moved} readings compacted')
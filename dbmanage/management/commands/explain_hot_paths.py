@@ -0,0 +1,79 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from dbmanage.models import Harvest, Notification, OlivePurchaseRequest, OliveSaleOffer
+
+# (name, endpoint, typical filter of the endpoint, index expected in the plan)
+HOT_PATHS = [
+    (
+        'available offers by price',
+        'olive-sale-offers/?offer_status=A&sort_by=price_asc',
+        lambda: OliveSaleOffer.objects.available().order_by('offer_price', 'id'),
+        'olive_offer_available_idx',
+    ),
+    (
+        'offers by status, transportation and price',
+        'olive-sale-offers/?offer_status=Cl&transportation=D&price_min=1&price_max=5',
+        lambda: OliveSaleOffer.objects.filter(offer_status='Cl', transportation='D',
+                                              offer_price__range=[1, 5]),
+        'olive_offer_status_idx',
+    ),
+    (
+        'purchase requests of a mill by status',
+        'olive-purchase-requests/',
+        lambda: OlivePurchaseRequest.objects.filter(mill_id=1, request_status='P'),
+        'olive_request_mill_status_idx',
+    ),
+    (
+        'unread notifications of a user',
+        'notifications/',
+        lambda: Notification.objects.filter(user_id=1, is_read=False).order_by('-created_at'),
+        'notification_user_unread_idx',
+    ),
+    (
+        'unread notifications of a mill',
+        'notifications/',
+        lambda: Notification.objects.filter(oil_mill_id=1, is_read=False).order_by('-created_at'),
+        'notification_mill_unread_idx',
+    ),
+    (
+        'harvests of a grove in a season',
+        'harvests/?year=2023',
+        lambda: Harvest.objects.filter(grove_id=1, harvest_date__range=[date(2023, 1, 1), date(2023, 12, 31)]),
+        'harvest_grove_date_idx',
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = "Replays the typical filter of each hot endpoint against the query planner and checks that " \
+           "the expected index is used. Plans depend on table statistics: run it on a populated database " \
+           "with --analyze."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true',
+                            help='Refresh the planner statistics (ANALYZE) before explaining.')
+        parser.add_argument('--strict', action='store_true',
+                            help='Fail when a hot path does not use its index.')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full plan of every query.')
+
+    def handle(self, *args, **options):
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        missing = []
+        for name, endpoint, build_queryset, index_name in HOT_PATHS:
+            plan = build_queryset().explain()
+            if index_name in plan:
+                self.stdout.write(self.style.SUCCESS(f'OK    {name} [{endpoint}] uses {index_name}'))
+            else:
+                missing.append(name)
+                self.stdout.write(self.style.WARNING(f'MISS  {name} [{endpoint}] does not use {index_name}'))
+            if options['verbose_plans'] or index_name not in plan:
+                for line in plan.splitlines():
+                    self.stdout.write(f'        {line}')
+        if missing and options['strict']:
+            raise CommandError(f"{len(missing)} hot path(s) without index: {', '.join(missing)}")
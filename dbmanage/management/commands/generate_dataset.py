@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dbmanage import search, synthetic
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic dataset for load and query plan tests: farmers with their groves, harvests, " \
+           "olive and oil trade, extractions and oil products, about 70 rows per farmer. The same --seed gives the " \
+           "same dataset on an empty database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--farmers', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--first-season', type=int, default=2021)
+        parser.add_argument('--seasons', type=int, default=3)
+        parser.add_argument('--chunk-size', type=int, default=synthetic.CHUNK_SIZE,
+                            help='Rows buffered before they are written.')
+        parser.add_argument('--password', help='Password of every generated user; by default they cannot log in.')
+        parser.add_argument('--index', action='store_true',
+                            help='Rebuild the offer search index afterwards (slow for large datasets).')
+
+    def handle(self, *args, **options):
+        if options['farmers'] < 1 or options['seasons'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--farmers, --seasons and --chunk-size must be positive.')
+        generator = synthetic.DatasetGenerator(
+            options['farmers'], seed=options['seed'], first_season=options['first_season'],
+            seasons=options['seasons'], chunk_size=options['chunk_size'], password=options['password'])
+        started = time.perf_counter()
+        with transaction.atomic():
+            counts = generator.run()
+        elapsed = time.perf_counter() - started
+        for table, count in counts.items():
+            self.stdout.write(f'{table}: {count}')
+        total = sum(counts.values())
+        if options['index'] and search.is_available():
+            self.stdout.write(f'Indexed {search.rebuild()} offers.')
+        self.stdout.write(self.style.SUCCESS(f'Generated {total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s).'))
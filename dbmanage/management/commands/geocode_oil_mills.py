@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from dbmanage import geo
+from dbmanage.models import OilMill
+
+
+class Command(BaseCommand):
+    help = "Locates the oil mills without coordinates from their address and country, offline, with the " \
+           "geocoder of settings.GEOCODER (a gazetteer file of places by default)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer', help='CSV file of places: name, latitude, longitude[, country].')
+        parser.add_argument('--all', action='store_true', help='Also locate again the mills with coordinates.')
+
+    def handle(self, *args, **options):
+        geocoder = geo.Gazetteer(options['gazetteer']) if options['gazetteer'] else geo.get_geocoder()
+        mills = OilMill.objects.all()
+        if not options['all']:
+            mills = mills.filter(latitude=None) | mills.filter(longitude=None)
+        located = missed = 0
+        for mill in mills.order_by('id').iterator():
+            place = geocoder.locate(mill.address, mill.country)
+            if place is None:
+                missed += 1
+                self.stdout.write(f'{mill.name}: no place found in "{mill.address}"')
+                continue
+            mill.latitude, mill.longitude = place
+            mill.save(update_fields=['latitude', 'longitude', 'geohash'])
+            located += 1
+        self.stdout.write(self.style.SUCCESS(f'Located {located} oil mills, {missed} not found.'))
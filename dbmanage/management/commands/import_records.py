@@ -0,0 +1,63 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbmanage import imports, ingest
+from dbmanage.models import Farmer
+
+
+class Command(BaseCommand):
+    help = "Imports olive groves, harvests or olive sale offers from a CSV (header line with the field names) " \
+           "or NDJSON file, in chunks written with one raw executemany INSERT each. Each chunk is committed " \
+           "on its own: with --checkpoint, a failed import started again resumes after the last committed line."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(imports.IMPORTERS))
+        parser.add_argument('path', help="File to import, '-' for the standard input.")
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='Default: from the file extension.')
+        parser.add_argument('--farmer', help='Email of the farmer the records belong to; by default groves '
+                                             'name their farmer in a "farmer" column.')
+        parser.add_argument('--chunk-size', type=int, default=imports.CHUNK_SIZE)
+        parser.add_argument('--resume-after', type=int, default=0, help='Last line committed by a previous run.')
+        parser.add_argument('--checkpoint', help='File keeping the last committed line between runs.')
+
+    def handle(self, *args, **options):
+        farmer = None
+        if options['farmer']:
+            farmer = Farmer.objects.filter(email=options['farmer']).first()
+            if farmer is None:
+                raise CommandError(f'No farmer with the email {options["farmer"]}.')
+        resume_after = options['resume_after']
+        checkpoint = options['checkpoint']
+        if checkpoint and not resume_after and os.path.exists(checkpoint):
+            with open(checkpoint) as checkpoint_file:
+                resume_after = int(checkpoint_file.read().strip() or 0)
+
+        def save_checkpoint(report):
+            if checkpoint:
+                with open(checkpoint, 'w') as checkpoint_file:
+                    checkpoint_file.write(str(report.committed_line))
+
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        reader = imports.iter_csv if file_format == 'csv' else ingest.iter_ndjson
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            report = imports.import_records(imports.IMPORTERS[options['kind']](farmer=farmer), reader(stream),
+                                            chunk_size=options['chunk_size'], resume_after=resume_after,
+                                            on_commit=save_checkpoint)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        for rejected in report.rejected:
+            self.stdout.write(f'line {rejected["line"]}: {rejected["error"]}')
+        summary = f'Imported {report.accepted} {options["kind"]}, skipped {report.skipped} already imported, ' \
+                  f'rejected {report.rejected_count}.'
+        if report.failed:
+            raise CommandError(f'{summary} Stopped by "{report.failed}", resume with '
+                               f'--resume-after {report.committed_line}.')
+        if checkpoint and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dbmanage import lineage
+
+
+class Command(BaseCommand):
+    help = "Recomputes the oil product genealogy closure table from the mother_product links, e.g. after " \
+           "they were changed with queryset update() or loaddata, which bypass the signals."
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                total = lineage.rebuild()
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the oil product lineage: {total} rows.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dbmanage import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search side index of olive and oil sale offers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search requires the SQLite backend (FTS5).')
+        with transaction.atomic():
+            total = search.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} offers.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dbmanage import rollups
+
+
+class Command(BaseCommand):
+    help = "Recomputes the hourly and daily sensor rollups from the raw measurements. Measurements stored " \
+           "before timestamps were recorded are first dated at midnight UTC of their day."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            backfilled = rollups.backfill_measured_at()
+            total = rollups.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {total} measurements ({backfilled} timestamps backfilled).'))
@@ -0,0 +1,92 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dbmanage import loadsim
+from dbmanage.models import Consumer, Farmer, Harvest, MillManager
+
+
+def parse_mix(value):
+    # farmer=2,mill=3,consumer=5
+    try:
+        mix = {role.strip(): float(weight) for role, weight in (part.split('=') for part in value.split(','))}
+    except ValueError:
+        raise CommandError(f'Invalid --mix {value!r}, expected e.g. farmer=2,mill=3,consumer=5.')
+    unknown = set(mix) - set(loadsim.ROLES)
+    if unknown:
+        raise CommandError(f'Unknown roles in --mix: {", ".join(sorted(unknown))}.')
+    return mix
+
+
+class Command(BaseCommand):
+    help = "Plays the olive marketplace against a running server: farmers publish offers and approve purchase " \
+           "requests, mills request and confirm purchases, consumers browse. Reports the throughput, the latency " \
+           "percentiles and the error, conflict and lock rates of each operation, then checks the inventory of " \
+           "the offers involved. The actors are users of the database of this settings module, e.g. made by " \
+           "generate_dataset --password, so it must be the database the server uses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--password', required=True, help='Password of the users playing the actors.')
+        parser.add_argument('--duration', type=float, default=60, help='Seconds of arrivals.')
+        parser.add_argument('--rate', type=float, default=20, help='Arrivals (actor steps) per second.')
+        parser.add_argument('--mix', type=parse_mix, default=loadsim.DEFAULT_MIX,
+                            help='Share of the arrivals by role, e.g. farmer=2,mill=3,consumer=5.')
+        parser.add_argument('--actors', type=int, default=50, help='Users playing each role.')
+        parser.add_argument('--concurrency', type=int, default=16, help='Steps in flight at once.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        if options['rate'] <= 0 or options['duration'] <= 0 or options['concurrency'] < 1:
+            raise CommandError('--rate, --duration and --concurrency must be positive.')
+        actors = self.actors(options['actors'])
+        try:
+            simulation = loadsim.Simulation(loadsim.Client(options['url']), actors, options['password'],
+                                            mix=options['mix'], seed=options['seed'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        report = simulation.run(options['duration'], options['rate'], options['concurrency'])
+        logins = report['operations'].get('login', {})
+        if logins and not logins['ok']:
+            raise CommandError(f'No actor could log in to {options["url"]}: check the server and --password.')
+        report['inventory'] = violations = loadsim.check_inventory(simulation.offers)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report)
+        if any(violations.values()):
+            raise CommandError(f'Inventory invariants broken: {violations}')
+        self.stdout.write(self.style.SUCCESS(f'Inventory of {len(simulation.offers)} offers consistent.'))
+
+    def actors(self, count):
+        farmers = list(Farmer.objects.filter(olivegrove__harvests__isnull=False).distinct().order_by('id')
+                       .values_list('id', 'email')[:count])
+        harvests = {}
+        farmer_harvests = Harvest.objects.filter(grove__farmer_id__in=[pk for pk, email in farmers])
+        for farmer_id, harvest_id in farmer_harvests.order_by('id').values_list('grove__farmer_id', 'id'):
+            harvests.setdefault(farmer_id, []).append(harvest_id)
+        managers = MillManager.objects.filter(oilmill__isnull=False).order_by('id').values_list('id', 'email')
+        consumers = Consumer.objects.order_by('id').values_list('id', 'email')
+        return {
+            'farmer': [loadsim.Actor(pk, 'farmer', email, harvests[pk]) for pk, email in farmers],
+            'mill': [loadsim.Actor(pk, 'mill', email) for pk, email in managers[:count]],
+            'consumer': [loadsim.Actor(pk, 'consumer', email) for pk, email in consumers[:count]],
+        }
+
+    def write_report(self, report):
+        rates = report['rates']
+        self.stdout.write(f'{report["requests"]} requests in {report["duration_s"]}s: '
+                          f'{report["throughput_rps"]} requests/s')
+        self.stdout.write(f'errors {rates["error"]:.2%}, lock contention {rates["locked"]:.2%}, '
+                          f'conflicts {rates["conflict"]:.2%}, rejected {rates["rejected"]:.2%}')
+        if report['start_lag_ms']:
+            self.stdout.write(f'step start lag (ms): {report["start_lag_ms"]}')
+        header = ('operation', 'requests', 'ok', 'conflict', 'locked', 'rejected', 'error', 'p50_ms', 'p95_ms',
+                  'p99_ms')
+        self.stdout.write(''.join(column.rjust(10) if index else column.ljust(18)
+                                  for index, column in enumerate(header)))
+        for operation, entry in report['operations'].items():
+            self.stdout.write(operation.ljust(18) + ''.join(str(entry[column]).rjust(10) for column in header[1:]))
+        self.stdout.write(f'inventory violations: {report["inventory"]}')
@@ -0,0 +1,532 @@
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from dbmanage import dispatcher
+from dbmanage.models import OilNeed, OilProduct, OilSaleOffer, OliveNeed, OliveSaleOffer
+
+DEFAULT_SETTINGS = {
+    # seconds after which an index is reloaded from the database: every process has its own index
+    # and only sees the changes committed by other processes on reload
+    'REFRESH_INTERVAL': 300,
+}
+DEFAULT_MATCHES = 10
+MAX_MATCHES = 100
+
+_INFINITY = float('inf')
+
+
+def get_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'MATCHING', {}))
+
+
+def normalize(text):
+    # case and accent insensitive, single spaced
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return ' '.join(text.lower().split())
+
+
+def tokens(text):
+    return frozenset(re.findall(r'[a-z0-9]+', normalize(text)))
+
+
+class PriceIndex:
+    """
+    Sorted (price, pk) points: the points of a price range are found in O(log n + k), cheapest first.
+    """
+
+    def __init__(self, points=()):
+        self._points = sorted(points)
+
+    def add(self, price, pk):
+        insort(self._points, (price, pk))
+
+    def remove(self, price, pk):
+        index = bisect_left(self._points, (price, pk))
+        if index < len(self._points) and self._points[index] == (price, pk):
+            del self._points[index]
+
+    def range(self, low, high):
+        for index in range(bisect_left(self._points, (low,)), bisect_right(self._points, (high, _INFINITY))):
+            yield self._points[index][1]
+
+    def __len__(self):
+        return len(self._points)
+
+
+class IntervalIndex:
+    """
+    (low, high, pk) intervals sorted by their low end, in blocks that remember the highest high end
+    of their intervals: a stabbing query only scans the blocks starting below the point whose
+    intervals reach it, and inserts and removals move at most one block.
+    """
+    block_size = 64
+
+    def __init__(self, intervals=()):
+        intervals = sorted(intervals)
+        self._blocks = [intervals[start:start + self.block_size]
+                        for start in range(0, len(intervals), self.block_size)]
+        self._firsts = [block[0] for block in self._blocks]
+        self._highs = [max(interval[1] for interval in block) for block in self._blocks]
+
+    def _block(self, interval):
+        return max(bisect_right(self._firsts, interval) - 1, 0)
+
+    def add(self, low, high, pk):
+        interval = (low, high, pk)
+        if not self._blocks:
+            self._blocks.append([interval])
+            self._firsts.append(interval)
+            self._highs.append(high)
+            return
+        number = self._block(interval)
+        block = self._blocks[number]
+        insort(block, interval)
+        self._firsts[number] = block[0]
+        self._highs[number] = max(self._highs[number], high)
+        if len(block) > 2 * self.block_size:
+            half = block[self.block_size:]
+            del block[self.block_size:]
+            self._blocks.insert(number + 1, half)
+            self._firsts.insert(number + 1, half[0])
+            self._highs[number] = max(interval[1] for interval in block)
+            self._highs.insert(number + 1, max(interval[1] for interval in half))
+
+    def remove(self, low, high, pk):
+        interval = (low, high, pk)
+        if not self._blocks:
+            return
+        number = self._block(interval)
+        block = self._blocks[number]
+        index = bisect_left(block, interval)
+        if index == len(block) or block[index] != interval:
+            return
+        del block[index]
+        if not block:
+            del self._blocks[number], self._firsts[number], self._highs[number]
+            return
+        self._firsts[number] = block[0]
+        if high == self._highs[number]:
+            self._highs[number] = max(interval[1] for interval in block)
+
+    def stab(self, point):
+        """
+        Yields the pk of the intervals containing `point`.
+        """
+        for number in range(bisect_right(self._firsts, (point, _INFINITY, _INFINITY))):
+            if self._highs[number] < point:
+                continue
+            for low, high, pk in self._blocks[number]:
+                if low > point:
+                    break
+                if high >= point:
+                    yield pk
+
+    def __len__(self):
+        return sum(len(block) for block in self._blocks)
+
+
+class MatchingEngine:
+    """
+    In-memory matching of buyer needs, each with a price range, against sale offers, each with a
+    price. Both sides are partitioned by an inverted index on their categorical attributes (the
+    `key` of their entries): inside a partition the offers are sorted by price and the needs kept in
+    an interval index on their price range, so matching an event costs a lookup plus a bisect or a
+    stabbing query, whatever the number of open needs and offers.
+
+    The index is loaded on first use, kept up to date by the signals of this process (once their
+    transaction commits) and reloaded every REFRESH_INTERVAL seconds for the writes of other
+    processes. Callers read the matched rows back from the database.
+
+    Subclasses give the rows of both sides (`need_rows`, `offer_rows`) and turn them into entries
+    with `key`, `price_min` and `price_max` (`need_entry`), `key` and `price` (`offer_entry`).
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._needs = {}
+        self._offers = {}
+        self._need_index = {}
+        self._offer_index = {}
+
+    # loading
+
+    def read(self):
+        return {
+            'needs': {row['id']: self.need_entry(row) for row in self.need_rows().iterator()},
+            'offers': {row['id']: self.offer_entry(row) for row in self.offer_rows().iterator()},
+        }
+
+    def install(self, data):
+        # indexes are built sorted in one go rather than entry by entry
+        self._needs, self._offers = data['needs'], data['offers']
+        need_index, offer_index = {}, {}
+        for pk, need in self._needs.items():
+            need_index.setdefault(need.key, []).append((need.price_min, need.price_max, pk))
+        for pk, offer in self._offers.items():
+            offer_index.setdefault(offer.key, []).append((offer.price, pk))
+        self._need_index = {key: IntervalIndex(intervals) for key, intervals in need_index.items()}
+        self._offer_index = {key: PriceIndex(points) for key, points in offer_index.items()}
+
+    def load(self):
+        data = self.read()
+        with self._lock:
+            self.install(data)
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval:
+            self.load()
+
+    # incremental updates
+
+    def _add_need(self, pk, need):
+        self._needs[pk] = need
+        self._need_index.setdefault(need.key, IntervalIndex()).add(need.price_min, need.price_max, pk)
+
+    def _remove_need(self, pk):
+        need = self._needs.pop(pk, None)
+        if need is not None:
+            self._need_index[need.key].remove(need.price_min, need.price_max, pk)
+        return need
+
+    def _add_offer(self, pk, offer):
+        self._offers[pk] = offer
+        self._offer_index.setdefault(offer.key, PriceIndex()).add(offer.price, pk)
+
+    def _remove_offer(self, pk):
+        offer = self._offers.pop(pk, None)
+        if offer is not None:
+            self._offer_index[offer.key].remove(offer.price, pk)
+        return offer
+
+    def _refresh(self, rows, pks, entry, remove, add):
+        if self._loaded_at is None:
+            return
+        entries = {row['id']: entry(row) for row in rows.filter(pk__in=pks)}
+        with self._lock:
+            for pk in pks:
+                remove(pk)
+                if pk in entries:
+                    add(pk, entries[pk])
+
+    def refresh_needs(self, pks):
+        """
+        Reads the needs back from the database, after they were saved or deleted.
+        """
+        self._refresh(self.need_rows(), pks, self.need_entry, self._remove_need, self._add_need)
+
+    def refresh_offers(self, pks):
+        """
+        Reads the offers back from the database, after they or the rows they take attributes from
+        changed.
+        """
+        self._refresh(self.offer_rows(), pks, self.offer_entry, self._remove_offer, self._add_offer)
+
+    # queries
+
+    def _offers_in_range(self, key, low, high):
+        return self._offer_index.get(key, PriceIndex()).range(low, high)
+
+    def _needs_at(self, key, price):
+        return self._need_index.get(key, IntervalIndex()).stab(price)
+
+
+OliveNeedEntry = namedtuple('OliveNeedEntry', 'key region price_min price_max quantity')
+OliveOfferEntry = namedtuple('OliveOfferEntry', 'key region price quantity')
+
+
+class OliveMatchingEngine(MatchingEngine):
+    """
+    Pending OliveNeeds against available OliveSaleOffers, keyed by variety (case and accent
+    insensitive), cropping system, practice, price and quantity units. The offers are also indexed
+    by the words of their grove address, so the offers of the region of a need come first.
+    """
+
+    def __init__(self, refresh_interval=300):
+        super().__init__(refresh_interval)
+        self._region_index = {}
+
+    @staticmethod
+    def need_entry(row):
+        key = (normalize(row['olives_variety']), row['cropping_system'], row['practice'], row['price_unit'],
+               normalize(row['quantity_unit']))
+        return OliveNeedEntry(key, tuple(sorted(tokens(row['region']))), float(row['price_min']),
+                              float(row['price_max']), row['quantity'])
+
+    @staticmethod
+    def offer_entry(row):
+        key = (normalize(row['harvest__grove__olives_variety']), row['harvest__grove__cropping_system'],
+               row['harvest__grove__practice'], row['price_unit'], normalize(row['quantity_unit']))
+        return OliveOfferEntry(key, tokens(row['harvest__grove__address']), float(row['offer_price']),
+                               row['available_quantity_for_sell'])
+
+    @staticmethod
+    def need_rows():
+        return OliveNeed.objects.filter(need_status='P').values(
+            'id', 'olives_variety', 'cropping_system', 'practice', 'price_unit', 'quantity_unit', 'region',
+            'price_min', 'price_max', 'quantity')
+
+    @staticmethod
+    def offer_rows():
+        return OliveSaleOffer.objects.available().filter(available_quantity_for_sell__gt=0).values(
+            'id', 'harvest__grove__olives_variety', 'harvest__grove__cropping_system', 'harvest__grove__practice',
+            'harvest__grove__address', 'price_unit', 'quantity_unit', 'offer_price', 'available_quantity_for_sell')
+
+    def install(self, data):
+        super().install(data)
+        region_index = {}
+        for pk, offer in self._offers.items():
+            for token in offer.region:
+                region_index.setdefault((offer.key, token), []).append((offer.price, pk))
+        self._region_index = {key: PriceIndex(points) for key, points in region_index.items()}
+
+    def _add_offer(self, pk, offer):
+        super()._add_offer(pk, offer)
+        for token in offer.region:
+            self._region_index.setdefault((offer.key, token), PriceIndex()).add(offer.price, pk)
+
+    def _remove_offer(self, pk):
+        offer = super()._remove_offer(pk)
+        if offer is not None:
+            for token in offer.region:
+                self._region_index[(offer.key, token)].remove(offer.price, pk)
+        return offer
+
+    def offers_for_need(self, need_pk, k=DEFAULT_MATCHES, min_quantity=None):
+        """
+        Returns the top `k` compatible offers of a pending need as (offer pk, same region) pairs:
+        offers of the region of the need first, then by price. The offers have at least the quantity
+        of the need available (in the same unit, part of the key), or `min_quantity` when given.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            need = self._needs.get(need_pk)
+            if need is None:
+                return []
+            if min_quantity is None:
+                min_quantity = need.quantity
+            matches, seen = [], set()
+            if need.region:
+                region = self._region_index.get((need.key, need.region[0]), PriceIndex())
+                for pk in region.range(need.price_min, need.price_max):
+                    offer = self._offers[pk]
+                    if offer.quantity >= min_quantity and offer.region.issuperset(need.region):
+                        matches.append((pk, True))
+                        seen.add(pk)
+                        if len(matches) == k:
+                            return matches
+            for pk in self._offers_in_range(need.key, need.price_min, need.price_max):
+                if pk not in seen and self._offers[pk].quantity >= min_quantity:
+                    matches.append((pk, False))
+                    if len(matches) == k:
+                        break
+            return matches
+
+    def needs_for_offer(self, offer_pk):
+        """
+        Returns the pending needs an available offer is compatible with, as (need pk, same region)
+        pairs, needs of the region of the offer first. As in offers_for_need(), the offer has at least
+        the quantity of each need available.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            offer = self._offers.get(offer_pk)
+            if offer is None:
+                return []
+            needs = ((pk, self._needs[pk]) for pk in self._needs_at(offer.key, offer.price))
+            matches = [(pk, bool(need.region) and offer.region.issuperset(need.region))
+                       for pk, need in needs if need.quantity <= offer.quantity]
+            return sorted(matches, key=lambda match: (not match[1], match[0]))
+
+
+OilNeedEntry = namedtuple('OilNeedEntry', 'key price_min price_max')
+OilOfferEntry = namedtuple('OilOfferEntry', 'key price')
+
+
+class OilMatchingEngine(MatchingEngine):
+    """
+    Pending OilNeeds against available OilSaleOffers, keyed by oil quality, packaging, production
+    year, price and quantity units, and against the unsold oil products of farmers, which have no
+    price: they are indexed by the same key without the price unit.
+    """
+
+    def __init__(self, refresh_interval=300):
+        super().__init__(refresh_interval)
+        self._products = {}
+        self._inventory = {}
+
+    @staticmethod
+    def inventory_key(key):
+        quality, packaged, year, price_unit, quantity_unit = key
+        return quality, packaged, year, quantity_unit
+
+    @staticmethod
+    def need_entry(row):
+        key = (row['oil_quality'], row['packaged'], row['production_year'].year, row['price_unit'],
+               row['quantity_unit'])
+        return OilNeedEntry(key, float(row['price_min']), float(row['price_max']))
+
+    @staticmethod
+    def offer_entry(row):
+        key = (row['oil_product__oil_quality'], row['oil_product__is_packaged'],
+               row['oil_product__production_date'].year, row['price_unit'], row['quantity_unit'])
+        return OilOfferEntry(key, float(row['offered_price']))
+
+    @staticmethod
+    def product_entry(row):
+        return row['oil_quality'], row['is_packaged'], row['production_date'].year, row['quantity_unit']
+
+    @staticmethod
+    def need_rows():
+        return OilNeed.objects.filter(need_status='P').values(
+            'id', 'oil_quality', 'packaged', 'production_year', 'price_unit', 'quantity_unit', 'price_min',
+            'price_max')
+
+    @staticmethod
+    def offer_rows():
+        return OilSaleOffer.objects.filter(offer_status='A', available_quantity_for_sell__gt=0).values(
+            'id', 'oil_product__oil_quality', 'oil_product__is_packaged', 'oil_product__production_date',
+            'price_unit', 'quantity_unit', 'offered_price')
+
+    @staticmethod
+    def product_rows():
+        return OilProduct.objects.filter(owner_category='F', owner__isnull=False, remaining_quantity__gt=0).values(
+            'id', 'oil_quality', 'is_packaged', 'production_date', 'quantity_unit')
+
+    def read(self):
+        data = super().read()
+        data['products'] = {row['id']: self.product_entry(row) for row in self.product_rows().iterator()}
+        return data
+
+    def install(self, data):
+        super().install(data)
+        self._products, self._inventory = data['products'], {}
+        for pk, key in self._products.items():
+            self._inventory.setdefault(key, set()).add(pk)
+
+    def _add_product(self, pk, key):
+        self._products[pk] = key
+        self._inventory.setdefault(key, set()).add(pk)
+
+    def _remove_product(self, pk):
+        key = self._products.pop(pk, None)
+        if key is not None:
+            self._inventory[key].discard(pk)
+        return key
+
+    def refresh_products(self, pks):
+        """
+        Reads the oil products back from the database, after they were saved or deleted.
+        """
+        self._refresh(self.product_rows(), pks, self.product_entry, self._remove_product, self._add_product)
+
+    def sellers_for_need(self, need_pk):
+        """
+        Returns the available offers (cheapest first) and the unsold farmer products a pending need
+        is compatible with, as {'offers': [pk, ...], 'products': [pk, ...]}.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            need = self._needs.get(need_pk)
+            if need is None:
+                return {'offers': [], 'products': []}
+            return {
+                'offers': list(self._offers_in_range(need.key, need.price_min, need.price_max)),
+                'products': sorted(self._inventory.get(self.inventory_key(need.key), ())),
+            }
+
+    def needs_for_offer(self, offer_pk):
+        """
+        Returns the pks of the pending needs an available offer is compatible with.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            offer = self._offers.get(offer_pk)
+            if offer is None:
+                return []
+            return sorted(self._needs_at(offer.key, offer.price))
+
+
+# notifications of the matches of new oil needs and offers, through dbmanage.dispatcher
+
+def _codes(codes, limit=5):
+    codes = sorted(codes)
+    return ', '.join(codes[:limit]) + (f' and {len(codes) - limit} more' if len(codes) > limit else '')
+
+
+def notify_oil_need_matches(need_pk):
+    """
+    Tells the sellers whose oil matches a new need about it: the mill or farmer of each matching
+    sale offer and the owner of each matching unsold product, one notification per seller.
+    """
+    matches = get_oil_engine().sellers_for_need(need_pk)
+    if not matches['offers'] and not matches['products']:
+        return
+    need = OilNeed.objects.get(pk=need_pk)
+    sellers = {}
+    for offer in OilSaleOffer.objects.filter(pk__in=matches['offers']).values('offer_code', 'oil_mill_id',
+                                                                                'farmer_id'):
+        seller = ('oil_mill_id', offer['oil_mill_id']) if offer['oil_mill_id'] else ('user_id', offer['farmer_id'])
+        sellers.setdefault(seller, []).append(offer['offer_code'])
+    for product in OilProduct.objects.filter(pk__in=matches['products']).values('oil_product_code', 'owner_id'):
+        sellers.setdefault(('user_id', product['owner_id']), []).append(product['oil_product_code'])
+    dispatcher.notify_many([{
+        field: recipient,
+        'message': f'A buyer is looking for {need.get_oil_quality_display()} ({need.quantity} {need.quantity_unit} '
+                   f'at {need.price_min}-{need.price_max} {need.price_unit}): {_codes(codes)} match the oil need '
+                   f'{need.need_code}.',
+    } for (field, recipient), codes in sellers.items() if recipient is not None])
+
+
+def notify_oil_offer_matches(offer_pk):
+    """
+    Tells the buyers of the pending needs a new oil sale offer satisfies about it.
+    """
+    need_pks = get_oil_engine().needs_for_offer(offer_pk)
+    if not need_pks:
+        return
+    offer = OilSaleOffer.objects.get(pk=offer_pk)
+    dispatcher.notify_many([{
+        'oil_mill_id': need['oil_mill_id'],
+        'user_id': None if need['oil_mill_id'] else need['consumer_id'],
+        'message': f'The oil sale offer {offer.offer_code} at {offer.offered_price} {offer.price_unit} matches your '
+                   f'oil need {need["need_code"]}.',
+    } for need in OilNeed.objects.filter(pk__in=need_pks).values('need_code', 'oil_mill_id', 'consumer_id')])
+
+
+_engines = {}
+_engine_lock = threading.Lock()
+
+
+def _get(engine_class):
+    engine = _engines.get(engine_class)
+    if engine is None:
+        with _engine_lock:
+            engine = _engines.get(engine_class)
+            if engine is None:
+                engine = _engines[engine_class] = engine_class(refresh_interval=get_settings()['REFRESH_INTERVAL'])
+    return engine
+
+
+def get_engine():
+    return _get(OliveMatchingEngine)
+
+
+def get_oil_engine():
+    return _get(OilMatchingEngine)
+
+
+@receiver(setting_changed)
+def reset_engine(setting, **kwargs):
+    if setting == 'MATCHING':
+        _engines.clear()
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0002_auto_20231208_1118'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='harvest',
+            index=models.Index(fields=['harvest_date', 'id'], name='harvest_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='harvest',
+            index=models.Index(fields=['initial_quantity', 'id'], name='harvest_quantity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivepurchaserequest',
+            index=models.Index(fields=['requested_price', 'id'], name='olive_request_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivepurchaserequest',
+            index=models.Index(fields=['requested_quantity', 'id'], name='olive_request_quantity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivesaleoffer',
+            index=models.Index(fields=['offer_price', 'id'], name='olive_offer_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivesaleoffer',
+            index=models.Index(fields=['available_quantity_for_sell', 'id'], name='olive_offer_quantity_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasedolive',
+            index=models.Index(fields=['mill', 'olive_quantity', 'id'], name='purchased_olive_quantity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchasedolive',
+            index=models.Index(fields=['mill', 'purchase_date', 'id'], name='purchased_olive_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sensormeasurement',
+            index=models.Index(fields=['date', 'id'], name='measurement_date_id_idx'),
+        ),
+    ]
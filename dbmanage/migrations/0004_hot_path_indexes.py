@@ -0,0 +1,37 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0003_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='harvest',
+            index=models.Index(fields=['grove', 'harvest_date'], name='harvest_grove_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', 'created_at'], name='notification_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['oil_mill', 'created_at'], name='notification_mill_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivepurchaserequest',
+            index=models.Index(fields=['mill', 'request_status'], name='olive_request_mill_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivesaleoffer',
+            index=models.Index(fields=['offer_status', 'transportation', 'offer_price'], name='olive_offer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='olivesaleoffer',
+            index=models.Index(condition=models.Q(('offer_status', 'A')), fields=['offer_price', 'id'], name='olive_offer_available_idx'),
+        ),
+    ]
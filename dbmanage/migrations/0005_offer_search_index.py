@@ -0,0 +1,30 @@
+from django.db import migrations
+
+CREATE_TABLE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS dbmanage_offer_search USING fts5("
+    "kind, offer_code, variety, region, grove, certificate, packaging, quality, details, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+DROP_TABLE_SQL = "DROP TABLE IF EXISTS dbmanage_offer_search"
+
+
+def create_search_table(apps, schema_editor):
+    # FTS5 side index, SQLite only (see dbmanage.search)
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_TABLE_SQL)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(DROP_TABLE_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0005_offer_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(max_length=20)),
+                ('resolution', models.CharField(choices=[('h', 'Hourly'), ('d', 'Daily')], max_length=1)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('total', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sensormeasurement',
+            name='measured_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='sensormeasurement',
+            index=models.Index(fields=['sensor', 'parameter', 'measured_at'], name='measurement_series_idx'),
+        ),
+        migrations.AddField(
+            model_name='sensorrollup',
+            name='sensor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='dbmanage.iotsensor'),
+        ),
+        migrations.AddConstraint(
+            model_name='sensorrollup',
+            constraint=models.UniqueConstraint(fields=('sensor', 'parameter', 'resolution', 'bucket_start'), name='sensor_rollup_bucket_unique'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0006_sensor_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='iotsensor',
+            name='series_storage',
+            field=models.CharField(choices=[('R', 'One row per reading'), ('C', 'Compressed daily chunks')], default='R', max_length=1),
+        ),
+        migrations.CreateModel(
+            name='SensorSeriesChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameter', models.CharField(max_length=20)),
+                ('day', models.DateField()),
+                ('count', models.IntegerField()),
+                ('first_at', models.DateTimeField()),
+                ('last_at', models.DateTimeField()),
+                ('data', models.BinaryField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series_chunks', to='dbmanage.iotsensor')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sensorserieschunk',
+            constraint=models.UniqueConstraint(fields=('sensor', 'parameter', 'day'), name='sensor_series_chunk_day_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0007_sensor_series_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='intent_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+    ]
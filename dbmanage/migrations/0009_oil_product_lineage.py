@@ -0,0 +1,37 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_lineage(apps, schema_editor):
+    from dbmanage import lineage
+    lineage.rebuild(apps.get_model('dbmanage', 'OilProduct'), apps.get_model('dbmanage', 'OilProductLineage'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0008_notification_intent_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OilProductLineage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.IntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='dbmanage.oilproduct')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='dbmanage.oilproduct')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='oilproductlineage',
+            index=models.Index(fields=['descendant', 'depth'], name='oil_product_ancestors_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='oilproductlineage',
+            constraint=models.UniqueConstraint(fields=('ancestor', 'descendant'), name='oil_product_lineage_unique'),
+        ),
+        migrations.RunPython(build_lineage, migrations.RunPython.noop),
+    ]
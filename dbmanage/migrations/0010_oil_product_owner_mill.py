@@ -0,0 +1,23 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0009_oil_product_lineage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oilproduct',
+            name='owner_mill',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='oil_products', to='dbmanage.oilmill'),
+        ),
+        migrations.AddIndex(
+            model_name='oilproduct',
+            index=models.Index(fields=['owner', 'production_date', 'id'], name='oil_product_owner_date_idx'),
+        ),
+    ]
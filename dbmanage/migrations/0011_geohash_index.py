@@ -0,0 +1,48 @@
+# Generated by Django 3.2.12 on 2026-10-18 01:54
+
+from django.db import migrations, models
+
+
+def set_geohashes(apps, schema_editor):
+    from dbmanage import geo
+    for name in ('OliveGrove', 'OilMill', 'StorageArea'):
+        model = apps.get_model('dbmanage', name)
+        located = model.objects.exclude(latitude=None).exclude(longitude=None)
+        for pk, latitude, longitude in located.values_list('id', 'latitude', 'longitude').iterator():
+            model.objects.filter(pk=pk).update(geohash=geo.encode(latitude, longitude))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0010_oil_product_owner_mill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='oilmill',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='oilmill',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='oilmill',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='olivegrove',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='storagearea',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12, null=True),
+        ),
+        migrations.RunPython(set_geohashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.12 on 2026-10-18 03:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dbmanage', '0014_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensormeasurement',
+            name='sensor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='measurements', to='dbmanage.iotsensor'),
+        ),
+    ]
@@ -1,7 +1,13 @@
+from datetime import date, datetime
+
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from rest_framework.exceptions import ValidationError
 
+from dbmanage import codes
+
 
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, first_name=None, last_name=None, role=None):
@@ -72,6 +78,11 @@ class User(AbstractBaseUser):
     def is_staff(self):
         return self.is_admin
 
+    @cached_property
+    def oil_mill_id(self):
+        # the mill managed by the user, also carried by the claims of its tokens (dbmanage.authentication)
+        return OilMill.objects.filter(mill_manager_id=self.id).values_list('id', flat=True).first()
+
 
 class ReceivedFeedback(models.Model):
     appreciation = models.IntegerField()
@@ -106,12 +117,59 @@ class MillManager(User):
     pass
 
 
+class CodeSequence(models.Model):
+    # last number handed out for the business codes starting with `prefix`, see dbmanage.codes
+    prefix = models.CharField(max_length=50, unique=True)
+    last_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.prefix}: {self.last_value}'
+
+
+class ResourceVersion(models.Model):
+    # version of the rows of a model, bumped by the transactions writing them, see dbmanage.versions
+    name = models.CharField(max_length=100, unique=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
+
+
+class CodedModel(models.Model):
+    """
+    A model with a unique business code "<prefix>-<YYYYMMDD>-<number>", the number coming from the
+    sequence of the prefix (dbmanage.codes): codes exist before the insert, so objects given a code
+    with codes.assign() can be written with bulk_create().
+    """
+    code_field = None
+    code_prefix = None
+    code_date_field = None
+
+    class Meta:
+        abstract = True
+
+    def get_code_prefix(self):
+        return self.code_prefix
+
+    def build_code(self, prefix, number):
+        formatted_date = getattr(self, self.code_date_field).strftime('%Y%m%d')
+        return f"{prefix}-{formatted_date}-{number}"
+
+    def save(self, *args, **kwargs):
+        if not getattr(self, self.code_field):
+            codes.assign([self], using=kwargs.get('using'))
+        super().save(*args, **kwargs)
+
+
 class OliveGrove(models.Model):
     name = models.CharField(max_length=50, unique=True)
     is_owner = models.BooleanField(default=False)
     address = models.CharField(max_length=255)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    # set from latitude/longitude on save (dbmanage.geo), proximity searches are ranges of this index
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
     trees_age = models.IntegerField()
     area = models.FloatField()
     area_unit = 'Hectare'
@@ -170,12 +228,16 @@ class OilMill(models.Model):
     quality_certificate = models.CharField(max_length=255)
     agreement_date = models.DateField()
     mill_manager = models.OneToOneField(MillManager, on_delete=models.CASCADE)
+    # from the address with the geocode_oil_mills command when not given
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
 
     def __str__(self):
         return self.name
 
 
-class Harvest(models.Model):
+class Harvest(CodedModel):
     harvest_date = models.DateField()
     harvest_method_choices = (
         ('Mn', 'Manual'),
@@ -210,19 +272,31 @@ class Harvest(models.Model):
     creation_cause = models.CharField(max_length=15, default='Harvesting')
     harvest_code = models.CharField(max_length=255, unique=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # harvests of a grove by date (HarvestListAPIView filters by farmer, then by date/year)
+            models.Index(fields=['grove', 'harvest_date'], name='harvest_grove_date_idx'),
+            # keyset pagination sort orders (HarvestListAPIView)
+            models.Index(fields=['harvest_date', 'id'], name='harvest_date_id_idx'),
+            models.Index(fields=['initial_quantity', 'id'], name='harvest_quantity_id_idx'),
+        ]
+
+    code_field = 'harvest_code'
+    code_prefix = 'harvest'
+    code_date_field = 'harvest_date'
+
+    def build_code(self, prefix, number):
+        return f"{number}-{self.harvest_date.strftime('%Y%m%d')}-{self.grove.name}"
+
     def save(self, *args, **kwargs):
         self.remaining_quantity = self.initial_quantity
-        if not self.harvest_code:
-            formatted_date = self.harvest_date.strftime('%Y%m%d')
-            harvest_id = str(self.id).zfill(6)
-            self.harvest_code = f"{harvest_id}-{formatted_date}-{self.grove.name}"
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.harvest_code
 
 
-class OliveNeed(models.Model):
+class OliveNeed(CodedModel):
     quantity = models.FloatField()
     quantity_unit = models.CharField(max_length=10, default='Tonnes')
     price_min = models.DecimalField(max_digits=12, decimal_places=3)
@@ -261,18 +335,22 @@ class OliveNeed(models.Model):
         if not self.oil_mill:
             raise ValidationError("An olive need must have a creator (OilMill).")
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.need_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.need_code:
-            self.need_code = f"olive need-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    code_field = 'need_code'
+    code_prefix = 'olive need'
+    code_date_field = 'need_date'
 
     def __str__(self):
         return self.need_code
 
 
-class OliveSaleOffer(models.Model):
+class OliveSaleOfferQuerySet(models.QuerySet):
+    def available(self):
+        # The predicate is emitted as a literal, not as a bound parameter: SQLite can only use the
+        # partial index olive_offer_available_idx when the query provably implies its condition.
+        return self.extra(where=[f"{self.model._meta.db_table}.offer_status = 'A'"])
+
+
+class OliveSaleOffer(CodedModel):
     harvest = models.ForeignKey(Harvest, on_delete=models.CASCADE)
     initial_quantity_for_sell = models.FloatField()
     quantity_unit = models.CharField(max_length=10, default='Tonnes')
@@ -303,20 +381,34 @@ class OliveSaleOffer(models.Model):
     olive_need = models.ForeignKey(OliveNeed, on_delete=models.CASCADE, null=True, blank=True,
                                    related_name='olive_sale_offers')
 
+    objects = OliveSaleOfferQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # marketplace filters: status, then transportation, then price range
+            models.Index(fields=['offer_status', 'transportation', 'offer_price'], name='olive_offer_status_idx'),
+            # available offers only, sorted by price (OliveSaleOffer.objects.available())
+            models.Index(fields=['offer_price', 'id'], condition=models.Q(offer_status='A'),
+                         name='olive_offer_available_idx'),
+            # keyset pagination sort orders (OliveSaleOfferListAPIView)
+            models.Index(fields=['offer_price', 'id'], name='olive_offer_price_id_idx'),
+            models.Index(fields=['available_quantity_for_sell', 'id'], name='olive_offer_quantity_id_idx'),
+        ]
+
+    code_field = 'offer_code'
+    code_prefix = 'olive selling'
+    code_date_field = 'creation_date'
+
     def save(self, *args, **kwargs):
         if not self.id and self.offer_status == 'A':
             self.available_quantity_for_sell = self.initial_quantity_for_sell
-        formatted_date = self.creation_date.strftime('%Y%m%d')
-        offer_id = str(self.id).zfill(6)
-        if not self.offer_code:
-            self.offer_code = f"olive selling-{formatted_date}-{offer_id}"
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.offer_code
 
 
-class OlivePurchaseRequest(models.Model):
+class OlivePurchaseRequest(CodedModel):
     olive_sale_offer = models.ForeignKey(OliveSaleOffer, on_delete=models.CASCADE,
                                          related_name='olive_purchase_requests')
     mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, related_name='olive_purchase_requests')
@@ -342,12 +434,18 @@ class OlivePurchaseRequest(models.Model):
     status_update_date = models.DateField()
     request_code = models.CharField(max_length=255, unique=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.request_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.request_code:
-            self.request_code = f"olive purchase-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # requests received by a mill, by status
+            models.Index(fields=['mill', 'request_status'], name='olive_request_mill_status_idx'),
+            # keyset pagination sort orders (OlivePurchaseRequestList)
+            models.Index(fields=['requested_price', 'id'], name='olive_request_price_id_idx'),
+            models.Index(fields=['requested_quantity', 'id'], name='olive_request_quantity_id_idx'),
+        ]
+
+    code_field = 'request_code'
+    code_prefix = 'olive purchase'
+    code_date_field = 'request_date'
 
     def __str__(self):
         return self.request_code
@@ -383,6 +481,13 @@ class PurchasedOlive(models.Model):
     mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, related_name='purchased_olives')
     olive_purchase_request = models.OneToOneField(OlivePurchaseRequest, on_delete=models.CASCADE, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination sort orders (PurchasedOliveListView), always filtered by mill
+            models.Index(fields=['mill', 'olive_quantity', 'id'], name='purchased_olive_quantity_idx'),
+            models.Index(fields=['mill', 'purchase_date', 'id'], name='purchased_olive_date_idx'),
+        ]
+
 
 class Machine(models.Model):
     machine_reference = models.CharField(max_length=100)
@@ -400,7 +505,7 @@ class Machine(models.Model):
     oil_mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, related_name='machines')
 
 
-class ServiceRequest(models.Model):
+class ServiceRequest(CodedModel):
     farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name='service_requests')
     considered_quantity = models.FloatField()
     requested_price = models.DecimalField(max_digits=12, decimal_places=3)
@@ -422,14 +527,12 @@ class ServiceRequest(models.Model):
 
     request_code = models.CharField(max_length=255, unique=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.request_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.request_code:
-            # Determine the type of request based on the class name
-            request_type = self.__class__.__name__.lower()
-            self.request_code = f"{request_type}-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    code_field = 'request_code'
+    code_date_field = 'request_date'
+
+    def get_code_prefix(self):
+        # Determine the type of request based on the class name
+        return self.__class__.__name__.lower()
 
     def __str__(self):
         return self.request_code
@@ -441,7 +544,7 @@ class ExtractionRequest(ServiceRequest):
     method = models.CharField(max_length=20)
 
 
-class ServiceOffer(models.Model):
+class ServiceOffer(CodedModel):
     oil_mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, related_name='service_offers')
     offered_price = models.DecimalField(max_digits=12, decimal_places=3)
     price_unit_choices = (
@@ -463,13 +566,11 @@ class ServiceOffer(models.Model):
     service_type = models.CharField(max_length=3, choices=service_type_choices, default='N')
     offer_code = models.CharField(max_length=255, unique=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.offer_date.strftime('%Y%m%d')
-        offer_id = str(self.id).zfill(6)
-        service_type = self.__class__.__name__.lower()
-        if not self.offer_code:
-            self.offer_code = f"{service_type}-{formatted_date}-{offer_id}"
-        super().save(*args, **kwargs)
+    code_field = 'offer_code'
+    code_date_field = 'offer_date'
+
+    def get_code_prefix(self):
+        return self.__class__.__name__.lower()
 
     def __str__(self):
         return self.offer_code
@@ -519,7 +620,13 @@ class ExtractionOperation(models.Model):
             raise ValidationError("An extraction operation cannot derive from both a harvest and a purchased olive.")
 
 
-class OilProduct(models.Model):
+class OilProductQuerySet(models.QuerySet):
+    def owned_by(self, user):
+        # owner is the resolved owner, the manager of the owning mill for mill products
+        return self.filter(owner_id=user.id)
+
+
+class OilProduct(CodedModel):
     extraction_operation = models.OneToOneField(ExtractionOperation, on_delete=models.CASCADE, null=True, blank=True)
     production_date = models.DateField()
     creation_cause_choices = (
@@ -554,6 +661,9 @@ class OilProduct(models.Model):
     )
     owner_category = models.CharField(max_length=2, choices=owner_category_choices)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='oil_products')
+    # the owning mill of mill products, owner is then its manager; both are resolved on save
+    owner_mill = models.ForeignKey(OilMill, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name='oil_products')
     is_packaged = models.BooleanField(default=False)
     is_stored = models.BooleanField(default=False)
     mother_product = models.ForeignKey(
@@ -565,40 +675,88 @@ class OilProduct(models.Model):
     )
     oil_product_code = models.CharField(max_length=255, unique=True, blank=True)
 
+    objects = OilProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # "my oil products" (OilProductQuerySet.owned_by) in keyset pagination order (OilProductListView)
+            models.Index(fields=['owner', 'production_date', 'id'], name='oil_product_owner_date_idx'),
+        ]
+
+    code_field = 'oil_product_code'
+    code_date_field = 'production_date'
+
+    def get_code_prefix(self):
+        return self.creation_cause
+
     def save(self, *args, **kwargs):
-        cre_date = self.production_date.strftime('%Y%m%d')
-        oil_id = str(self.id).zfill(6)
-        cause = self.creation_cause
-        if not self.oil_product_code:
-            self.oil_product_code = f"{cause}-{cre_date}-{oil_id}"
+        if self.owner_id is None and self.owner_mill_id is None:
+            self.owner_id, self.owner_mill_id = self.resolve_owner()
+        elif self.owner_mill_id is not None and self.owner_id is None:
+            self.owner_id = OilMill.objects.filter(pk=self.owner_mill_id).values_list(
+                'mill_manager_id', flat=True).first()
+        elif self.owner_category == 'M' and self.owner_mill_id is None:
+            self.owner_mill_id = OilMill.objects.filter(mill_manager_id=self.owner_id).values_list(
+                'id', flat=True).first()
         super().save(*args, **kwargs)
 
     @property
     def last_analysis(self):
         return self.analysis.last()
 
+    def resolve_owner(self):
+        """
+        Returns the (owner user id, owner mill id) of the product from how it was created: the farmer
+        of the extraction request or of the extracted harvest, the mill of the latest extracted
+        purchased olives, or the owner of the mother product for storage and packaging splits. Bought
+        products get their owner from the purchase.
+        """
+        if self.extraction_operation_id is not None:
+            if self.owner_category == 'F':
+                farmers = ExtractionOperation.objects.filter(pk=self.extraction_operation_id).values_list(
+                    'extraction_offer__extraction_request__farmer_id', 'harvest__grove__farmer_id').first()
+                farmer_id = next((farmer_id for farmer_id in farmers or () if farmer_id is not None), None)
+                if farmer_id is not None:
+                    return farmer_id, None
+            elif self.owner_category == 'M':
+                mill = PurchasedOlive.objects.filter(extractionoperation=self.extraction_operation_id).order_by(
+                    '-purchase_date', '-id').values_list('mill__mill_manager_id', 'mill_id').first()
+                if mill is not None:
+                    return mill
+        if self.mother_product_id is not None and self.creation_cause in ('St', 'P'):
+            return OilProduct.objects.filter(pk=self.mother_product_id).values_list(
+                'owner_id', 'owner_mill_id').first() or (None, None)
+        return None, None
+
     def get_owner_instance(self):
-        if self.owner_category == 'F':
-            # if the farmer has extracted his oil via an extraction request/offer
-            if self.extraction_operation and self.extraction_operation.extraction_offer:
-                return self.extraction_operation.extraction_offer.extraction_request.farmer
-            # if the farmer has extracted his oil directly without request/offer
-            elif self.extraction_operation and self.extraction_operation.harvest:
-                return self.extraction_operation.harvest.grove.farmer
-            else:
-                return None  # no owner instance for the farmer
-        elif self.owner_category == 'M':
-            if self.extraction_operation and self.extraction_operation.purchased_olives.exists():
-                return self.extraction_operation.purchased_olives.latest('purchase_date').mill
-            else:
-                return None  # no owner instance for the oil mill
-        else:
-            return None  # owner category is unknown or invalid
+        # the stored owner, see resolve_owner()
+        if self.owner_mill_id is not None:
+            return self.owner_mill
+        if self.owner_category == 'F' and self.owner_id is not None:
+            return Farmer.objects.filter(pk=self.owner_id).first()
+        return None
 
     def __str__(self):
         return self.oil_product_code
 
 
+class OilProductLineage(models.Model):
+    # closure table of the mother_product tree, maintained by dbmanage.lineage: one row per (ancestor,
+    # descendant) pair, depth 0 for the product itself
+    ancestor = models.ForeignKey(OilProduct, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(OilProduct, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            # also the index of the descendants of a product
+            models.UniqueConstraint(fields=['ancestor', 'descendant'], name='oil_product_lineage_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['descendant', 'depth'], name='oil_product_ancestors_idx'),
+        ]
+
+
 class StorageRequest(ServiceRequest):
     oil_product = models.ForeignKey(OilProduct, on_delete=models.CASCADE, related_name='storage_requests')
     quantity_unit_choices = (
@@ -628,6 +786,7 @@ class StorageArea(models.Model):
     address = models.CharField(max_length=255)
     latitude = models.FloatField(null=True, blank=True)
     longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, null=True, blank=True, db_index=True, editable=False)
     container_type = models.CharField(max_length=100)
     container_number = models.IntegerField()
     oil_mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, null=True, blank=True, related_name='storage_areas')
@@ -717,7 +876,7 @@ class Packaging(models.Model):
     oil_mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, null=True, blank=True, related_name='packagings')
 
 
-class AnalysisRequest(models.Model):
+class AnalysisRequest(CodedModel):
     farmer = models.ForeignKey(Farmer, on_delete=models.CASCADE, related_name='analysis_requests')
     oil_product = models.ForeignKey(OilProduct, on_delete=models.CASCADE, related_name='analysis_requests')
     analysis_choices = (
@@ -741,12 +900,9 @@ class AnalysisRequest(models.Model):
     status_update_date = models.DateField()
     request_code = models.CharField(max_length=255, unique=True, blank=True)
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.request_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.request_code:
-            self.request_code = f"analysisrequest-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    code_field = 'request_code'
+    code_prefix = 'analysisrequest'
+    code_date_field = 'request_date'
 
     def __str__(self):
         return self.request_code
@@ -882,7 +1038,7 @@ class StorageServiceProposal(models.Model):
     oil_mill = models.ForeignKey(OilMill, on_delete=models.CASCADE, related_name='storage_proposals')
 
 
-class OilNeed(models.Model):
+class OilNeed(CodedModel):
     quantity = models.FloatField()
     quantity_unit_choices = (
         ('kg', 'Kilograms'),
@@ -947,18 +1103,15 @@ class OilNeed(models.Model):
         if not self.oil_mill and not self.consumer:
             raise ValidationError("An oil need must have a creator (OilMill or Consumer).")
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.need_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.need_code:
-            self.need_code = f"oil need-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    code_field = 'need_code'
+    code_prefix = 'oil need'
+    code_date_field = 'need_date'
 
     def __str__(self):
         return self.need_code
 
 
-class OilSaleOffer(models.Model):
+class OilSaleOffer(CodedModel):
     oil_product = models.ForeignKey(OilProduct, on_delete=models.CASCADE, related_name='sale_offers')
     initial_quantity_for_sell = models.FloatField()
     available_quantity_for_sell = models.FloatField()
@@ -1019,18 +1172,15 @@ class OilSaleOffer(models.Model):
         if not self.oil_mill and not self.farmer:
             raise ValidationError("A sale offer must have a creator (OilMill or Farmer).")
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.creation_date.strftime('%Y%m%d')
-        offer_id = str(self.id).zfill(6)
-        if not self.offer_code:
-            self.offer_code = f"oil selling-{formatted_date}-{offer_id}"
-        super().save(*args, **kwargs)
+    code_field = 'offer_code'
+    code_prefix = 'oil selling'
+    code_date_field = 'creation_date'
 
     def __str__(self):
         return self.offer_code
 
 
-class OilPurchaseRequest(models.Model):
+class OilPurchaseRequest(CodedModel):
     oil_sale_offer = models.ForeignKey(OilSaleOffer, on_delete=models.CASCADE)
     requested_quantity = models.IntegerField()
     quantity_unit_choices = (
@@ -1074,12 +1224,9 @@ class OilPurchaseRequest(models.Model):
         if not self.oil_mill and not self.consumer:
             raise ValidationError("A purchase request must have a creator (OilMill or Consumer).")
 
-    def save(self, *args, **kwargs):
-        formatted_date = self.request_date.strftime('%Y%m%d')
-        request_id = str(self.id).zfill(6)
-        if not self.request_code:
-            self.request_code = f"oil purchase-{formatted_date}-{request_id}"
-        super().save(*args, **kwargs)
+    code_field = 'request_code'
+    code_prefix = 'oil purchase'
+    code_date_field = 'request_date'
 
     def __str__(self):
         return self.request_code
@@ -1091,18 +1238,103 @@ class Notification(models.Model):
     message = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # set by dbmanage.dispatcher, makes a replayed batch of notifications a no-op
+    intent_id = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # unread notifications of a user or a mill, newest first; partial because is_read=False is
+            # compiled as "NOT is_read", which cannot seek into an (owner, is_read, created_at) index
+            models.Index(fields=['user', 'created_at'], condition=models.Q(is_read=False),
+                         name='notification_user_unread_idx'),
+            models.Index(fields=['oil_mill', 'created_at'], condition=models.Q(is_read=False),
+                         name='notification_mill_unread_idx'),
+        ]
+
+
+class NotificationOutbox(models.Model):
+    # the notification intents of one dispatcher.notify_many() call, as a JSON list, written in the
+    # transaction of the caller and turned into Notification rows by the dispatcher thread
+    payload = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
 
 class IoTSensor(models.Model):
+    ROWS, CHUNKED = 'R', 'C'
+    series_storage_choices = (
+        (ROWS, 'One row per reading'),
+        (CHUNKED, 'Compressed daily chunks'),
+    )
     sensor_id = models.CharField(max_length=100, unique=True)
     type = models.CharField(max_length=20)
     constructor = models.CharField(max_length=50)
     deployment_date = models.DateField()
     storage_area = models.ForeignKey(StorageArea, on_delete=models.CASCADE, related_name='sensors')
+    # where the readings of the sensor are stored: SensorMeasurement rows or SensorSeriesChunk blobs
+    series_storage = models.CharField(max_length=1, choices=series_storage_choices, default=ROWS)
 
 
 class SensorMeasurement(models.Model):
     parameter = models.CharField(max_length=20)
     value = models.DecimalField(max_digits=5, decimal_places=3)
     date = models.DateField()
-    sensor = models.ForeignKey(IoTSensor, on_delete=models.CASCADE, related_name='measurements')
+    measured_at = models.DateTimeField(null=True, blank=True)
+    # deleted with their sensor by a pre_delete receiver (dbmanage.signals), in one statement: a
+    # cascade would load them and send post_delete for each row
+    sensor = models.ForeignKey(IoTSensor, on_delete=models.DO_NOTHING, related_name='measurements')
+
+    def save(self, *args, **kwargs):
+        # measurements recorded with a date only are bucketed at midnight UTC
+        if self.measured_at is None and isinstance(self.date, date):
+            self.measured_at = timezone.make_aware(datetime.combine(self.date, datetime.min.time()), timezone.utc)
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # keyset pagination sort order (SensorMeasurementListView)
+            models.Index(fields=['date', 'id'], name='measurement_date_id_idx'),
+            # raw series of a sensor parameter over a time range
+            models.Index(fields=['sensor', 'parameter', 'measured_at'], name='measurement_series_idx'),
+        ]
+
+
+class SensorSeriesChunk(models.Model):
+    # the readings of a sensor parameter over one UTC day, encoded by dbmanage.series
+    sensor = models.ForeignKey(IoTSensor, on_delete=models.CASCADE, related_name='series_chunks')
+    parameter = models.CharField(max_length=20)
+    day = models.DateField()
+    count = models.IntegerField()
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    data = models.BinaryField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['sensor', 'parameter', 'day'], name='sensor_series_chunk_day_unique'),
+        ]
+
+
+class SensorRollup(models.Model):
+    resolution_choices = (
+        ('h', 'Hourly'),
+        ('d', 'Daily'),
+    )
+    sensor = models.ForeignKey(IoTSensor, on_delete=models.CASCADE, related_name='rollups')
+    parameter = models.CharField(max_length=20)
+    resolution = models.CharField(max_length=1, choices=resolution_choices)
+    bucket_start = models.DateTimeField()
+    count = models.IntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # one row per bucket, also the index of series range queries
+            models.UniqueConstraint(fields=['sensor', 'parameter', 'resolution', 'bucket_start'],
+                                    name='sensor_rollup_bucket_unique'),
+        ]
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else None
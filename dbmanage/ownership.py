@@ -0,0 +1,38 @@
+from django.db.models import Max
+
+from dbmanage import lineage, versions
+from dbmanage.models import OilProduct
+
+
+def _resolve(products):
+    # roots first, so a split inherits the owner its mother was just given
+    changed = 0
+    for product in products:
+        owner = product.resolve_owner()
+        if owner == (None, None) or owner == (product.owner_id, product.owner_mill_id):
+            # bought products keep the owner given by their purchase
+            continue
+        OilProduct.objects.filter(pk=product.pk).update(owner_id=owner[0], owner_mill_id=owner[1])
+        changed += 1
+    if changed:
+        versions.bump(OilProduct)
+    return changed
+
+
+def refresh(product_pks):
+    """
+    Resolves again the owner of the products and of their storage and packaging splits, after the
+    extraction or the purchased olives they come from changed. Returns the number of changed products.
+    """
+    changed = 0
+    for pk in product_pks:
+        changed += _resolve([OilProduct.objects.get(pk=pk), *lineage.descendants(pk)])
+    return changed
+
+
+def backfill(chunk_size=1000):
+    """
+    Stores the resolved owner of every oil product. Returns the number of changed products.
+    """
+    products = OilProduct.objects.annotate(level=Max('ancestor_links__depth')).order_by('level', 'id')
+    return _resolve(products.iterator(chunk_size=chunk_size))
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from dbmanage.models import User
+
+DEFAULT_SETTINGS = {
+    # PBKDF2 iterations of new hashes; a stored hash of another cost is replaced at the next login
+    'ITERATIONS': 260000,
+    # threads hashing passwords: hashlib releases the GIL while hashing, one thread per core
+    'WORKERS': os.cpu_count() or 1,
+    # hashes running or waiting for a thread; beyond it logins and registrations get a 503
+    'MAX_PENDING': 64,
+}
+
+
+def get_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'PASSWORD_HASHING', {}))
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """
+    Django's PBKDF2 hasher with the iterations of the PASSWORD_HASHING setting.
+    """
+
+    @property
+    def iterations(self):
+        return get_settings()['ITERATIONS']
+
+
+class Saturated(Exception):
+    pass
+
+
+class HashingPool:
+    """
+    Runs password hashing on a fixed number of threads, away from the event loop and from the
+    thread the sync views share under ASGI. Callers are refused with Saturated once `max_pending`
+    hashes are queued, so a burst of logins is answered with 503s instead of piling up.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hashing')
+        self.max_pending = max_pending
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise Saturated
+            self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                options = get_settings()
+                _pool = HashingPool(options['WORKERS'], options['MAX_PENDING'])
+    return _pool
+
+
+async def hash_password(password):
+    """
+    make_password() on the hashing pool. Raises Saturated.
+    """
+    return await get_pool().run(hashers.make_password, password)
+
+
+def _verify(password, encoded):
+    # (password matches, new hash when the stored one is of a legacy hasher or of another cost)
+    upgraded = []
+    valid = hashers.check_password(password, encoded, setter=lambda raw: upgraded.append(hashers.make_password(raw)))
+    return valid, upgraded[0] if upgraded else None
+
+
+async def authenticate(email, password):
+    """
+    The user of `email` if `password` is theirs, else None: ModelBackend.authenticate() with the
+    hashing on the pool. The hash of a password checked against a legacy hasher or another cost is
+    replaced by one of the current settings. Raises Saturated.
+    """
+    if not email or password is None:
+        return None
+    user = await sync_to_async(User.objects.filter(email=email).first)()
+    if user is None:
+        # as long as a wrong password, so the response does not tell whether the email exists
+        await hash_password(password)
+        return None
+    valid, upgraded = await get_pool().run(_verify, password, user.password)
+    if not valid:
+        return None
+    if upgraded:
+        # unless another login upgraded it meanwhile
+        await sync_to_async(User.objects.filter(pk=user.pk, password=user.password).update)(password=upgraded)
+        user.password = upgraded
+    return user
+
+
+@receiver(setting_changed)
+def reset_pool(setting, **kwargs):
+    global _pool
+    if setting == 'PASSWORD_HASHING' and _pool is not None:
+        _pool.shutdown()
+        _pool = None
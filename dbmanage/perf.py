@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.serializers import BaseSerializer
+
+DEFAULT_SETTINGS = {
+    # requests kept per URL name for the percentiles of /_perf/
+    'SAMPLE_SIZE': 1000,
+    # False: measured and summarized, without the Server-Timing header in the responses
+    'SERVER_TIMING': True,
+}
+
+PERCENTILES = (50, 95, 99)
+
+
+def get_settings():
+    return dict(DEFAULT_SETTINGS, **getattr(settings, 'PERFORMANCE_MONITOR', {}))
+
+
+class RequestTimings:
+    __slots__ = ('queries', 'db', 'serializer', 'serializing', 'view_started', 'view')
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.serializing = False
+        self.view_started = None
+        self.view = 0.0
+
+
+# timings of the request being handled, read by the query and serializer hooks below
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db += time.perf_counter() - started
+        timings.queries += 1
+
+
+@receiver(connection_created)
+def instrument_connection(connection, **kwargs):
+    # first, so that the execute_wrapper() contexts opened around the first query still pop their own
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+_serializer_data = BaseSerializer.data
+
+
+def _timed_serializer_data(serializer):
+    timings = _current.get()
+    # the serializers used while serializing are counted with the outer one
+    if timings is None or timings.serializing:
+        return _serializer_data.fget(serializer)
+    timings.serializing = True
+    started = time.perf_counter()
+    try:
+        return _serializer_data.fget(serializer)
+    finally:
+        timings.serializer += time.perf_counter() - started
+        timings.serializing = False
+
+
+def install():
+    """
+    Times the .data of the DRF serializers; Serializer and ListSerializer both go through
+    BaseSerializer.data. Called once, when the application is ready.
+    """
+    BaseSerializer.data = property(_timed_serializer_data)
+
+
+def percentile(ordered, rank):
+    # nearest rank of sorted values
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+class PerformanceMonitor:
+    """
+    The timings of the last `sample_size` requests of each URL name, in ring buffers of the process.
+    """
+    fields = ('total_ms', 'view_ms', 'db_ms', 'queries', 'serializer_ms')
+
+    def __init__(self, sample_size=1000):
+        self.sample_size = sample_size
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, total, timings):
+        sample = (total * 1000, timings.view * 1000, timings.db * 1000, timings.queries, timings.serializer * 1000)
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.sample_size)
+            samples.append(sample)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self):
+        """
+        {URL name: requests, sampled requests and the percentiles of each timing}, slowest p95 first.
+        """
+        with self._lock:
+            snapshot = {name: (self._counts[name], list(samples)) for name, samples in self._samples.items()}
+        summary = {}
+        for name, (count, samples) in snapshot.items():
+            entry = {'requests': count, 'sampled': len(samples)}
+            for field, values in zip(self.fields, zip(*samples)):
+                ordered = sorted(values)
+                entry[field] = {f'p{rank}': round(percentile(ordered, rank), 2) for rank in PERCENTILES}
+            summary[name] = entry
+        return dict(sorted(summary.items(), key=lambda item: item[1]['total_ms']['p95'], reverse=True))
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_monitor():
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = PerformanceMonitor(sample_size=get_settings()['SAMPLE_SIZE'])
+    return _monitor
+
+
+def server_timing(total, timings):
+    return ', '.join((
+        f'db;dur={timings.db * 1000:.1f};desc="{timings.queries} queries"',
+        f'serializer;dur={timings.serializer * 1000:.1f}',
+        f'view;dur={timings.view * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}',
+    ))
+
+
+class ServerTimingMiddleware:
+    """
+    Measures each request: queries and their time, serializer time, view time (from the call of the
+    view to its response, rendering included) and total time. They are added to the response as a
+    Server-Timing header and to the monitor under the URL name of the view. First in MIDDLEWARE, so
+    that the total covers the other middleware. Runs in the mode of the handler, sync or async.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # marks the instance as a coroutine function for Django, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        request.timings = RequestTimings()
+        token = _current.set(request.timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        request.timings = RequestTimings()
+        token = _current.set(request.timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view_started = time.perf_counter()
+
+    def finish(self, request, response, started):
+        timings = request.timings
+        now = time.perf_counter()
+        if timings.view_started is not None:
+            timings.view = now - timings.view_started
+        total = now - started
+        if request.resolver_match is not None:
+            get_monitor().add(request.resolver_match.view_name, total, timings)
+        if get_settings()['SERVER_TIMING']:
+            response['Server-Timing'] = server_timing(total, timings)
+        return response
+
+
+@receiver(setting_changed)
+def reset_monitor(setting, **kwargs):
+    global _monitor
+    if setting == 'PERFORMANCE_MONITOR':
+        _monitor = None
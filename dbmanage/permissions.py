@@ -2,6 +2,11 @@ from rest_framework.permissions import BasePermission
 from rest_framework import permissions
 
 
+def manages(user, oil_mill_id):
+    # the user is the manager of the mill, from the claims of its token (no query)
+    return oil_mill_id is not None and oil_mill_id == user.oil_mill_id
+
+
 class IsFarmer(BasePermission):
     def has_permission(self, request, view):
         # Check if the user is a farmer
@@ -39,50 +44,39 @@ class IsVisitor(BasePermission):
 class IsOwnerOfOliveGrove(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Check if the request user is the owner of the olive grove
-        return obj.farmer == request.user
+        return obj.farmer_id == request.user.id
 
 
 class IsOwnerOfHarvest(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Check if the request user is the owner of the olive grove
-        return obj.grove.farmer == request.user
+        return obj.grove.farmer_id == request.user.id
 
 
 class IsOwnerOfPurchasedOlive(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Check if the request user is the owner of the PurchasedOlive object
-        return obj.mill.mill_manager == request.user
+        return manages(request.user, obj.mill_id)
 
 
 class IsOwnerOfMachine(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # check if the request user is the owner of the Machine
-        return obj.oil_mill.mill_manager == request.user
+        return manages(request.user, obj.oil_mill_id)
 
 
 class IsOwnerOfStorageArea(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        # Check if the request user is the owner of the StorageArea function of his role, farmer or mill_manager
+        # Check if the request user is the owner of the StorageArea function of their role, farmer or mill_manager
         if request.user.role == 'farmer':
-            return obj.farmer == request.user
+            return obj.farmer_id == request.user.id
         elif request.user.role == 'mill manager':
-            return obj.oil_mill.mill_manager == request.user
+            return manages(request.user, obj.oil_mill_id)
         else:
             return False
 
 
 class IsOwnerOfOilProduct(permissions.BasePermission):
-    def has_permission(self, request, view, obj):
-        oil_product = request.data.get('oil_product')
-        owner_instance = obj.get_owner_instance()
-        if request.user.role == 'farmer':
-            return (
-                    owner_instance == request.user
-            )
-
-        elif request.user.role == 'mill manager':
-            return (
-                owner_instance.mill_manager == request.user
-            )
-        else:
-            return False
+    def has_object_permission(self, request, view, obj):
+        # Check if the request user owns the oil product, directly or as manager of the owning mill
+        return obj.owner_id == request.user.id
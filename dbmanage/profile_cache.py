@@ -0,0 +1,183 @@
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+DEFAULT_SETTINGS = {
+    'BACKEND': 'dbmanage.profile_cache.LRUBackend',
+    'OPTIONS': {},
+}
+
+
+class LRUBackend:
+    """
+    In-process LRU, the default. Every worker process has its own copy and only sees the
+    invalidations of its own process, bounded by `timeout`: deployments with several workers should
+    use DjangoCacheBackend on a shared cache.
+    """
+
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                expires, value = entry
+                if expires < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        # values are stored pickled, so callers never share (and mutate) a cached object
+        return {key: pickle.loads(value) for key, value in found.items()}
+
+    def set_many(self, mapping):
+        self._store(mapping, replace=True)
+
+    def add_many(self, mapping):
+        self._store(mapping, replace=False)
+
+    def _store(self, mapping, replace):
+        expires = time.monotonic() + self.timeout
+        with self._lock:
+            for key, value in mapping.items():
+                if not replace and key in self._entries and self._entries[key][0] >= time.monotonic():
+                    continue
+                self._entries[key] = (expires, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """
+    Shared backend on one of the CACHES aliases (memcached, redis...), for multi-worker deployments.
+    """
+
+    def __init__(self, alias='default', timeout=3600):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, mapping):
+        self.cache.set_many(mapping, timeout=self.timeout)
+
+    def add_many(self, mapping):
+        for key, value in mapping.items():
+            self.cache.add(key, value, timeout=self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+@lru_cache(maxsize=None)
+def _schema(serializer_class):
+    # cached representations of an older serializer layout are never read back after a deploy
+    fields = ','.join(serializer_class().fields)
+    return hashlib.md5(f'{serializer_class.__module__}.{serializer_class.__qualname__}:{fields}'.encode()).hexdigest()[:8]
+
+
+class ProfileCache:
+    """
+    Versioned read-through cache of serialized profiles. Every profile (model label, pk) has a
+    version token stored in the backend and representations are stored under the token they were
+    built with. Invalidating replaces the token, so a reader that loaded the profile before a write
+    committed can only store its result under a dead key.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @staticmethod
+    def version_key(model, pk):
+        return f'profile:v:{model._meta.label_lower}:{pk}'
+
+    def data_key(self, serializer_class, pk, token):
+        return f'profile:{_schema(serializer_class)}:{pk}:{token}'
+
+    def versions(self, model, pks):
+        keys = {pk: self.version_key(model, pk) for pk in pks}
+        tokens = self.backend.get_many(list(keys.values()))
+        missing = {key: uuid.uuid4().hex[:12] for key in keys.values() if key not in tokens}
+        if missing:
+            # add, not set: a token created meanwhile by another reader or an invalidation wins
+            self.backend.add_many(missing)
+            tokens.update(self.backend.get_many(list(missing)))
+        return {pk: tokens.get(key) for pk, key in keys.items()}
+
+    def fetch(self, serializer_class, pks, load):
+        """
+        Returns {pk: representation} for `pks`. The missing ones are built by `load(pks)`, which
+        returns {pk: representation}, and stored.
+        """
+        model = serializer_class.Meta.model
+        tokens = self.versions(model, pks)
+        keys = {pk: self.data_key(serializer_class, pk, token) for pk, token in tokens.items() if token}
+        cached = self.backend.get_many(list(keys.values()))
+        found = {pk: cached[key] for pk, key in keys.items() if key in cached}
+        missing = [pk for pk in pks if pk not in found]
+        if missing:
+            loaded = load(missing)
+            self.backend.set_many({keys[pk]: data for pk, data in loaded.items() if pk in keys})
+            found.update(loaded)
+        return found
+
+    def invalidate(self, model, pks):
+        """
+        Replaces the version token of the profiles, now and again once the transaction commits.
+        """
+        def bump():
+            self.backend.set_many({self.version_key(model, pk): uuid.uuid4().hex[:12] for pk in pks})
+
+        if pks:
+            bump()
+            transaction.on_commit(bump)
+
+    def clear(self):
+        self.backend.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = dict(DEFAULT_SETTINGS, **getattr(settings, 'PROFILE_CACHE', {}))
+                backend = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+                _cache = ProfileCache(backend)
+    return _cache
+
+
+@receiver(setting_changed)
+def reset_cache(setting, **kwargs):
+    global _cache
+    if setting in ('PROFILE_CACHE', 'CACHES'):
+        _cache = None
@@ -0,0 +1,122 @@
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from rest_framework import status
+
+from dbmanage import dispatcher, matching, search, versions
+from dbmanage.models import OlivePurchaseRequest, OliveSaleOffer, PurchasedOlive
+
+# quantities are floats: a remainder below this is a sold out offer
+QUANTITY_TOLERANCE = 1e-9
+
+
+class PurchaseConfirmationError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _reserve(offer_id, quantity):
+    """
+    Takes `quantity` from the offer in one conditional UPDATE: nothing is written when the offer is
+    not available anymore (closed or cancelled) or has less left, and the offer is closed in the same
+    statement when it is sold out. Returns whether the quantity was taken.
+    """
+    sold_out = When(available_quantity_for_sell__lte=quantity + QUANTITY_TOLERANCE, then=Value(0.0))
+    return OliveSaleOffer.objects.filter(
+        pk=offer_id,
+        offer_status='A',
+        available_quantity_for_sell__gte=quantity - QUANTITY_TOLERANCE,
+    ).update(
+        available_quantity_for_sell=Case(sold_out, default=F('available_quantity_for_sell') - quantity),
+        offer_status=Case(When(available_quantity_for_sell__lte=quantity + QUANTITY_TOLERANCE, then=Value('Cl')),
+                          default=F('offer_status')),
+    ) == 1
+
+
+def _refusal(request_id, mill_manager_id):
+    # why the conditional update of the request matched nothing
+    purchase_request = OlivePurchaseRequest.objects.filter(pk=request_id).values(
+        'request_status', 'mill__mill_manager_id').first()
+    if purchase_request is None:
+        return PurchaseConfirmationError('Olive Purchase Request does not exist', status.HTTP_404_NOT_FOUND)
+    if purchase_request['mill__mill_manager_id'] != mill_manager_id:
+        return PurchaseConfirmationError('You do not have permission to confirm this purchase',
+                                         status.HTTP_403_FORBIDDEN)
+    if purchase_request['request_status'] == 'B':
+        return PurchaseConfirmationError('This purchase is already confirmed', status.HTTP_409_CONFLICT)
+    return PurchaseConfirmationError('Only purchase requests approved by the farmer can be confirmed',
+                                     status.HTTP_409_CONFLICT)
+
+
+def _shortage(offer_id):
+    # why the conditional update of the offer matched nothing
+    if OliveSaleOffer.objects.filter(pk=offer_id, offer_status='A').exists():
+        return PurchaseConfirmationError('The sale offer does not have the requested quantity left',
+                                         status.HTTP_409_CONFLICT)
+    return PurchaseConfirmationError('The sale offer is no longer available', status.HTTP_409_CONFLICT)
+
+
+@transaction.atomic
+def confirm_olive_purchases(request_ids, mill_manager_id):
+    """
+    Confirms approved olive purchase requests of the mill managed by `mill_manager_id`, in one
+    transaction: each request is marked bought and its quantity taken from the sale offer with
+    conditional UPDATEs (first, so SQLite takes its write lock before reading anything), then the
+    purchased olives are inserted in one batch. The farmer notifications go through the dispatcher,
+    off the request path.
+
+    Raises PurchaseConfirmationError, and nothing is written, when a request cannot be confirmed, its
+    offer is not available anymore or does not have the requested quantity left. Returns the PurchasedOlive objects.
+    """
+    today = timezone.now().date()
+    for request_id in request_ids:
+        confirmed = OlivePurchaseRequest.objects.filter(
+            pk=request_id, request_status='A', mill__mill_manager_id=mill_manager_id,
+        ).update(request_status='B', status_update_date=today)
+        if not confirmed:
+            raise _refusal(request_id, mill_manager_id)
+
+    purchase_requests = list(OlivePurchaseRequest.objects.filter(pk__in=request_ids).select_related(
+        'olive_sale_offer__harvest__grove').order_by('id'))
+    for purchase_request in purchase_requests:
+        if not _reserve(purchase_request.olive_sale_offer_id, purchase_request.requested_quantity):
+            raise _shortage(purchase_request.olive_sale_offer_id)
+
+    # an offer closed by the batch was sold out by the last of its requests
+    last_request = {purchase_request.olive_sale_offer_id: purchase_request.pk for purchase_request in purchase_requests}
+    closed = set(OliveSaleOffer.objects.filter(pk__in=last_request, offer_status='Cl').values_list('id', flat=True))
+    purchased_olives, notifications = [], []
+    for purchase_request in purchase_requests:
+        harvest = purchase_request.olive_sale_offer.harvest
+        grove = harvest.grove
+        purchased_olives.append(PurchasedOlive(
+            olive_quantity=purchase_request.requested_quantity,
+            quantity_unit=purchase_request.quantity_unit,
+            purchase_date=today,
+            olives_variety=grove.olives_variety,
+            maturity_index=harvest.maturity_index,
+            characterization=harvest.characterization,
+            classification_by_maturity=harvest.classification_by_maturity,
+            cropping_system=grove.cropping_system,
+            practice=grove.practice,
+            mill_id=purchase_request.mill_id,
+            olive_purchase_request=purchase_request,
+        ))
+        if purchase_request.olive_sale_offer_id in closed and last_request[purchase_request.olive_sale_offer_id] == \
+                purchase_request.pk:
+            message = f'The purchase of {purchase_request.requested_quantity} {purchase_request.quantity_unit} ' \
+                      f'of olives has been confirmed and your sale offer is closed.'
+        else:
+            message = f'The purchase of {purchase_request.requested_quantity} {purchase_request.quantity_unit} ' \
+                      f'of olives has been confirmed and your sale offer is remaining available.'
+        notifications.append({'user_id': grove.farmer_id, 'message': message})
+    PurchasedOlive.objects.bulk_create(purchased_olives)
+    dispatcher.notify_many(notifications)
+    # the offers were updated without signals: the closed ones leave the search index with this
+    # transaction, the matching engine reads the offers back after it
+    search.remove_offers(search.OLIVE, closed)
+    transaction.on_commit(lambda: matching.get_engine().refresh_offers(list(last_request)))
+    versions.bump(OlivePurchaseRequest, OliveSaleOffer, PurchasedOlive)
+    return purchased_olives
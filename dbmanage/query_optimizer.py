@@ -0,0 +1,129 @@
+from functools import lru_cache
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def _get_relation(model, name):
+    """
+    Returns the model field (forward or reverse) reached through the attribute `name`, or None.
+    """
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        field = None
+    if field is not None and field.is_relation:
+        return field
+    # reverse relations without a related_name are reached through their accessor ('xxx_set')
+    for related_object in model._meta.related_objects:
+        if related_object.get_accessor_name() == name:
+            return related_object
+    return None
+
+
+def _needs_instance(field):
+    # PrimaryKeyRelatedField only reads the '<name>_id' column, every other related field needs the object
+    use_pk_only = getattr(field, 'use_pk_only_optimization', None)
+    return not (use_pk_only and use_pk_only())
+
+
+def _build_plan(serializer, model, prefix=''):
+    """
+    Walks the fields of a serializer instance and returns a (select_related, prefetch_related) plan.
+    Prefetch entries are (lookup, related model, nested plan) tuples, so fresh Prefetch objects can be
+    built for every queryset.
+    """
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            if isinstance(field, serializers.BaseSerializer):
+                nested_select, nested_prefetch = _build_plan(field, model, prefix)
+                select.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+            continue
+        if len(field.source_attrs) != 1:
+            continue
+        relation = _get_relation(model, field.source_attrs[0])
+        if relation is None:
+            continue
+        lookup = prefix + field.source_attrs[0]
+        related_model = relation.related_model
+
+        if relation.many_to_one or relation.one_to_one:
+            if getattr(field, 'cached_profile', False):
+                # served from dbmanage.profile_cache, only the foreign key column is read
+                continue
+            if isinstance(field, serializers.BaseSerializer):
+                select.append(lookup)
+                nested_select, nested_prefetch = _build_plan(field, related_model, lookup + '__')
+                select.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+            elif isinstance(field, RelatedField) and _needs_instance(field):
+                select.append(lookup)
+        elif relation.many_to_many or relation.one_to_many:
+            if isinstance(field, serializers.ListSerializer):
+                nested_select, nested_prefetch = _build_plan(field.child, related_model)
+                prefetch.append((lookup, related_model, (_compact(nested_select), tuple(nested_prefetch))))
+            elif isinstance(field, ManyRelatedField):
+                prefetch.append((lookup, related_model, None))
+    return select, prefetch
+
+
+def _compact(select):
+    # keep the order stable and drop paths already covered by a longer one
+    return tuple(path for path in dict.fromkeys(select)
+                 if not any(other.startswith(path + '__') for other in select))
+
+
+@lru_cache(maxsize=None)
+def get_query_plan(serializer_class):
+    """
+    Returns the cached (select_related, prefetch_related) plan for a ModelSerializer class.
+    """
+    meta = getattr(serializer_class, 'Meta', None)
+    model = getattr(meta, 'model', None)
+    if model is None:
+        return (), ()
+    select, prefetch = _build_plan(serializer_class(), model)
+    return _compact(select), tuple(prefetch)
+
+
+def _apply_plan(queryset, plan):
+    select, prefetch = plan
+    if select:
+        queryset = queryset.select_related(*select)
+    lookups = []
+    for lookup, related_model, nested_plan in prefetch:
+        if nested_plan is None:
+            lookups.append(lookup)
+        else:
+            nested_queryset = _apply_plan(related_model._default_manager.all(), nested_plan)
+            lookups.append(Prefetch(lookup, queryset=nested_queryset))
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
+
+
+def optimize_queryset(queryset, serializer_class):
+    """
+    Adds the joins and prefetches needed to serialize `queryset` with `serializer_class`,
+    so the number of queries does not depend on the number of rows.
+    """
+    model = getattr(getattr(serializer_class, 'Meta', None), 'model', None)
+    if model is None or not issubclass(queryset.model, model):
+        return queryset
+    return _apply_plan(queryset, get_query_plan(serializer_class))
+
+
+class SerializerQueryOptimizationBackend(BaseFilterBackend):
+    """
+    Applies optimize_queryset() to the queryset of every GenericAPIView (list and detail).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        return optimize_queryset(queryset, view.get_serializer_class())
@@ -0,0 +1,234 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import connection
+from django.db.models import Count, Max, Min, Sum
+
+from dbmanage import series as chunk_store
+from dbmanage.models import SensorMeasurement, SensorRollup, SensorSeriesChunk
+
+HOURLY, DAILY, RAW = 'h', 'd', 'raw'
+BUCKET_SIZES = {HOURLY: timedelta(hours=1), DAILY: timedelta(days=1)}
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def measurement_time(day, measured_at=None):
+    """
+    Returns the timestamp a measurement is bucketed at: `measured_at`, or midnight UTC of `day` for
+    measurements that only carry a date.
+    """
+    if measured_at is not None:
+        return measured_at
+    return datetime.combine(day, time.min, tzinfo=dt_timezone.utc)
+
+
+def bucket_start(timestamp, resolution):
+    timestamp = timestamp.astimezone(dt_timezone.utc)
+    if resolution == DAILY:
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def aggregate(measurements):
+    """
+    Folds (sensor pk, parameter, value, timestamp) tuples into per bucket [count, total, min, max]
+    for both resolutions, keyed by (sensor pk, parameter, resolution, bucket start).
+    """
+    # buckets are keyed by epoch hour/day while folding, one datetime is built per bucket at the end
+    hours = {}
+    for sensor_pk, parameter, value, timestamp in measurements:
+        value = float(value)
+        key = (sensor_pk, parameter, int(timestamp.timestamp() // 3600))
+        bucket = hours.get(key)
+        if bucket is None:
+            hours[key] = [1, value, value, value]
+        else:
+            bucket[0] += 1
+            bucket[1] += value
+            if value < bucket[2]:
+                bucket[2] = value
+            if value > bucket[3]:
+                bucket[3] = value
+    days = {}
+    for (sensor_pk, parameter, hour), (count, total, minimum, maximum) in hours.items():
+        key = (sensor_pk, parameter, hour // 24)
+        bucket = days.get(key)
+        if bucket is None:
+            days[key] = [count, total, minimum, maximum]
+        else:
+            bucket[0] += count
+            bucket[1] += total
+            bucket[2] = min(bucket[2], minimum)
+            bucket[3] = max(bucket[3], maximum)
+    buckets = {}
+    for resolution, folded in ((HOURLY, hours), (DAILY, days)):
+        size = BUCKET_SIZES[resolution]
+        for (sensor_pk, parameter, number), bucket in folded.items():
+            buckets[(sensor_pk, parameter, resolution, _EPOCH + size * number)] = bucket
+    return buckets
+
+
+def _upsert_sql():
+    ops = connection.ops
+    table = ops.quote_name(SensorRollup._meta.db_table)
+    column = {name: ops.quote_name(SensorRollup._meta.get_field(name).column)
+              for name in ('sensor', 'parameter', 'resolution', 'bucket_start', 'count', 'total', 'minimum',
+                           'maximum')}
+    # scalar min()/max() of two values: SQLite overloads the aggregates, PostgreSQL has LEAST/GREATEST
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    return (
+        f"INSERT INTO {table} ({', '.join(column.values())}) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) "
+        f"ON CONFLICT ({column['sensor']}, {column['parameter']}, {column['resolution']}, {column['bucket_start']}) "
+        f"DO UPDATE SET {column['count']} = {table}.{column['count']} + excluded.{column['count']}, "
+        f"{column['total']} = {table}.{column['total']} + excluded.{column['total']}, "
+        f"{column['minimum']} = {least}({table}.{column['minimum']}, excluded.{column['minimum']}), "
+        f"{column['maximum']} = {greatest}({table}.{column['maximum']}, excluded.{column['maximum']})"
+    )
+
+
+def apply_measurements(measurements):
+    """
+    Adds (sensor pk, parameter, value, timestamp) tuples to the hourly and daily rollups. Buckets are
+    merged by the database in a single upsert statement, so concurrent writers never lose an update.
+    """
+    buckets = aggregate(measurements)
+    if not buckets:
+        return
+    ops = connection.ops
+    rows = [
+        (sensor_pk, parameter, resolution, ops.adapt_datetimefield_value(start), count, total, minimum, maximum)
+        for (sensor_pk, parameter, resolution, start), (count, total, minimum, maximum) in buckets.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), rows)
+
+
+def refresh_buckets(sensor_pk, parameter, timestamp):
+    """
+    Recomputes from the raw rows the hourly and daily buckets containing `timestamp`, after a
+    measurement was changed or deleted (a minimum or maximum cannot be subtracted).
+    """
+    for resolution, size in BUCKET_SIZES.items():
+        start = bucket_start(timestamp, resolution)
+        stats = SensorMeasurement.objects.filter(
+            sensor_id=sensor_pk, parameter=parameter, measured_at__gte=start, measured_at__lt=start + size,
+        ).aggregate(count=Count('id'), total=Sum('value'), minimum=Min('value'), maximum=Max('value'))
+        bucket = SensorRollup.objects.filter(sensor_id=sensor_pk, parameter=parameter, resolution=resolution,
+                                             bucket_start=start)
+        if not stats['count']:
+            bucket.delete()
+            continue
+        values = {name: float(stats[name]) for name in ('total', 'minimum', 'maximum')}
+        if not bucket.update(count=stats['count'], **values):
+            SensorRollup.objects.create(sensor_id=sensor_pk, parameter=parameter, resolution=resolution,
+                                        bucket_start=start, count=stats['count'], **values)
+
+
+def backfill_measured_at():
+    """
+    Sets the timestamp of measurements stored with a date only, so they show up in raw series.
+    Returns the number of updated rows.
+    """
+    pending = SensorMeasurement.objects.filter(measured_at__isnull=True)
+    updated = 0
+    for day in pending.order_by().values_list('date', flat=True).distinct():
+        updated += pending.filter(date=day).update(measured_at=measurement_time(day))
+    return updated
+
+
+def rebuild(chunk_size=5000):
+    """
+    Recomputes every rollup from the raw measurements and the chunked series, returns the number
+    of readings read.
+    """
+    SensorRollup.objects.all().delete()
+    total = 0
+    chunk = []
+    rows = SensorMeasurement.objects.order_by().values_list('sensor_id', 'parameter', 'value', 'date', 'measured_at')
+    for sensor_pk, parameter, value, day, measured_at in rows.iterator(chunk_size=chunk_size):
+        chunk.append((sensor_pk, parameter, value, measurement_time(day, measured_at)))
+        if len(chunk) >= chunk_size:
+            apply_measurements(chunk)
+            total += len(chunk)
+            chunk = []
+    apply_measurements(chunk)
+    total += len(chunk)
+    chunks = SensorSeriesChunk.objects.order_by().values_list('sensor_id', 'parameter', 'data')
+    for sensor_pk, parameter, data in chunks.iterator(chunk_size=50):
+        timestamps, values = chunk_store.decode(data)
+        apply_measurements([(sensor_pk, parameter, value, chunk_store.from_millis(millis))
+                            for millis, value in zip(timestamps, values)])
+        total += len(timestamps)
+    return total
+
+
+def choose_resolution(sensor_pk, parameter, start, end, points, chunked=False):
+    """
+    Returns the finest resolution whose number of points over [start, end) fits in `points`: raw
+    readings when there are few enough, else hourly, else daily buckets.
+    """
+    span = end - start
+    if span > BUCKET_SIZES[HOURLY] * points:
+        return DAILY
+    if chunked:
+        raw = chunk_store.count_readings(sensor_pk, parameter, start, end)
+    else:
+        # the count is bounded by the budget, it never scans more than points + 1 index entries
+        raw = _raw_queryset(sensor_pk, parameter, start, end)[:points + 1].count()
+    return RAW if raw <= points else HOURLY
+
+
+def _raw_queryset(sensor_pk, parameter, start, end):
+    return SensorMeasurement.objects.filter(sensor_id=sensor_pk, parameter=parameter,
+                                            measured_at__gte=start, measured_at__lt=end)
+
+
+def series(sensor_pk, parameter, start, end, points=DEFAULT_POINTS, resolution=None, chunked=False):
+    """
+    Returns (resolution, points) for a sensor parameter over [start, end), at most `points` of them.
+    Every point is a dict with the bucket start `t` and the count/min/max/avg of the bucket; raw
+    points are buckets of one. Raw readings of `chunked` sensors are read from their compressed chunks.
+
+    When the range has more hourly or daily buckets than `points`, consecutive buckets are merged into
+    buckets of n hours or days, and the resolution is returned as e.g. '3d'. Raw readings asked for
+    explicitly are cut at `points`.
+    """
+    if resolution is None:
+        resolution = choose_resolution(sensor_pk, parameter, start, end, points, chunked=chunked)
+    if resolution == RAW and chunked:
+        readings = islice(chunk_store.iter_readings(sensor_pk, parameter, start, end), points)
+        return RAW, [{'t': timestamp, 'count': 1, 'min': value, 'max': value, 'avg': value}
+                     for timestamp, value in readings]
+    if resolution == RAW:
+        rows = _raw_queryset(sensor_pk, parameter, start, end).order_by('measured_at')
+        return RAW, [{'t': measured_at, 'count': 1, 'min': float(value), 'max': float(value), 'avg': float(value)}
+                     for measured_at, value in rows.values_list('measured_at', 'value')[:points]]
+    # the bucket overlapping the start of the range is included
+    first = bucket_start(start, resolution)
+    size = BUCKET_SIZES[resolution]
+    buckets = -(-(end - first) // size)
+    factor = -(-buckets // points)
+    rows = SensorRollup.objects.filter(sensor_id=sensor_pk, parameter=parameter, resolution=resolution,
+                                       bucket_start__gte=first, bucket_start__lt=end).order_by('bucket_start')
+    rows = rows.values_list('bucket_start', 'count', 'total', 'minimum', 'maximum')
+    if factor > 1:
+        rows = _merge(rows, first, size * factor)
+        resolution = f'{factor}{resolution}'
+    return resolution, [{'t': start_at, 'count': count, 'min': minimum, 'max': maximum, 'avg': total / count}
+                        for start_at, count, total, minimum, maximum in rows]
+
+
+def _merge(rows, first, size):
+    # folds ordered (bucket start, count, total, min, max) rows into buckets of `size` from `first`
+    merged = []
+    for start_at, count, total, minimum, maximum in rows:
+        start_at = first + (start_at - first) // size * size
+        if merged and merged[-1][0] == start_at:
+            previous = merged[-1]
+            merged[-1] = (start_at, previous[1] + count, previous[2] + total, min(previous[3], minimum),
+                          max(previous[4], maximum))
+        else:
+            merged.append((start_at, count, total, minimum, maximum))
+    return merged
@@ -0,0 +1,196 @@
+import re
+
+from django.db import connection
+
+from dbmanage.models import OilAnalysis, OilSaleOffer, OliveSaleOffer
+
+SEARCH_TABLE = 'dbmanage_offer_search'
+
+# indexed columns of the FTS5 table, in table order
+COLUMNS = ('kind', 'offer_code', 'variety', 'region', 'grove', 'certificate', 'packaging', 'quality', 'details')
+FACETS = ('kind', 'variety', 'packaging', 'quality')
+# bm25 weights, in column order: matches on variety/grove/region rank above free text details
+WEIGHTS = (0.0, 1.0, 4.0, 3.0, 3.0, 2.0, 2.0, 2.0, 1.0)
+
+OLIVE, OIL = 'olive', 'oil'
+_KIND_BITS = {OLIVE: 0, OIL: 1}
+
+
+def is_available():
+    # the side index is an SQLite FTS5 virtual table
+    return connection.vendor == 'sqlite'
+
+
+def _rowid(kind, offer_id):
+    # one rowid space for both offer tables, so updates and deletes are rowid lookups
+    return offer_id * 2 + _KIND_BITS[kind]
+
+
+def _from_rowid(rowid):
+    return (OIL if rowid & 1 else OLIVE), rowid >> 1
+
+
+def _join(*values):
+    return ' '.join(str(value) for value in values if value)
+
+
+def olive_offer_document(offer):
+    grove = offer.harvest.grove
+    return {
+        'kind': OLIVE,
+        'offer_code': offer.offer_code,
+        'variety': grove.olives_variety,
+        'region': grove.address,
+        'grove': grove.name,
+        'certificate': '',
+        'packaging': '',
+        'quality': '',
+        'details': _join(grove.get_practice_display(), grove.get_cropping_system_display(),
+                         offer.harvest.get_maturity_index_display(), offer.get_transportation_display()),
+    }
+
+
+def oil_offer_document(offer, analysis=None):
+    product = offer.oil_product
+    operation = product.extraction_operation
+    grove = operation.harvest.grove if operation and operation.harvest else None
+    packaging = getattr(product, 'packaging', None)
+    seller = offer.oil_mill or offer.farmer
+    quality = analysis.get_oil_quality_display() if analysis else product.get_oil_quality_display()
+    return {
+        'kind': OIL,
+        'offer_code': offer.offer_code,
+        'variety': grove.olives_variety if grove else '',
+        'region': _join(getattr(seller, 'address', ''), getattr(seller, 'country', '')),
+        'grove': grove.name if grove else '',
+        'certificate': _join(offer.oil_mill.quality_certificate if offer.oil_mill else '',
+                             packaging.factory_certificate if packaging else ''),
+        'packaging': offer.get_type_of_packaging_display(),
+        'quality': quality,
+        'details': _join(offer.packaging_volume, offer.get_transportation_display(),
+                         analysis.lab_name if analysis else ''),
+    }
+
+
+def _latest_analyses(product_ids):
+    latest = {}
+    for analysis in OilAnalysis.objects.filter(oil_product_id__in=product_ids).order_by('oil_product_id', 'id'):
+        latest[analysis.oil_product_id] = analysis
+    return latest
+
+
+def _write(rows):
+    """
+    Replaces the documents of `rows`, a list of (rowid, document) pairs.
+    """
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(rowid,) for rowid, document in rows])
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(COLUMNS)}) "
+            f"VALUES (%s, {', '.join(['%s'] * len(COLUMNS))})",
+            [(rowid,) + tuple(document[column] for column in COLUMNS) for rowid, document in rows],
+        )
+
+
+def index_olive_offers(queryset):
+    """
+    Indexes the available offers of `queryset` and unindexes the closed and cancelled ones.
+    """
+    if not is_available():
+        return
+    offers = list(queryset.select_related('harvest__grove'))
+    _write([(_rowid(OLIVE, offer.id), olive_offer_document(offer)) for offer in offers if offer.offer_status == 'A'])
+    remove_offers(OLIVE, [offer.id for offer in offers if offer.offer_status != 'A'])
+
+
+def index_oil_offers(queryset):
+    """
+    Indexes the available offers of `queryset` and unindexes the closed and cancelled ones.
+    """
+    if not is_available():
+        return
+    offers = list(queryset.select_related('oil_product__extraction_operation__harvest__grove',
+                                          'oil_product__packaging', 'oil_mill', 'farmer'))
+    analyses = _latest_analyses({offer.oil_product_id for offer in offers if offer.offer_status == 'A'})
+    _write([(_rowid(OIL, offer.id), oil_offer_document(offer, analyses.get(offer.oil_product_id)))
+            for offer in offers if offer.offer_status == 'A'])
+    remove_offers(OIL, [offer.id for offer in offers if offer.offer_status != 'A'])
+
+
+def remove_offers(kind, offer_ids):
+    if not is_available() or not offer_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+                           [(_rowid(kind, offer_id),) for offer_id in offer_ids])
+
+
+def rebuild(chunk_size=2000):
+    """
+    Rebuilds the whole side index from the available offers, returns the number of indexed offers.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+    total = 0
+    for model, index in ((OliveSaleOffer, index_olive_offers), (OilSaleOffer, index_oil_offers)):
+        ids = list(model.objects.filter(offer_status='A').order_by('id').values_list('id', flat=True))
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            index(model.objects.filter(id__in=chunk))
+            total += len(chunk)
+    return total
+
+
+def _phrase(value):
+    return '"' + value.replace('"', '""') + '"'
+
+
+def build_match(text, filters=None):
+    """
+    Turns user input into an FTS5 MATCH expression: every word is a prefix term, and facet filters
+    become column filters so they are resolved inside the index.
+    """
+    terms = []
+    words = [_phrase(word) + '*' for word in re.findall(r'\w+', text or '')]
+    if words:
+        # free text never matches the kind column
+        terms.append(f"{{{' '.join(COLUMNS[1:])}}} : ({' AND '.join(words)})")
+    for column, value in (filters or {}).items():
+        if column in FACETS and value:
+            terms.append(f'{column} : {_phrase(value)}')
+    return ' AND '.join(terms)
+
+
+def search(text, filters=None, limit=20, offset=0, facets=FACETS):
+    """
+    Returns (results, facet counts) for a query. Results are ranked by bm25 and carry the indexed
+    document, so no row of the offer tables is read.
+    """
+    match = build_match(text, filters)
+    if not match:
+        return [], {facet: [] for facet in facets}
+    weights = ', '.join(str(weight) for weight in WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, {', '.join(COLUMNS)}, bm25({SEARCH_TABLE}, {weights}) AS score "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s ORDER BY score LIMIT %s OFFSET %s",
+            [match, limit, offset],
+        )
+        results = []
+        for row in cursor.fetchall():
+            kind, offer_id = _from_rowid(row[0])
+            document = dict(zip(COLUMNS, row[1:-1]))
+            document.update({'kind': kind, 'id': offer_id, 'score': -row[-1]})
+            results.append(document)
+
+        counts = {}
+        for facet in facets:
+            cursor.execute(
+                f"SELECT {facet}, COUNT(*) AS total FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"AND {facet} != '' GROUP BY {facet} ORDER BY total DESC LIMIT 20",
+                [match],
+            )
+            counts[facet] = [{'value': value, 'count': total} for value, total in cursor.fetchall()]
+    return results, counts
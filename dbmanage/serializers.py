@@ -1,7 +1,12 @@
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject
 from datetime import datetime, date
 from django.contrib.auth import authenticate
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Model, QuerySet
+from dbmanage import profile_cache
 from dbmanage.models import *
+from dbmanage.query_optimizer import optimize_queryset
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -23,19 +28,120 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['email', 'first_name', 'last_name', 'role', 'phone_number', 'password']
 
 
-class FarmerSerializer(serializers.ModelSerializer):
+class CachedProfileSerializerMixin:
+    """
+    Serves the representation of a profile from dbmanage.profile_cache. Nested in another
+    serializer, only the foreign key column of the parent is read: the profile row (and its join
+    with the User table) is loaded on a cache miss only, in one query for every profile of the page.
+    """
+    # read by dbmanage.query_optimizer, which then does not join the profile
+    cached_profile = True
+
+    def get_attribute(self, instance):
+        if len(self.source_attrs) == 1:
+            relation = _forward_relation(type(instance), self.source_attrs[0])
+            if relation is not None:
+                pk = getattr(instance, relation.attname)
+                return None if pk is None else PKOnlyObject(pk=pk)
+        return super().get_attribute(instance)
+
+    def to_representation(self, instance):
+        if isinstance(instance, PKOnlyObject):
+            pks = [instance.pk] + [pk for pk in self._sibling_pks() if pk != instance.pk]
+            return self._fetch(pks)[instance.pk]
+        return self._fetch([instance.pk], {instance.pk: instance})[instance.pk]
+
+    @classmethod
+    def cached_representation(cls, pk, context=None):
+        """
+        The representation of the profile `pk`, or None when it does not exist.
+        """
+        if pk is None:
+            return None
+        return cls(context=context)._fetch([pk]).get(pk)
+
+    def _fetch(self, pks, instances=None):
+        def load(missing):
+            loaded = dict(instances or {})
+            pending = [pk for pk in missing if pk not in loaded]
+            if pending:
+                queryset = optimize_queryset(self.Meta.model._default_manager.filter(pk__in=pending), type(self))
+                loaded.update((profile.pk, profile) for profile in queryset)
+            self._warm_nested_profiles(loaded.values())
+            parent = super(CachedProfileSerializerMixin, self)
+            return {pk: parent.to_representation(loaded[pk]) for pk in missing if pk in loaded}
+
+        return profile_cache.get_cache().fetch(type(self), pks, load)
+
+    def _warm_nested_profiles(self, profiles):
+        # profiles nested in this one (the manager of a mill) are fetched once for all loaded rows
+        for field in self.fields.values():
+            if isinstance(field, CachedProfileSerializerMixin) and len(field.source_attrs) == 1:
+                relation = _forward_relation(self.Meta.model, field.source_attrs[0])
+                if relation is not None:
+                    pks = {getattr(profile, relation.attname) for profile in profiles} - {None}
+                    if pks:
+                        field._fetch(sorted(pks))
+
+    def _sibling_pks(self):
+        """
+        The keys of the same profile field in the other rows of the page being serialized, found by
+        following the already loaded relations from the root instances. A cold cache then costs a
+        single query per page instead of one per row.
+        """
+        path, node = [], self
+        while node.parent is not None and not isinstance(node.parent, serializers.ListSerializer):
+            if len(node.source_attrs) != 1:
+                return []
+            path.insert(0, node.source_attrs[0])
+            node = node.parent
+        if node.parent is not None:
+            if node.parent.parent is not None:
+                # a to-many relation on the way, only the current profile is loaded
+                return []
+            node = node.parent
+        roots = node.instance
+        if not path:
+            return []
+        if isinstance(roots, QuerySet):
+            roots = roots._result_cache
+        if roots is None or isinstance(roots, Model):
+            return []
+        pks = []
+        for instance in roots:
+            for name in path[:-1]:
+                relation = _forward_relation(type(instance), name)
+                if instance is None or relation is None or not relation.is_cached(instance):
+                    instance = None
+                    break
+                instance = getattr(instance, name)
+            relation = _forward_relation(type(instance), path[-1]) if instance is not None else None
+            if relation is not None and getattr(instance, relation.attname) is not None:
+                pks.append(getattr(instance, relation.attname))
+        return pks
+
+
+def _forward_relation(model, name):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+    return field if field.is_relation and (field.many_to_one or field.one_to_one) and field.concrete else None
+
+
+class FarmerSerializer(CachedProfileSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Farmer
         fields = '__all__'
 
 
-class ConsumerSerializer(serializers.ModelSerializer):
+class ConsumerSerializer(CachedProfileSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Consumer
         fields = '__all__'
 
 
-class MillManagerSerializer(serializers.ModelSerializer):
+class MillManagerSerializer(CachedProfileSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = MillManager
         fields = '__all__'
@@ -64,7 +170,7 @@ class OliveGroveSerializer(serializers.ModelSerializer):
             return super().update(instance, validated_data)
 
 
-class OilMillSerializer(serializers.ModelSerializer):
+class OilMillSerializer(CachedProfileSerializerMixin, serializers.ModelSerializer):
     mill_manager = MillManagerSerializer()
 
     class Meta:
@@ -103,6 +209,16 @@ class OliveSaleOfferSerializer(serializers.ModelSerializer):
             return value
 
 
+class OliveSaleOfferCreateSerializer(serializers.ModelSerializer):
+    # the harvest is checked and set by the view, with the dates and the status
+
+    class Meta:
+        model = OliveSaleOffer
+        fields = ['id', 'initial_quantity_for_sell', 'quantity_unit', 'available_quantity_for_sell', 'offer_price',
+                  'price_unit', 'availability_date', 'transportation', 'offer_status', 'offer_code']
+        read_only_fields = ['id', 'available_quantity_for_sell', 'offer_status', 'offer_code']
+
+
 class OlivePurchaseRequestSerializer(serializers.ModelSerializer):
     olive_sale_offer = OliveSaleOfferSerializer()
     mill = OilMillSerializer()
@@ -112,6 +228,16 @@ class OlivePurchaseRequestSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class OlivePurchaseRequestCreateSerializer(serializers.ModelSerializer):
+    # the mill, the dates and the status are set by the view
+
+    class Meta:
+        model = OlivePurchaseRequest
+        fields = ['id', 'olive_sale_offer', 'requested_quantity', 'quantity_unit', 'requested_price', 'price_unit',
+                  'request_date', 'request_status', 'request_code']
+        read_only_fields = ['id', 'request_date', 'request_status', 'request_code']
+
+
 class PurchasedOliveSerializer(serializers.ModelSerializer):
     olive_purchase_request = OlivePurchaseRequestSerializer()
     mill = OilMillSerializer()
@@ -269,7 +395,13 @@ class SensorMeasurementSerializer(serializers.ModelSerializer):
 
 
 class IoTSensorSerializer(serializers.ModelSerializer):
-    measurements = SensorMeasurementSerializer(many=True)
+    # latest readings only, the history is served downsampled by the series endpoint
+    measurements = serializers.SerializerMethodField()
+    latest_measurements = 100
+
+    def get_measurements(self, sensor):
+        measurements = sensor.measurements.order_by('-measured_at', '-id')[:self.latest_measurements]
+        return SensorMeasurementSerializer(measurements, many=True).data
 
     class Meta:
         model = IoTSensor
@@ -389,6 +521,22 @@ class OilProductSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class OilProductSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OilProduct
+        fields = ['id', 'oil_product_code', 'creation_cause', 'production_date', 'produced_quantity',
+                  'remaining_quantity', 'quantity_unit', 'oil_quality', 'owner_category', 'owner', 'owner_mill',
+                  'mother_product', 'extraction_operation']
+
+
+class OilProductLineageSerializer(OilProductSummarySerializer):
+    # distance to the product the lineage is read from, annotated by dbmanage.lineage
+    depth = serializers.IntegerField(read_only=True, default=0)
+
+    class Meta(OilProductSummarySerializer.Meta):
+        fields = OilProductSummarySerializer.Meta.fields + ['depth']
+
+
 class OilAnalysisSerializer(serializers.ModelSerializer):
     oil_product = OilProductSerializer()
 
@@ -0,0 +1,226 @@
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate
+from operator import xor
+
+from django.db import connection
+
+from dbmanage.models import SensorMeasurement, SensorSeriesChunk
+
+try:
+    import numpy
+except ImportError:  # optional, only needed by as_numpy()
+    numpy = None
+
+# chunk blob: header, then one deflate stream holding the timestamp plane and the value plane
+MAGIC = b'OS'
+VERSION = 1
+HEADER = struct.Struct('<2sBI')
+COMPRESSION_LEVEL = 6
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def to_millis(timestamp):
+    return (timestamp - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_millis(millis):
+    return _EPOCH + timedelta(milliseconds=millis)
+
+
+def _little_endian(buffer):
+    if sys.byteorder == 'big':
+        buffer.byteswap()
+    return buffer
+
+
+def _shuffle(raw, count):
+    # byte planes: byte i of every 8-byte word is stored together, the zero high bytes of small
+    # deltas and XORs then form long runs that deflate collapses
+    return b''.join(raw[plane::8] for plane in range(8)) if count else b''
+
+
+def _unshuffle(planes, count):
+    raw = bytearray(count * 8)
+    for plane in range(8):
+        raw[plane::8] = planes[plane * count:(plane + 1) * count]
+    return raw
+
+
+def encode(timestamps, values):
+    """
+    Packs sorted epoch millisecond `timestamps` and float `values` into a chunk blob.
+    Timestamps are stored as first value, first delta and then delta-of-deltas (zero for a steady
+    sampling rate), values as the XOR of their IEEE 754 bits with the previous value (zero for a
+    repeated value, few significant bits for a slowly moving one).
+    """
+    count = len(timestamps)
+    if count != len(values):
+        raise ValueError('timestamps and values must have the same length')
+    deltas = [current - previous for previous, current in zip(timestamps, timestamps[1:])]
+    encoded_timestamps = array('q', timestamps[:1])
+    encoded_timestamps.extend(deltas[:1])
+    encoded_timestamps.extend(current - previous for previous, current in zip(deltas, deltas[1:]))
+
+    bits = array('Q')
+    bits.frombytes(array('d', values).tobytes())
+    encoded_values = array('Q', bits[:1])
+    encoded_values.extend(current ^ previous for previous, current in zip(bits, bits[1:]))
+
+    body = (_shuffle(_little_endian(encoded_timestamps).tobytes(), count) +
+            _shuffle(_little_endian(encoded_values).tobytes(), count))
+    return HEADER.pack(MAGIC, VERSION, count) + zlib.compress(body, COMPRESSION_LEVEL)
+
+
+def decode(blob):
+    """
+    Returns (timestamps, values) of a chunk blob as array('q') of epoch milliseconds and
+    array('d'). Every step runs in C (inflate, plane copies, accumulate), no loop per reading.
+    """
+    magic, version, count = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('not a sensor series chunk')
+    body = zlib.decompress(bytes(blob)[HEADER.size:])
+    size = count * 8
+
+    encoded_timestamps = _little_endian(array('q', _unshuffle(body[:size], count)))
+    # delta-of-deltas -> deltas -> timestamps
+    timestamps = array('q', accumulate(accumulate(encoded_timestamps[1:]), initial=encoded_timestamps[0])
+                       if count else ())
+
+    encoded_values = _little_endian(array('Q', _unshuffle(body[size:2 * size], count)))
+    values = array('d')
+    values.frombytes(array('Q', accumulate(encoded_values, xor)).tobytes())
+    return timestamps, values
+
+
+def as_numpy(timestamps, values):
+    """
+    Wraps decoded arrays as NumPy arrays (datetime64[ms], float64) without copying.
+    """
+    if numpy is None:
+        raise ImportError('NumPy is required for as_numpy()')
+    return numpy.frombuffer(timestamps, dtype='datetime64[ms]'), numpy.frombuffer(values, dtype=numpy.float64)
+
+
+def append_readings(readings):
+    """
+    Adds (sensor pk, parameter, value, timestamp) tuples to the per sensor, parameter and day chunks,
+    merging them into the existing chunks. Meant to run inside a transaction.
+    """
+    groups = {}
+    for sensor_pk, parameter, value, timestamp in readings:
+        timestamp = timestamp.astimezone(dt_timezone.utc)
+        groups.setdefault((sensor_pk, parameter, timestamp.date()), []).append((to_millis(timestamp), float(value)))
+    if not groups:
+        return
+    existing = {
+        (chunk.sensor_id, chunk.parameter, chunk.day): chunk
+        for chunk in SensorSeriesChunk.objects.select_for_update().filter(
+            sensor_id__in={key[0] for key in groups}, parameter__in={key[1] for key in groups},
+            day__in={key[2] for key in groups})
+    }
+    created, updated = [], []
+    for key, points in groups.items():
+        chunk = existing.get(key)
+        if chunk is not None:
+            timestamps, values = decode(chunk.data)
+            points.extend(zip(timestamps, values))
+        else:
+            chunk = SensorSeriesChunk(sensor_id=key[0], parameter=key[1], day=key[2])
+        # stable sort: readings sharing a timestamp keep their arrival order
+        points.sort(key=lambda point: point[0])
+        chunk.data = encode([point[0] for point in points], [point[1] for point in points])
+        chunk.count = len(points)
+        chunk.first_at, chunk.last_at = from_millis(points[0][0]), from_millis(points[-1][0])
+        (updated if chunk.pk else created).append(chunk)
+    SensorSeriesChunk.objects.bulk_create(created)
+    SensorSeriesChunk.objects.bulk_update(updated, ['data', 'count', 'first_at', 'last_at'])
+
+
+def _chunks(sensor_pk, parameter, start, end):
+    chunks = SensorSeriesChunk.objects.filter(sensor_id=sensor_pk, parameter=parameter)
+    if start is not None:
+        chunks = chunks.filter(last_at__gte=start)
+    if end is not None:
+        chunks = chunks.filter(first_at__lt=end)
+    return chunks
+
+
+def count_readings(sensor_pk, parameter, start=None, end=None):
+    """
+    Upper bound of the readings in [start, end): the size of every chunk overlapping the range.
+    """
+    return sum(_chunks(sensor_pk, parameter, start, end).values_list('count', flat=True))
+
+
+def iter_chunks(sensor_pk, parameter, start=None, end=None, numpy_arrays=False):
+    """
+    Streams the decoded chunks of a sensor parameter over [start, end) in time order, as
+    (day, timestamps, values) with epoch millisecond timestamps. Chunks are read from a server side
+    cursor and decoded one at a time, so memory use is bounded by a single day.
+    """
+    chunks = _chunks(sensor_pk, parameter, start, end).order_by('day').values_list('day', 'data')
+    low = to_millis(start) if start is not None else None
+    high = to_millis(end) if end is not None else None
+    for day, blob in chunks.iterator(chunk_size=50):
+        timestamps, values = decode(blob)
+        first = bisect_left(timestamps, low) if low is not None else 0
+        last = bisect_left(timestamps, high) if high is not None else len(timestamps)
+        if first or last < len(timestamps):
+            timestamps, values = timestamps[first:last], values[first:last]
+        if not timestamps:
+            continue
+        if numpy_arrays:
+            timestamps, values = as_numpy(timestamps, values)
+        yield day, timestamps, values
+
+
+def iter_readings(sensor_pk, parameter, start=None, end=None):
+    """
+    Streams (timestamp, value) pairs of a sensor parameter over [start, end).
+    """
+    for day, timestamps, values in iter_chunks(sensor_pk, parameter, start, end):
+        for millis, value in zip(timestamps, values):
+            yield from_millis(millis), value
+
+
+def delete_measurements(sensor_pk):
+    """
+    Deletes the SensorMeasurement rows of a sensor with one plain DELETE, without the per row delete
+    signals that recompute the rollups of their buckets.
+    """
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {ops.quote_name(SensorMeasurement._meta.db_table)} '
+                       f'WHERE {ops.quote_name(SensorMeasurement._meta.get_field("sensor").column)} = %s', [sensor_pk])
+
+
+def compact_sensor(sensor, batch_size=50000):
+    """
+    Moves the SensorMeasurement rows of `sensor` into chunks and switches the sensor to chunked
+    storage. Rollups are left as they are, they already cover these readings. Returns the number
+    of moved rows. Meant to run inside a transaction.
+    """
+    rows = SensorMeasurement.objects.filter(sensor=sensor).order_by('id').values_list(
+        'id', 'parameter', 'value', 'date', 'measured_at')
+    moved, last_id = 0, 0
+    while True:
+        batch = list(rows.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            break
+        append_readings([
+            (sensor.pk, parameter, value, measured_at or datetime.combine(day, datetime.min.time(), dt_timezone.utc))
+            for row_id, parameter, value, day, measured_at in batch
+        ])
+        last_id = batch[-1][0]
+        moved += len(batch)
+    # the rollups stay valid: the readings are moved, not changed
+    delete_measurements(sensor.pk)
+    sensor.series_storage = sensor.CHUNKED
+    sensor.save(update_fields=['series_storage'])
+    return moved
@@ -0,0 +1,312 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from dbmanage import geo, lineage, matching, ownership, profile_cache, rollups, search, series, versions
+from dbmanage.models import (Consumer, ExtractionOperation, Farmer, Harvest, IoTSensor, MillManager, OilAnalysis,
+                             OilMill, OilNeed, OilProduct, OilSaleOffer, OliveGrove, OliveNeed, OlivePurchaseRequest,
+                             OliveSaleOffer, Packaging, PurchasedOlive, SensorMeasurement, StorageArea, User)
+
+
+# Full-text search side index (dbmanage.search)
+
+@receiver(post_save, sender=OliveSaleOffer)
+def index_olive_sale_offer(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_olive_offers(OliveSaleOffer.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=OliveSaleOffer)
+def unindex_olive_sale_offer(sender, instance, **kwargs):
+    search.remove_offers(search.OLIVE, [instance.pk])
+
+
+@receiver(post_save, sender=OilSaleOffer)
+def index_oil_sale_offer(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_oil_offers(OilSaleOffer.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=OilSaleOffer)
+def unindex_oil_sale_offer(sender, instance, **kwargs):
+    search.remove_offers(search.OIL, [instance.pk])
+
+
+@receiver(post_save, sender=Harvest)
+@receiver(post_save, sender=OliveGrove)
+def reindex_olive_offers_of_harvest(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    if sender is Harvest:
+        search.index_olive_offers(OliveSaleOffer.objects.filter(harvest=instance))
+    else:
+        search.index_olive_offers(OliveSaleOffer.objects.filter(harvest__grove=instance))
+
+
+@receiver(post_save, sender=OilProduct)
+@receiver(post_save, sender=OilMill)
+def reindex_oil_offers_of_seller(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    if sender is OilProduct:
+        search.index_oil_offers(OilSaleOffer.objects.filter(oil_product=instance))
+    else:
+        search.index_oil_offers(OilSaleOffer.objects.filter(oil_mill=instance))
+
+
+@receiver(post_save, sender=Packaging)
+@receiver(post_delete, sender=Packaging)
+@receiver(post_save, sender=OilAnalysis)
+@receiver(post_delete, sender=OilAnalysis)
+def reindex_oil_offers_of_product(sender, instance, raw=False, **kwargs):
+    if not raw and instance.oil_product_id:
+        search.index_oil_offers(OilSaleOffer.objects.filter(oil_product_id=instance.oil_product_id))
+
+
+# Sensor rollups (dbmanage.rollups), bulk ingestion updates them itself
+
+@receiver(pre_save, sender=SensorMeasurement)
+def remember_measurement_bucket(sender, instance, raw=False, **kwargs):
+    # the buckets the row leaves when it is edited
+    instance._previous_bucket = None
+    if not raw and instance.pk:
+        instance._previous_bucket = SensorMeasurement.objects.filter(pk=instance.pk).values_list(
+            'sensor_id', 'parameter', 'measured_at').first()
+
+
+@receiver(post_save, sender=SensorMeasurement)
+def update_measurement_rollups(sender, instance, raw=False, created=False, **kwargs):
+    if raw or instance.measured_at is None:
+        return
+    previous = getattr(instance, '_previous_bucket', None)
+    if created or previous is None:
+        rollups.apply_measurements([(instance.sensor_id, instance.parameter, instance.value, instance.measured_at)])
+        return
+    if previous[2] is not None:
+        rollups.refresh_buckets(*previous)
+    rollups.refresh_buckets(instance.sensor_id, instance.parameter, instance.measured_at)
+
+
+@receiver(post_delete, sender=SensorMeasurement)
+def remove_measurement_from_rollups(sender, instance, **kwargs):
+    if instance.measured_at is not None:
+        rollups.refresh_buckets(instance.sensor_id, instance.parameter, instance.measured_at)
+
+
+@receiver(pre_delete, sender=IoTSensor)
+def delete_sensor_measurements(sender, instance, **kwargs):
+    # the measurements do not cascade (SensorMeasurement.sensor): deleted here in one statement, their
+    # rollups and chunks cascade with the sensor
+    series.delete_measurements(instance.pk)
+
+
+# Serialized profile cache (dbmanage.profile_cache)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Farmer)
+@receiver(post_delete, sender=Farmer)
+@receiver(post_save, sender=Consumer)
+@receiver(post_delete, sender=Consumer)
+@receiver(post_save, sender=MillManager)
+@receiver(post_delete, sender=MillManager)
+def invalidate_user_profile(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cache = profile_cache.get_cache()
+    # the profile tables share the primary key of their User row, which any of them can change
+    for model in (Farmer, Consumer, MillManager):
+        cache.invalidate(model, [instance.pk])
+    # the representation of a mill embeds its manager
+    cache.invalidate(OilMill, list(OilMill.objects.filter(mill_manager_id=instance.pk).values_list('id', flat=True)))
+
+
+@receiver(post_save, sender=OilMill)
+@receiver(post_delete, sender=OilMill)
+def invalidate_oil_mill_profile(sender, instance, raw=False, **kwargs):
+    if not raw:
+        profile_cache.get_cache().invalidate(OilMill, [instance.pk])
+
+
+# Oil product genealogy closure table (dbmanage.lineage)
+
+@receiver(pre_save, sender=OilProduct)
+def check_oil_product_mother(sender, instance, raw=False, **kwargs):
+    instance._previous_mother_id = None
+    if not raw and instance.pk:
+        instance._previous_mother_id = OilProduct.objects.filter(pk=instance.pk).values_list(
+            'mother_product_id', flat=True).first()
+        if instance.mother_product_id != instance._previous_mother_id:
+            lineage.check_parent(instance.pk, instance.mother_product_id)
+
+
+@receiver(post_save, sender=OilProduct)
+def update_oil_product_lineage(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    if created:
+        lineage.attach(instance.pk, instance.mother_product_id)
+    elif instance.mother_product_id != getattr(instance, '_previous_mother_id', None):
+        lineage.move(instance.pk, instance.mother_product_id)
+
+
+@receiver(pre_delete, sender=OilProduct)
+def detach_oil_product_lineage(sender, instance, **kwargs):
+    # the child products become roots (mother_product is SET_NULL), the rows of the product cascade
+    lineage.detach(instance.pk)
+
+
+# Resolved owner of oil products (OilProduct.owner / owner_mill), set on save from the extraction
+
+@receiver(post_save, sender=ExtractionOperation)
+def refresh_owner_of_extracted_oil(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        ownership.refresh(OilProduct.objects.filter(extraction_operation=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=PurchasedOlive)
+def refresh_owner_of_purchased_olives_oil(sender, instance, raw=False, created=False, **kwargs):
+    if not raw and not created:
+        ownership.refresh(OilProduct.objects.filter(
+            extraction_operation__purchased_olives=instance).values_list('id', flat=True))
+
+
+@receiver(m2m_changed, sender=ExtractionOperation.purchased_olives.through)
+def refresh_owner_of_extraction_olives(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        products = OilProduct.objects.filter(extraction_operation=instance)
+    elif pk_set:
+        products = OilProduct.objects.filter(extraction_operation__in=pk_set)
+    else:
+        # cleared from the purchased olives side: the operations are gone from the through table
+        return
+    ownership.refresh(products.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=OilMill)
+def transfer_oil_of_mill(sender, instance, raw=False, created=False, **kwargs):
+    # the products of a mill belong to its current manager
+    if not raw and not created:
+        if OilProduct.objects.filter(owner_mill=instance).exclude(owner_id=instance.mill_manager_id).update(
+                owner_id=instance.mill_manager_id):
+            versions.bump(OilProduct)
+
+
+# Olive need / sale offer matching index (dbmanage.matching), updated once the transaction commits
+
+@receiver(post_save, sender=OliveNeed)
+@receiver(post_delete, sender=OliveNeed)
+def rematch_olive_need(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: matching.get_engine().refresh_needs([pk]))
+
+
+@receiver(post_save, sender=OliveSaleOffer)
+@receiver(post_delete, sender=OliveSaleOffer)
+def rematch_olive_sale_offer(sender, instance, raw=False, **kwargs):
+    if not raw:
+        pk = instance.pk
+        transaction.on_commit(lambda: matching.get_engine().refresh_offers([pk]))
+
+
+@receiver(post_save, sender=Harvest)
+@receiver(post_save, sender=OliveGrove)
+def rematch_olive_offers_of_harvest(sender, instance, raw=False, created=False, **kwargs):
+    if raw or created:
+        return
+    offers = OliveSaleOffer.objects.filter(**{'harvest' if sender is Harvest else 'harvest__grove': instance})
+    pks = list(offers.values_list('id', flat=True))
+    if pks:
+        transaction.on_commit(lambda: matching.get_engine().refresh_offers(pks))
+
+
+@receiver(post_save, sender=OilNeed)
+@receiver(post_delete, sender=OilNeed)
+def rematch_oil_need(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    pk = instance.pk
+
+    def rematch():
+        matching.get_oil_engine().refresh_needs([pk])
+        if created:
+            matching.notify_oil_need_matches(pk)
+
+    transaction.on_commit(rematch)
+
+
+@receiver(post_save, sender=OilSaleOffer)
+@receiver(post_delete, sender=OilSaleOffer)
+def rematch_oil_sale_offer(sender, instance, raw=False, created=False, **kwargs):
+    if raw:
+        return
+    pk = instance.pk
+
+    def rematch():
+        matching.get_oil_engine().refresh_offers([pk])
+        if created:
+            matching.notify_oil_offer_matches(pk)
+
+    transaction.on_commit(rematch)
+
+
+@receiver(post_save, sender=OilProduct)
+@receiver(post_delete, sender=OilProduct)
+def rematch_oil_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    pk = instance.pk
+    # the offers of the product take its quality, packaging and production year
+    offers = list(OilSaleOffer.objects.filter(oil_product_id=pk).values_list('id', flat=True))
+
+    def rematch():
+        engine = matching.get_oil_engine()
+        engine.refresh_products([pk])
+        if offers:
+            engine.refresh_offers(offers)
+
+    transaction.on_commit(rematch)
+
+
+# Geohash of the located models (dbmanage.geo)
+
+@receiver(pre_save, sender=OliveGrove)
+@receiver(pre_save, sender=OilMill)
+@receiver(pre_save, sender=StorageArea)
+def set_geohash(sender, instance, raw=False, **kwargs):
+    if instance.latitude is None or instance.longitude is None:
+        instance.geohash = None
+    else:
+        instance.geohash = geo.encode(instance.latitude, instance.longitude)
+
+
+# Versions of the rows served with an ETag (dbmanage.versions), bumped in the writing transaction
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Farmer)
+@receiver(post_delete, sender=Farmer)
+@receiver(post_save, sender=Consumer)
+@receiver(post_delete, sender=Consumer)
+@receiver(post_save, sender=MillManager)
+@receiver(post_delete, sender=MillManager)
+@receiver(post_save, sender=OilMill)
+@receiver(post_delete, sender=OilMill)
+@receiver(post_save, sender=OliveGrove)
+@receiver(post_delete, sender=OliveGrove)
+@receiver(post_save, sender=Harvest)
+@receiver(post_delete, sender=Harvest)
+@receiver(post_save, sender=OliveSaleOffer)
+@receiver(post_delete, sender=OliveSaleOffer)
+@receiver(post_save, sender=OlivePurchaseRequest)
+@receiver(post_delete, sender=OlivePurchaseRequest)
+@receiver(post_save, sender=PurchasedOlive)
+@receiver(post_delete, sender=PurchasedOlive)
+@receiver(post_save, sender=OilProduct)
+@receiver(post_delete, sender=OilProduct)
+def bump_version(sender, instance, raw=False, using=None, **kwargs):
+    if not raw:
+        versions.bump(sender, using=using)
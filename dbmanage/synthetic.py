@@ -0,0 +1,480 @@
+import csv
+import datetime
+import random
+from bisect import bisect
+from itertools import accumulate
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+
+from dbmanage import bulk, codes, geo, lineage, versions
+from dbmanage.models import (
+    Consumer, ExtractionOperation, Farmer, Harvest, MillManager, OilAnalysis, OilMill, OilProduct, OilProductLineage,
+    OilPurchaseRequest, OilSaleOffer, OilStorage, OliveGrove, OlivePurchaseRequest, OliveSaleOffer, Packaging,
+    PurchasedOlive, StorageArea, User,
+)
+
+CHUNK_SIZE = 5000
+# code numbers reserved per sequence round trip
+CODE_BLOCK_SIZE = 10000
+
+# shares of the olive trees of Tunisia, the regions of the gazetteer weighted by their groves
+REGIONS = {
+    'Sfax': 20, 'Kairouan': 10, 'Sidi Bouzid': 10, 'Mahdia': 9, 'Sousse': 7, 'Medenine': 6, 'Monastir': 5,
+    'Kasserine': 5, 'Gafsa': 4, 'Nabeul': 4, 'Gabes': 3, 'Zarzis': 3, 'Zaghouan': 3, 'Siliana': 3, 'El Jem': 2,
+    'Msaken': 2, 'Beja': 2, 'Bizerte': 2, 'Le Kef': 2, 'Jendouba': 1, 'Testour': 1, 'Tataouine': 1,
+}
+VARIETIES = {
+    'Chemlali': 55, 'Chétoui': 15, 'Oueslati': 6, 'Arbequina': 5, 'Koroneiki': 5, 'Zalmati': 4, 'Zarrazi': 4,
+    'Gerboui': 2, 'Picholine': 2, 'Coratina': 1, 'Picual': 1,
+}
+FIRST_NAMES = ('Mohamed', 'Ahmed', 'Ali', 'Youssef', 'Hedi', 'Karim', 'Sami', 'Nabil', 'Fatma', 'Amira', 'Leila',
+               'Salma', 'Mariem', 'Ines', 'Sonia', 'Rim')
+LAST_NAMES = ('Ben Ali', 'Trabelsi', 'Jebali', 'Gharbi', 'Hammami', 'Ayari', 'Dridi', 'Mejri', 'Bouazizi',
+              'Chaabane', 'Karray', 'Masmoudi', 'Ellouze', 'Feki', 'Zouari', 'Sellami')
+LABS = ('Laboratoire ONH', 'Institut de l\'Olivier', 'CTAA', 'Laboratoire Central d\'Analyses')
+FEEDBACKS = ('', '', 'Good quality', 'Delivered on time', 'Late delivery', 'As described')
+
+
+def _weighted(weights):
+    # (values, cumulative weights) for DatasetGenerator.pick()
+    return tuple(weights), tuple(accumulate(weights.values()))
+
+
+class Table:
+    """
+    Rows of a model buffered as tuples and written with one executemany() per flush, through
+    bulk.RawInsert: `fields` are the names of the model fields of the rows, after the id the
+    generator gives them (with `auto_id`, the default; a child table of multi-table inheritance
+    writes its parent link instead).
+    """
+
+    def __init__(self, model, fields, auto_id=True):
+        opts = model._meta
+        self.model = model
+        fields = [opts.get_field(name) for name in fields]
+        if auto_id:
+            fields.insert(0, opts.pk)
+            self.next_id = (model._base_manager.aggregate(last=Max('pk'))['last'] or 0) + 1
+        self.insert = bulk.RawInsert(model, fields)
+        self.rows = []
+        self.count = 0
+
+    def new_id(self):
+        pk = self.next_id
+        self.next_id += 1
+        return pk
+
+    def add(self, *row):
+        self.rows.append(row)
+
+    def flush(self, cursor):
+        self.count += self.insert.execute(self.rows, cursor)
+        self.rows = []
+
+
+class DatasetGenerator:
+    """
+    Writes a consistent dataset around `farmers` farmers, the same for the same `seed` on an empty
+    database: oil mills (one for 40 farmers) with their managers and storage areas, consumers (one
+    for 2 farmers), then farmer by farmer their groves, one harvest per grove and season from
+    `first_season`, the olive sale offers and the purchase requests of the mills, the olives bought,
+    their extraction and the extraction of the olives kept, the oil products with their analyses,
+    storage and packaging splits, and the oil sale offers with the purchase requests of consumers.
+
+    The rows are written with Table, the tables flushed in foreign key order each time `chunk_size`
+    rows are buffered, so the memory used does not grow with the dataset. Codes are taken from their
+    sequences, owners of oil products are stored as resolve_owner() would give them and the lineage
+    closure table is rebuilt at the end; the signals are not sent, the search index is left as is.
+    Run in a transaction.
+    """
+
+    def __init__(self, farmers, seed=0, first_season=2021, seasons=3, chunk_size=CHUNK_SIZE, password=None):
+        self.farmers = farmers
+        self.rng = random.Random(seed)
+        self.first_season = first_season
+        self.seasons = seasons
+        self.chunk_size = chunk_size
+        # one hash for every user: hashing them one by one would take longer than the rest
+        self.password = make_password(password) if password else f'{UNUSABLE_PASSWORD_PREFIX}synthetic'
+        with open(geo.DEFAULT_GAZETTEER, newline='', encoding='utf-8') as gazetteer:
+            places = {row['name']: (float(row['latitude']), float(row['longitude']))
+                      for row in csv.DictReader(gazetteer)}
+        self.places = {region: places[region] for region in REGIONS}
+        self.regions = _weighted(REGIONS)
+        self.varieties = _weighted(VARIETIES)
+        self.numbers = {}
+
+        # in foreign key order
+        self.users = Table(User, ('password', 'email', 'first_name', 'last_name', 'role', 'phone_number', 'is_admin'))
+        self.farmer_rows = Table(Farmer, ('user_ptr', 'country', 'address'), auto_id=False)
+        self.consumer_rows = Table(Consumer, ('user_ptr', 'country'), auto_id=False)
+        self.managers = Table(MillManager, ('user_ptr',), auto_id=False)
+        self.mills = Table(OilMill, (
+            'name', 'address', 'country', 'fax', 'website', 'creation_date', 'milling_capacity',
+            'transformation_capacity_unit', 'chains_number', 'has_lab', 'has_pack_unit', 'storage_capacity',
+            'storage_capacity_unit', 'practice', 'quality_certificate', 'agreement_date', 'mill_manager', 'latitude',
+            'longitude', 'geohash'))
+        self.storage_areas = Table(StorageArea, (
+            'local_type', 'address', 'latitude', 'longitude', 'geohash', 'container_type', 'container_number',
+            'oil_mill'))
+        self.groves = Table(OliveGrove, (
+            'name', 'is_owner', 'address', 'latitude', 'longitude', 'geohash', 'trees_age', 'area', 'density',
+            'olives_variety', 'soil_type', 'fertilizers_used', 'pesticide_sprays', 'cropping_system', 'practice',
+            'grove_picture', 'farmer'))
+        self.harvests = Table(Harvest, (
+            'harvest_date', 'harvest_method', 'initial_quantity', 'remaining_quantity', 'quantity_unit',
+            'maturity_index', 'characterization', 'classification_by_maturity', 'containers', 'harvest_picture',
+            'grove', 'creation_cause', 'harvest_code'))
+        self.olive_offers = Table(OliveSaleOffer, (
+            'harvest', 'initial_quantity_for_sell', 'quantity_unit', 'available_quantity_for_sell', 'offer_price',
+            'price_unit', 'availability_date', 'transportation', 'creation_date', 'update_date', 'offer_status',
+            'offer_code', 'creation_cause_need'))
+        self.olive_requests = Table(OlivePurchaseRequest, (
+            'olive_sale_offer', 'mill', 'requested_quantity', 'quantity_unit', 'requested_price', 'price_unit',
+            'request_date', 'buyer_appreciation', 'buyer_feedback', 'request_status', 'status_update_date',
+            'request_code'))
+        self.purchased_olives = Table(PurchasedOlive, (
+            'olive_quantity', 'quantity_unit', 'purchase_date', 'olives_variety', 'maturity_index', 'characterization',
+            'classification_by_maturity', 'cropping_system', 'practice', 'mill', 'olive_purchase_request'))
+        self.extractions = Table(ExtractionOperation, (
+            'oil_mill', 'harvest', 'reception_date', 'start_date', 'finish_date', 'olives_quantity', 'quantity_unit',
+            'water_per_100kg', 'mixing_duration', 'time_unit', 'press_temperature', 'filtration_considered',
+            'separate_mixing_by_variety', 'method', 'produced_quantity', 'produced_quantity_unit'))
+        self.extracted_olives = Table(ExtractionOperation.purchased_olives.through,
+                                      ('extractionoperation', 'purchasedolive'))
+        self.products = Table(OilProduct, (
+            'extraction_operation', 'production_date', 'creation_cause', 'produced_quantity', 'remaining_quantity',
+            'quantity_unit', 'quality_control_performed', 'oil_quality', 'owner_category', 'owner', 'owner_mill',
+            'is_packaged', 'is_stored', 'mother_product', 'oil_product_code'))
+        self.storages = Table(OilStorage, (
+            'oil_product', 'oil_mill', 'storage_date', 'stored_quantity', 'quantity_unit', 'storage_area'))
+        self.packagings = Table(Packaging, (
+            'packaging_reference', 'packaging_date', 'packaged_quantity', 'packaged_quantity_unit', 'type_of_packaging',
+            'packaging_volume', 'packaging_factory_name', 'factory_address', 'factory_certificate', 'oil_product',
+            'oil_mill'))
+        self.analyses = Table(OilAnalysis, (
+            'analysis_reference', 'analysis_date', 'lab_name', 'lab_address', 'lab_agreement', 'lab_agreement_date',
+            'oil_quality', 'fatty_acid', 'acidity', 'peroxide_value', 'UV_absorbance', 'analysis_file', 'oil_product',
+            'oil_mill'))
+        self.oil_offers = Table(OilSaleOffer, (
+            'oil_product', 'initial_quantity_for_sell', 'available_quantity_for_sell', 'quantity_unit',
+            'offered_price', 'price_unit', 'transportation', 'creation_date', 'update_date', 'type_of_packaging',
+            'packaging_volume', 'offer_status', 'offer_code', 'creation_cause_need', 'oil_mill', 'farmer'))
+        self.oil_requests = Table(OilPurchaseRequest, (
+            'oil_sale_offer', 'requested_quantity', 'quantity_unit', 'requested_price', 'price_unit', 'request_date',
+            'buyer_category', 'consumer', 'buyer_appreciation', 'buyer_feedback', 'request_status',
+            'status_update_date', 'request_code'))
+        self.tables = [
+            self.users, self.farmer_rows, self.consumer_rows, self.managers, self.mills, self.storage_areas,
+            self.groves, self.harvests, self.olive_offers, self.olive_requests, self.purchased_olives, self.extractions,
+            self.extracted_olives, self.products, self.storages, self.packagings, self.analyses, self.oil_offers,
+            self.oil_requests,
+        ]
+        # (mill id, manager id, storage area id, region) by region, and every consumer id
+        self.mills_by_region = {}
+        self.all_mills = []
+        self.consumers = []
+
+    def pick(self, distribution):
+        values, cumulative = distribution
+        return values[bisect(cumulative, self.rng.random() * cumulative[-1])]
+
+    def number(self, prefix):
+        block = self.numbers.get(prefix)
+        if not block:
+            block = codes.allocate(prefix, CODE_BLOCK_SIZE)
+        self.numbers[prefix] = block[1:]
+        return str(block[0]).zfill(6)
+
+    def code(self, prefix, date):
+        # as CodedModel.build_code()
+        return f"{prefix}-{date.strftime('%Y%m%d')}-{self.number(prefix)}"
+
+    def location(self, region, spread):
+        latitude, longitude = self.places[region]
+        latitude = round(latitude + self.rng.uniform(-spread, spread), 6)
+        longitude = round(longitude + self.rng.uniform(-spread, spread), 6)
+        return latitude, longitude, geo.encode(latitude, longitude)
+
+    def user(self, role, country='Tunisia'):
+        rng = self.rng
+        pk = self.users.new_id()
+        self.users.add(pk, self.password, f'{role.replace(" ", "-")}-{pk}@synthetic.example.com',
+                       rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), role,
+                       f'+216 {rng.randint(20000000, 99999999)}', False)
+        return pk
+
+    def pending(self):
+        return sum(len(table.rows) for table in self.tables)
+
+    def flush(self):
+        with connection.cursor() as cursor:
+            for table in self.tables:
+                table.flush(cursor)
+
+    def run(self):
+        """
+        Writes the dataset and returns {table name: rows written}.
+        """
+        self.generate_mills()
+        self.generate_consumers()
+        for _ in range(self.farmers):
+            self.generate_farmer()
+            if self.pending() >= self.chunk_size:
+                self.flush()
+        self.flush()
+        counts = {table.model._meta.db_table: table.count for table in self.tables}
+        counts[OilProductLineage._meta.db_table] = lineage.rebuild()
+        # the ids were given here: the sequences of the databases having some start after them
+        statements = connection.ops.sequence_reset_sql(no_style(), [table.model for table in self.tables])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+        versions.bump(*(table.model for table in self.tables))
+        return counts
+
+    def generate_mills(self):
+        rng = self.rng
+        for _ in range(max(self.farmers // 40, 1)):
+            region = self.pick(self.regions)
+            manager_id = self.user('mill manager')
+            self.managers.add(manager_id)
+            mill_id = self.mills.new_id()
+            founded = datetime.date(rng.randint(1960, 2015), rng.randint(1, 12), rng.randint(1, 28))
+            capacity = rng.choice((20, 40, 60, 100, 150, 250))
+            practice = 'O' if rng.random() < 0.15 else 'C'
+            self.mills.add(mill_id, f'Huilerie {region} {mill_id}', region, 'Tunisia',
+                           f'+216 {rng.randint(70000000, 79999999)}', f'https://huilerie-{mill_id}.example.com',
+                           founded, capacity, 't', rng.randint(1, 4), rng.random() < 0.3, rng.random() < 0.4,
+                           capacity * rng.randint(500, 2000), 'l', practice,
+                           rng.choice(('ISO 22000', 'ISO 9001', 'HACCP', '')), founded + datetime.timedelta(days=365),
+                           manager_id, *self.location(region, 0.1))
+            area_id = self.storage_areas.new_id()
+            self.storage_areas.add(area_id, 'Cellar', region, *self.location(region, 0.1),
+                                   rng.choice(('Stainless steel tank', 'Jar')), rng.randint(4, 40), mill_id)
+            mill = (mill_id, manager_id, area_id, region)
+            self.mills_by_region.setdefault(region, []).append(mill)
+            self.all_mills.append(mill)
+
+    def generate_consumers(self):
+        for _ in range(max(self.farmers // 2, 1)):
+            consumer_id = self.user('consumer')
+            self.consumer_rows.add(consumer_id, self.rng.choice(('Tunisia', 'Tunisia', 'France', 'Italy', 'Spain')))
+            self.consumers.append(consumer_id)
+
+    def mill_near(self, region):
+        # mostly a mill of the region of the olives
+        local = self.mills_by_region.get(region)
+        if local and self.rng.random() < 0.8:
+            return self.rng.choice(local)
+        return self.rng.choice(self.all_mills)
+
+    def generate_farmer(self):
+        rng = self.rng
+        farmer_id = self.user('farmer')
+        region = self.pick(self.regions)
+        self.farmer_rows.add(farmer_id, 'Tunisia', region)
+        for _ in range(rng.choices((1, 2, 3, 4), (40, 30, 20, 10))[0]):
+            grove_id = self.groves.new_id()
+            name = f'{region} grove {grove_id}'
+            irrigated = rng.random() < 0.2
+            organic = rng.random() < 0.15
+            variety = self.pick(self.varieties)
+            area = round(min(rng.lognormvariate(1.0, 0.8), 300.0), 2)
+            self.groves.add(grove_id, name, rng.random() < 0.85, region, *self.location(region, 0.15),
+                            rng.randint(5, 120), area, rng.randint(200, 400) if irrigated else rng.randint(17, 120),
+                            variety, rng.choice(('SN', 'SL', 'C', 'L')), '' if organic else 'NPK',
+                            not organic and rng.random() < 0.6, 'I' if irrigated else 'R', 'O' if organic else 'C',
+                            '', farmer_id)
+            grove = (grove_id, name, region, variety, 'I' if irrigated else 'R', 'O' if organic else 'C')
+            # tonnes per hectare, much higher for irrigated intensive groves
+            median_yield = 5.0 if irrigated else 0.8
+            for season in range(self.first_season, self.first_season + self.seasons):
+                quantity = max(round(area * median_yield * rng.lognormvariate(0, 0.5), 2), 0.05)
+                self.generate_harvest(farmer_id, grove, season, quantity)
+
+    def generate_harvest(self, farmer_id, grove, season, quantity):
+        rng = self.rng
+        grove_id, grove_name, region, variety, cropping_system, practice = grove
+        last_season = season == self.first_season + self.seasons - 1
+        harvest_id = self.harvests.new_id()
+        harvest_date = datetime.date(season, 10, 15) + datetime.timedelta(days=rng.randint(0, 105))
+        maturity = rng.choices(('G', 'P', 'B'), (30, 40, 30))[0]
+        characterization = 'Mono' if rng.random() < 0.85 else 'Poly'
+        remaining = quantity
+
+        if rng.random() < 0.8:
+            offered = round(quantity * rng.uniform(0.5, 1.0), 2)
+            available = offered
+            offer_id = self.olive_offers.new_id()
+            created = harvest_date + datetime.timedelta(days=rng.randint(0, 3))
+            if last_season:
+                status = rng.choices(('A', 'Cl', 'Ca'), (70, 25, 5))[0]
+            else:
+                status = 'Cl' if rng.random() < 0.85 else 'Ca'
+            price = max(round(rng.gauss(2.6, 0.4) * (1.15 if practice == 'O' else 1.0) * 20) / 20, 0.5)
+            updated = created
+            for _ in range(rng.choices((0, 1, 2, 3), (20, 45, 25, 10))[0]):
+                mill_id, manager_id, area_id, mill_region = self.mill_near(region)
+                requested = round(offered * rng.uniform(0.2, 0.6), 2)
+                request_date = created + datetime.timedelta(days=rng.randint(0, 10))
+                if status == 'Ca' or requested > available:
+                    request_status = 'R'
+                elif status == 'Cl':
+                    request_status = 'B'
+                else:
+                    request_status = rng.choices(('P', 'A', 'B'), (50, 20, 30))[0]
+                status_date = request_date + datetime.timedelta(days=rng.randint(0, 5))
+                updated = max(updated, status_date)
+                bought = request_status == 'B'
+                request_id = self.olive_requests.new_id()
+                self.olive_requests.add(
+                    request_id, offer_id, mill_id, requested, 'Tonnes', round(price * rng.uniform(0.9, 1.0), 2),
+                    'TND', request_date, rng.randint(3, 5) if bought else 0, rng.choice(FEEDBACKS) if bought else '',
+                    request_status, status_date, self.code('olive purchase', request_date))
+                if bought:
+                    available = round(available - requested, 2)
+                    remaining = round(remaining - requested, 2)
+                    purchased_id = self.purchased_olives.new_id()
+                    self.purchased_olives.add(
+                        purchased_id, requested, 'Tonnes', status_date, variety, maturity, characterization, False,
+                        cropping_system, practice, mill_id, request_id)
+                    extraction_id, finished, litres = self.generate_extraction(mill_id, None, status_date, requested)
+                    self.extracted_olives.add(self.extracted_olives.new_id(), extraction_id, purchased_id)
+                    self.generate_oil(extraction_id, finished, litres, last_season, (mill_id, area_id),
+                                      'M', manager_id, mill_id)
+            self.olive_offers.add(
+                offer_id, harvest_id, offered, 'Tonnes', max(available, 0), price, 'TND',
+                created + datetime.timedelta(days=rng.randint(0, 7)), rng.choice(('D', 'R')), created, updated,
+                status, self.code('olive selling', created), False)
+
+        # most of the olives kept are pressed for the farmer
+        if remaining > 0 and rng.random() < 0.6:
+            mill_id, manager_id, area_id, mill_region = self.mill_near(region)
+            extraction_id, finished, litres = self.generate_extraction(mill_id, harvest_id, harvest_date, remaining)
+            self.generate_oil(extraction_id, finished, litres, last_season, (mill_id, area_id), 'F', farmer_id, None)
+            remaining = 0
+        self.harvests.add(
+            harvest_id, harvest_date, rng.choices(('Mn', 'Mc', 'B'), (60, 25, 15))[0], quantity, max(remaining, 0),
+            'Tonnes', maturity, characterization, rng.random() < 0.3, rng.choices(('Px', 'Bg', 'Pb', 'O'),
+                                                                                  (50, 30, 15, 5))[0],
+            '', grove_id, 'Harvesting', f'{self.number("harvest")}-{harvest_date.strftime("%Y%m%d")}-{grove_name}')
+
+    def generate_extraction(self, mill_id, harvest_id, received, quantity):
+        # (id, finish date, litres of oil produced)
+        rng = self.rng
+        extraction_id = self.extractions.new_id()
+        reception = received + datetime.timedelta(days=rng.randint(0, 3))
+        finished = reception + datetime.timedelta(days=rng.randint(0, 1))
+        # 16 to 24 litres of oil per 100 kg of olives
+        litres = round(quantity * rng.uniform(160, 240), 1)
+        self.extractions.add(
+            extraction_id, mill_id, harvest_id, reception, reception, finished, quantity, 'Tonnes',
+            rng.randint(0, 10), rng.randint(20, 45), 'Minutes', round(rng.uniform(22, 30), 1),
+            rng.random() < 0.5, rng.random() < 0.3,
+            rng.choices(('continuous 2-phase', 'continuous 3-phase', 'traditional press'), (50, 35, 15))[0],
+            litres, 'l')
+        return extraction_id, finished, litres
+
+    def generate_oil(self, extraction_id, produced, litres, open_season, mill, owner_category, owner_id,
+                     owner_mill_id):
+        """
+        The oil product of an extraction, its analysis, its storage and packaging splits at the `mill`
+        (id, storage area id) of the extraction and the sale offer of what is left at the end of the chain.
+        """
+        rng = self.rng
+        mill_id, area_id = mill
+        quality = rng.choices(('EVOO', 'VOO', 'L', 'N'), (45, 30, 10, 15))[0]
+        product_id = self.products.new_id()
+        remaining = litres
+        analysed = rng.random() < 0.4
+        # (product id, remaining litres, date, packaging type, volume) of the end of the chain
+        leaf = None
+        stored_id = None
+        if rng.random() < 0.5:
+            stored = round(litres * rng.uniform(0.5, 1.0), 1)
+            remaining = round(remaining - stored, 1)
+            stored_on = produced + datetime.timedelta(days=rng.randint(0, 5))
+            stored_id = self.products.new_id()
+            stored_remaining = stored
+            packaged_id = None
+            if rng.random() < 0.6 and int(stored) > 0:
+                packaged = int(stored * rng.uniform(0.3, 1.0)) or 1
+                stored_remaining = round(stored_remaining - packaged, 1)
+                packaged_on = stored_on + datetime.timedelta(days=rng.randint(1, 30))
+                packaged_id = self.products.new_id()
+                kind, volume = rng.choice((('DGbt', '0.75 l'), ('TGbt', '0.5 l'), ('Pbt', '1 l'), ('T', '5 l'),
+                                           ('Bx', '3 l'), ('C', '0.25 l')))
+                self.products.add(
+                    packaged_id, None, packaged_on, 'P', packaged, packaged, 'l', analysed, quality, owner_category,
+                    owner_id, owner_mill_id, True, False, stored_id, self.code('P', packaged_on))
+                packaging_id = self.packagings.new_id()
+                self.packagings.add(
+                    packaging_id, f'PK-{packaging_id}', packaged_on, packaged, 'l', kind, volume, 'Société de conditionnement',
+                    'Sfax', 'ISO 22000', packaged_id, mill_id)
+                leaf = (packaged_id, packaged, packaged_on, kind, volume)
+            self.products.add(
+                stored_id, None, stored_on, 'St', stored, stored_remaining, 'l', analysed, quality, owner_category,
+                owner_id, owner_mill_id, False, True, product_id, self.code('St', stored_on))
+            self.storages.add(
+                self.storages.new_id(), stored_id, mill_id, stored_on, stored, 'l', area_id)
+            if leaf is None:
+                leaf = (stored_id, stored_remaining, stored_on, 'T', 'bulk')
+        self.products.add(
+            product_id, extraction_id, produced, 'E', litres, remaining, 'l', analysed, quality, owner_category,
+            owner_id, owner_mill_id, False, False, None, self.code('E', produced))
+        if leaf is None:
+            leaf = (product_id, remaining, produced, 'C', 'bulk')
+        if analysed:
+            self.generate_analysis(product_id, produced, quality, mill_id)
+        if leaf[1] >= 1 and rng.random() < 0.5:
+            self.generate_oil_offer(leaf, quality, open_season, owner_category, owner_id, owner_mill_id)
+
+    def generate_analysis(self, product_id, produced, quality, mill_id):
+        rng = self.rng
+        analysed_on = produced + datetime.timedelta(days=rng.randint(1, 10))
+        acidity = {'EVOO': (0.1, 0.8), 'VOO': (0.8, 2.0), 'L': (2.0, 3.3)}.get(quality, (0.2, 3.0))
+        analysis_id = self.analyses.new_id()
+        self.analyses.add(
+            analysis_id, f'AN-{analysis_id}', analysed_on, rng.choice(LABS), 'Sfax', f'ONH-{rng.randint(100, 999)}',
+            datetime.date(2015, 1, 1), quality, f'{rng.uniform(55, 83):.1f}', f'{rng.uniform(*acidity):.2f}',
+            f'{rng.uniform(4, 20):.1f}', f'{rng.uniform(0.1, 0.25):.2f}', None, product_id, mill_id)
+
+    def generate_oil_offer(self, leaf, quality, open_season, owner_category, owner_id, owner_mill_id):
+        rng = self.rng
+        product_id, litres, available_on, kind, volume = leaf
+        offered = int(litres * rng.uniform(0.5, 1.0)) or 1
+        available = offered
+        created = available_on + datetime.timedelta(days=rng.randint(0, 10))
+        if open_season:
+            status = rng.choices(('A', 'Cl', 'Ca'), (60, 30, 10))[0]
+        else:
+            status = 'Cl' if rng.random() < 0.8 else 'Ca'
+        price = max(round(rng.gauss(16, 2.5) + (3 if quality == 'EVOO' else 0), 1), 5.0)
+        offer_id = self.oil_offers.new_id()
+        updated = created
+        for _ in range(rng.choices((0, 1, 2, 3), (25, 40, 25, 10))[0]):
+            requested = min(rng.randint(5, 300), offered)
+            request_date = created + datetime.timedelta(days=rng.randint(0, 20))
+            if status == 'Ca' or requested > available:
+                request_status = 'R'
+            elif status == 'Cl':
+                request_status = 'B'
+            else:
+                request_status = rng.choices(('P', 'A', 'B'), (50, 20, 30))[0]
+            if request_status == 'B':
+                available -= requested
+            status_date = request_date + datetime.timedelta(days=rng.randint(0, 5))
+            updated = max(updated, status_date)
+            self.oil_requests.add(
+                self.oil_requests.new_id(), offer_id, requested, 'l', round(price * rng.uniform(0.9, 1.0), 1), 'TND',
+                request_date, 'C', rng.choice(self.consumers), rng.randint(3, 5) if request_status == 'B' else 0,
+                rng.choice(FEEDBACKS) if request_status == 'B' else '', request_status, status_date,
+                self.code('oil purchase', request_date))
+        self.oil_offers.add(
+            offer_id, product_id, offered, available, 'l', price, 'TND', rng.choice(('D', 'R')), created, updated,
+            kind, volume, status, self.code('oil selling', created), False, owner_mill_id,
+            owner_id if owner_category == 'F' else None)
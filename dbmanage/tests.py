@@ -1,9 +1,76 @@
 from django.test import TestCase
-from django.urls import reverse
+from django.urls import URLResolver, get_resolver, reverse
 from rest_framework import status
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
 from dbmanage.models import *
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from array import array
+import base64
+from io import StringIO
+from django.core.management import call_command
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+from datetime import date, timedelta
+import difflib
+import os
+import re
+import tempfile
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.test import override_settings
+import json
+from dbmanage.authentication import tokens_for
+from dbmanage import (codes, dispatcher, exports, geo, lineage, loadsim, matching, ownership, passwords, perf,
+                      profile_cache, purchases, search, series, synthetic, versions)
+import random
+from dbmanage.serializers import OilMillSerializer
+from dbmanage.query_optimizer import get_query_plan
+from dbmanage.serializers import OliveSaleOfferSerializer, ExtractionOperationSerializer
+
+# the settings keep the production defaults, this module switches what a test cannot afford: the
+# notifications it causes are read in its own transaction, where no dispatcher thread sees them
+# (NotificationDispatcherTest drives the outbox itself), and production password hashing
+_module_settings = override_settings(
+    NOTIFICATION_DISPATCHER={'MODE': 'sync'},
+    PASSWORD_HASHING={'ITERATIONS': 1000},
+)
+
+
+def setUpModule():
+    _module_settings.enable()
+
+
+def tearDownModule():
+    _module_settings.disable()
+
+
+def create_farmer(email='farmer@example.com'):
+    return Farmer.objects.create(email=email, first_name='Ali', last_name='Ben Salah', role='farmer',
+                                 country='Tunisia', address='Sfax')
+
+
+def create_grove(farmer, name='grove', **kwargs):
+    values = dict(address='Sfax', trees_age=20, area=3.5, density=120, olives_variety='Chemlali', soil_type='SN',
+                  fertilizers_used='none', cropping_system='R', practice='O', grove_picture='images/grove.png')
+    values.update(kwargs)
+    return OliveGrove.objects.create(farmer=farmer, name=name, **values)
+
+
+def create_harvest(grove, day=0, quantity=10.0):
+    return Harvest.objects.create(grove=grove, harvest_date=date(2023, 11, 1) + timedelta(days=day),
+                                  harvest_method='Mn', initial_quantity=quantity, remaining_quantity=quantity,
+                                  maturity_index='G', characterization='Mono', containers='Bg',
+                                  harvest_picture='images/harvest.png')
+
+
+def create_olive_sale_offer(harvest, day=0, price=2.5, quantity=5.0, **kwargs):
+    creation_date = date(2023, 11, 1) + timedelta(days=day)
+    return OliveSaleOffer.objects.create(harvest=harvest, initial_quantity_for_sell=quantity,
+                                         available_quantity_for_sell=quantity, offer_price=price,
+                                         availability_date=creation_date, transportation='D',
+                                         creation_date=creation_date, update_date=creation_date, **kwargs)
 
 
 class RegisterViewTest(TestCase):
@@ -141,3 +208,1574 @@ class TokenTests(APITestCase):
         data = {'refresh': 'invalid'}
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+def create_sensor(owner, sensor_id='sensor-1', storage_area=None):
+    if storage_area is None:
+        storage_area = StorageArea.objects.create(local_type='cellar', address='Sfax', container_type='inox',
+                                                  container_number=4, farmer=owner)
+    return IoTSensor.objects.create(sensor_id=sensor_id, type='temperature', constructor='Bosch',
+                                    deployment_date=date(2023, 1, 1), storage_area=storage_area)
+
+
+def create_mill(manager_email='manager@example.com', name='Huilerie'):
+    manager = MillManager.objects.create(email=manager_email, first_name='Sami', last_name='Trabelsi',
+                                         role='mill manager')
+    return OilMill.objects.create(mill_manager=manager, name=name, address='Sfax', country='Tunisia', fax='74000000',
+                                  website='https://example.com', creation_date=date(2020, 1, 1), milling_capacity=10,
+                                  transformation_capacity_unit='t', chains_number=2, storage_capacity=100,
+                                  storage_capacity_unit='t', practice='C', quality_certificate='ISO 22000',
+                                  agreement_date=date(2020, 1, 1))
+
+
+class QueryOptimizerTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.grove = create_grove(self.farmer)
+        self.client.force_authenticate(self.farmer)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('olive_sale_offers_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def test_plan_follows_nested_serializers(self):
+        select, prefetch = get_query_plan(OliveSaleOfferSerializer)
+        # the farmer profile is served by the profile cache, not joined
+        self.assertEqual(select, ('harvest__grove',))
+        select, prefetch = get_query_plan(ExtractionOperationSerializer)
+        self.assertIn('extraction_offer__extraction_request__harvest__grove', select)
+        self.assertEqual([lookup for lookup, model, plan in prefetch], ['used_machines', 'purchased_olives'])
+
+    def test_list_query_count_does_not_depend_on_rows(self):
+        create_olive_sale_offer(create_harvest(self.grove, day=0), day=0)
+        self.count_list_queries()  # warms the profile cache
+        single = self.count_list_queries()
+        for day in range(1, 6):
+            create_olive_sale_offer(create_harvest(self.grove, day=day), day=day)
+        self.assertEqual(self.count_list_queries(), single)
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        farmer = create_farmer()
+        grove = create_grove(farmer)
+        self.client.force_authenticate(farmer)
+        # duplicated prices exercise the id tiebreaker
+        self.offers = [create_olive_sale_offer(create_harvest(grove, day=day), day=day, price=[3, 1, 2][day % 3])
+                       for day in range(7)]
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen.extend(offer['id'] for offer in response.data['results'])
+            url = response.data['next']
+        return seen, response
+
+    def test_pages_follow_sort_order_without_duplicates(self):
+        url = reverse('olive_sale_offers_list') + '?sort_by=price_desc&page_size=2'
+        seen, last_page = self.walk(url)
+        expected = [offer.id for offer in sorted(self.offers, key=lambda offer: (-offer.offer_price, -offer.id))]
+        self.assertEqual(seen, expected)
+
+        previous = self.client.get(last_page.data['previous'])
+        self.assertEqual([offer['id'] for offer in previous.data['results']], expected[-3:-1])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('olive_sale_offers_list') + '?cursor=garbage')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        # well formed cursors with values of the wrong type
+        for sort_by, values in (('', [{'x': 1}]), ('', [None]), ('price_asc', ['cheap', 1]),
+                                ('price_asc', [2.5, [1]])):
+            cursor = base64.urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+            response = self.client.get(reverse('olive_sale_offers_list'), {'cursor': cursor, 'sort_by': sort_by})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND, values)
+        cursor = base64.urlsafe_b64encode(json.dumps({'v': ['2.5', self.offers[0].id]}).encode()).decode()
+        response = self.client.get(reverse('olive_sale_offers_list'), {'cursor': cursor, 'sort_by': 'price_asc'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class HotPathIndexTest(TestCase):
+    def setUp(self):
+        grove = create_grove(create_farmer())
+        for day in range(30):
+            create_olive_sale_offer(create_harvest(grove, day=day), day=day,
+                                    offer_status='A' if day % 10 == 0 else 'Cl')
+
+    def test_available_offers_use_partial_index(self):
+        offers = OliveSaleOffer.objects.available()
+        self.assertEqual(offers.count(), 3)
+        self.assertEqual(set(offers.values_list('offer_status', flat=True)), {'A'})
+
+    def test_every_hot_path_uses_its_index(self):
+        out = StringIO()
+        call_command('explain_hot_paths', '--analyze', '--strict', stdout=out)
+        self.assertNotIn('MISS', out.getvalue())
+
+
+class OfferSearchTest(APITestCase):
+    def setUp(self):
+        farmer = create_farmer()
+        self.client.force_authenticate(farmer)
+        chemlali = create_grove(farmer, name='Oued Sfax', olives_variety='Chemlali', address='Sfax')
+        chetoui = create_grove(farmer, name='Beja Hills', olives_variety='Chetoui', address='Beja')
+        self.chemlali_offer = create_olive_sale_offer(create_harvest(chemlali, day=0), day=0)
+        self.chetoui_offer = create_olive_sale_offer(create_harvest(chetoui, day=1), day=1)
+
+    def search(self, **params):
+        response = self.client.get(reverse('offer_search'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_prefix_search_and_facets(self):
+        data = self.search(q='chem')
+        self.assertEqual([result['id'] for result in data['results']], [self.chemlali_offer.id])
+        self.assertEqual(data['results'][0]['grove'], 'Oued Sfax')
+        self.assertEqual(data['facets']['variety'], [{'value': 'Chemlali', 'count': 1}])
+
+        data = self.search(kind='olive')
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self.search(q='sfax', variety='Chetoui')['results'], [])
+        self.assertEqual(len(self.search(kind='olive', limit=1)['results']), 1)
+        for limit in (0, -1):
+            response = self.client.get(reverse('offer_search'), {'kind': 'olive', 'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_index_follows_updates_and_deletes(self):
+        grove = self.chetoui_offer.harvest.grove
+        grove.olives_variety = 'Zalmati'
+        grove.save()
+        self.assertEqual(len(self.search(q='zalmati')['results']), 1)
+
+        self.chetoui_offer.delete()
+        self.assertEqual(self.search(q='zalmati')['results'], [])
+
+    def test_only_available_offers_are_found(self):
+        mill = create_mill()
+        purchases.confirm_olive_purchases([create_purchase_request(self.chemlali_offer, mill, 5).pk],
+                                          mill.mill_manager_id)
+        self.assertEqual(self.search(q='chemlali')['results'], [])
+
+        self.chetoui_offer.offer_status = 'Ca'
+        self.chetoui_offer.save()
+        self.assertEqual(self.search(kind='olive')['count'], 0)
+        self.chetoui_offer.offer_status = 'A'
+        self.chetoui_offer.save()
+        self.assertEqual(search.rebuild(), 1)
+        self.assertEqual([result['id'] for result in self.search(kind='olive')['results']], [self.chetoui_offer.id])
+
+
+class SensorBulkIngestTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.sensor = create_sensor(self.farmer)
+        create_sensor(create_farmer('other@example.com'), sensor_id='foreign-sensor')
+        self.client.force_authenticate(self.farmer)
+        self.url = reverse('sensor_measurements_bulk')
+
+    def test_ndjson_batch_reports_rejected_rows(self):
+        body = '\n'.join([
+            '{"sensor_id": "sensor-1", "parameter": "temperature", "value": 18.5, "date": "2023-11-02"}',
+            '{"sensor_id": "sensor-1", "parameter": "humidity", "value": "65.25", "date": "2023-11-02T10:15:00Z"}',
+            '{"sensor_id": "foreign-sensor", "parameter": "temperature", "value": 18, "date": "2023-11-02"}',
+            '{"sensor_id": "sensor-1", "parameter": "temperature", "value": 1000, "date": "2023-11-02"}',
+            'not json',
+        ])
+        response = self.client.generic('POST', self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(response.data['rejected'], [
+            {'line': 3, 'error': 'unknown sensor'},
+            {'line': 4, 'error': 'invalid value'},
+            {'line': 5, 'error': 'invalid JSON'},
+        ])
+        self.assertEqual(self.sensor.measurements.count(), 2)
+
+    def test_csv_batch(self):
+        body = 'sensor_id,parameter,value,date\nsensor-1,temperature,17.125,2023-11-03\nsensor-1,,17,2023-11-03\n'
+        response = self.client.generic('POST', self.url, body, content_type='text/csv')
+        self.assertEqual(response.data['accepted'], 1)
+        self.assertEqual(response.data['rejected'], [{'line': 3, 'error': 'invalid parameter'}])
+        self.assertEqual(str(self.sensor.measurements.get().value), '17.125')
+
+
+class SensorRollupTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.sensor = create_sensor(self.farmer)
+        self.client.force_authenticate(self.farmer)
+        self.url = reverse('sensor_series', args=[self.sensor.pk])
+
+    def ingest(self, rows):
+        body = '\n'.join(f'sensor-1,temperature,{value},{timestamp}' for timestamp, value in rows)
+        response = self.client.generic('POST', reverse('sensor_measurements_bulk'), body, content_type='text/csv')
+        self.assertEqual(response.data['rejected_count'], 0)
+
+    def test_ingest_maintains_hourly_and_daily_rollups(self):
+        self.ingest([('2023-11-02T10:05:00Z', 18), ('2023-11-02T10:40:00Z', 20), ('2023-11-02T11:00:00Z', 13)])
+        self.ingest([('2023-11-02T10:50:00Z', 16)])
+        hourly = SensorRollup.objects.get(resolution='h', bucket_start='2023-11-02T10:00:00Z')
+        self.assertEqual((hourly.count, hourly.minimum, hourly.maximum, hourly.average), (3, 16.0, 20.0, 18.0))
+        daily = SensorRollup.objects.get(resolution='d')
+        self.assertEqual((daily.count, daily.minimum, daily.maximum), (4, 13.0, 20.0))
+
+        measurement = SensorMeasurement.objects.get(value=20)
+        measurement.delete()
+        hourly.refresh_from_db()
+        self.assertEqual((hourly.count, hourly.maximum), (2, 18.0))
+
+        SensorRollup.objects.all().delete()
+        call_command('rebuild_sensor_rollups', stdout=StringIO())
+        self.assertEqual(SensorRollup.objects.get(resolution='d').count, 3)
+
+    def test_deleting_a_sensor_deletes_its_measurements_and_rollups_at_once(self):
+        self.ingest([(f'2023-11-{day:02}T{hour:02}:30:00Z', hour) for day in range(1, 11) for hour in range(24)])
+        self.assertEqual(SensorRollup.objects.filter(resolution='h').count(), 240)
+        with self.assertNumQueries(4):
+            # one DELETE per table, none per measurement or bucket
+            self.sensor.delete()
+        self.assertFalse(SensorMeasurement.objects.exists())
+        self.assertFalse(SensorRollup.objects.exists())
+
+        # and with their storage area
+        sensor = create_sensor(self.farmer)
+        self.ingest([('2023-11-02T10:05:00Z', 18)])
+        sensor.storage_area.delete()
+        self.assertFalse(SensorMeasurement.objects.exists())
+        self.assertFalse(SensorRollup.objects.exists())
+
+    def test_series_picks_resolution_from_range_and_budget(self):
+        start = date(2023, 1, 1)
+        self.ingest([(f'{start + timedelta(days=day)}T{hour:02}:30:00Z', day % 30)
+                     for day in range(365) for hour in (6, 18)])
+        query = {'parameter': 'temperature', 'start': '2023-01-01T00:00:00Z', 'end': '2024-01-01T00:00:00Z'}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {**query, 'points': 500})
+        self.assertEqual(response.data['resolution'], 'd')
+        self.assertEqual(len(response.data['points']), 365)
+        self.assertEqual(response.data['points'][0]['count'], 2)
+        self.assertFalse([query for query in queries if 'dbmanage_sensormeasurement' in query['sql']])
+        # more days than points: days are merged to fit the budget
+        response = self.client.get(self.url, {**query, 'points': 10})
+        self.assertEqual(response.data['resolution'], '37d')
+        self.assertLessEqual(len(response.data['points']), 10)
+        self.assertEqual(sum(point['count'] for point in response.data['points']), 730)
+
+        # two days: 48 hourly buckets, 4 + 60 raw rows
+        self.ingest([(f'2023-01-01T07:{minute:02}:00Z', 10) for minute in range(60)])
+        query['end'] = '2023-01-03T00:00:00Z'
+        response = self.client.get(self.url, {**query, 'points': 10})
+        self.assertEqual(response.data['resolution'], 'd')
+        response = self.client.get(self.url, {**query, 'points': 48})
+        self.assertEqual(response.data['resolution'], 'h')
+        self.assertEqual([point['count'] for point in response.data['points']], [1, 60, 1, 1, 1])
+        response = self.client.get(self.url, {**query, 'points': 100})
+        self.assertEqual(response.data['resolution'], 'raw')
+        self.assertEqual(len(response.data['points']), 64)
+        response = self.client.get(self.url, {**query, 'points': 10, 'resolution': 'raw'})
+        self.assertEqual(len(response.data['points']), 10)
+        response = self.client.get(self.url, {**query, 'points': 5, 'resolution': 'h'})
+        self.assertEqual(response.data['resolution'], '10h')
+        self.assertEqual([point['count'] for point in response.data['points']], [61, 1, 1, 1])
+
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        other = create_sensor(create_farmer('other@example.com'), sensor_id='foreign-sensor')
+        response = self.client.get(reverse('sensor_series', args=[other.pk]), query)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SensorSeriesChunkTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.sensor = create_sensor(self.farmer)
+        self.client.force_authenticate(self.farmer)
+
+    def test_codec_round_trip(self):
+        start = 1698883200000
+        # steady rate with a gap and jitter, repeated and slowly moving values, then an outlier
+        timestamps = [start + second * 1000 for second in range(500)] + [start + 900000 + 7, start + 901003]
+        values = [18.5] * 100 + [18.5 + index / 100 for index in range(400)] + [-3.25, 1e6]
+        blob = series.encode(timestamps, values)
+        self.assertEqual(series.decode(blob), (array('q', timestamps), array('d', values)))
+        self.assertLess(len(blob), len(values) * 2)
+        self.assertEqual(series.decode(series.encode([], [])), (array('q'), array('d')))
+
+    def test_chunked_sensor_ingest_and_read(self):
+        self.sensor.series_storage = IoTSensor.CHUNKED
+        self.sensor.save()
+        start = parse_datetime('2023-11-02T00:00:00Z')
+        body = '\n'.join(f'sensor-1,temperature,{18 + minute / 100},{(start + timedelta(minutes=minute)).isoformat()}'
+                         for minute in range(0, 2880, 5))
+        self.client.generic('POST', reverse('sensor_measurements_bulk'), body, content_type='text/csv')
+        # late readings are merged into the existing chunk
+        body = 'sensor-1,temperature,99,2023-11-02T12:02:00Z'
+        self.client.generic('POST', reverse('sensor_measurements_bulk'), body, content_type='text/csv')
+
+        self.assertFalse(SensorMeasurement.objects.exists())
+        self.assertEqual(list(self.sensor.series_chunks.values_list('day', 'count')),
+                         [(date(2023, 11, 2), 289), (date(2023, 11, 3), 288)])
+        readings = list(series.iter_readings(self.sensor.pk, 'temperature',
+                                             parse_datetime('2023-11-02T12:00:00Z'),
+                                             parse_datetime('2023-11-02T12:10:00Z')))
+        self.assertEqual([value for timestamp, value in readings], [18 + 720 / 100, 99.0, 18 + 725 / 100])
+        self.assertEqual(SensorRollup.objects.get(resolution='d', bucket_start='2023-11-02T00:00:00Z').count, 289)
+
+        response = self.client.get(reverse('sensor_series', args=[self.sensor.pk]), {
+            'parameter': 'temperature', 'start': '2023-11-02T12:00:00Z', 'end': '2023-11-02T12:10:00Z'})
+        self.assertEqual(response.data['resolution'], 'raw')
+        self.assertEqual(len(response.data['points']), 3)
+
+    def test_compact_command_moves_rows(self):
+        for day in range(3):
+            SensorMeasurement.objects.create(sensor=self.sensor, parameter='humidity', value=60 + day,
+                                             date=date(2023, 11, 1) + timedelta(days=day))
+        call_command('compact_sensor_series', 'sensor-1', stdout=StringIO())
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.series_storage, IoTSensor.CHUNKED)
+        self.assertFalse(self.sensor.measurements.exists())
+        self.assertEqual([value for timestamp, value in series.iter_readings(self.sensor.pk, 'humidity')],
+                         [60.0, 61.0, 62.0])
+        self.assertEqual(SensorRollup.objects.filter(resolution='d').count(), 3)
+
+
+class ProfileCacheTest(APITestCase):
+    def setUp(self):
+        profile_cache.get_cache().clear()
+        self.farmer = create_farmer()
+        self.grove = create_grove(self.farmer)
+        self.offer = create_olive_sale_offer(create_harvest(self.grove))
+        self.client.force_authenticate(self.farmer)
+        self.url = reverse('olive_sale_offer_farmer_profile', args=[self.offer.pk])
+
+    def get_profile(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in context.captured_queries]
+
+    def test_profile_is_served_from_cache_and_invalidated(self):
+        response, cold = self.get_profile()
+        self.assertEqual(response.data['first_name'], 'Ali')
+        self.assertTrue([sql for sql in cold if 'dbmanage_farmer' in sql])
+        response, warm = self.get_profile()
+        self.assertEqual(len(warm), 1)
+        self.assertFalse([sql for sql in warm if 'dbmanage_user' in sql or 'dbmanage_farmer' in sql])
+
+        self.farmer.first_name = 'Salah'
+        self.farmer.save()
+        self.assertEqual(self.get_profile()[0].data['first_name'], 'Salah')
+        # a save through the base User model invalidates as well
+        user = User.objects.get(pk=self.farmer.pk)
+        user.first_name = 'Amel'
+        user.save()
+        self.assertEqual(self.get_profile()[0].data['first_name'], 'Amel')
+
+    def test_cold_page_loads_profiles_in_one_query(self):
+        for index in range(1, 4):
+            grove = create_grove(create_farmer(f'farmer{index}@example.com'), name=f'grove{index}')
+            create_olive_sale_offer(create_harvest(grove, day=index), day=index)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('olive_sale_offers_list'))
+        farmer_queries = [query for query in context.captured_queries if 'dbmanage_farmer' in query['sql']]
+        self.assertEqual(len(farmer_queries), 1)
+        self.assertEqual(len({offer['harvest']['grove']['farmer']['email'] for offer in response.data['results']}), 4)
+
+    @override_settings(PROFILE_CACHE={'BACKEND': 'dbmanage.profile_cache.DjangoCacheBackend',
+                                      'OPTIONS': {'alias': 'profiles'}},
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'profiles': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                            'LOCATION': 'profiles'}})
+    def test_shared_backend_and_nested_manager(self):
+        mill = create_mill()
+        manager = mill.mill_manager
+        self.assertEqual(OilMillSerializer.cached_representation(mill.pk)['mill_manager']['first_name'], 'Sami')
+        manager.first_name = 'Sonia'
+        manager.save()
+        self.assertEqual(OilMillSerializer.cached_representation(mill.pk)['mill_manager']['first_name'], 'Sonia')
+        self.assertIsNone(OilMillSerializer.cached_representation(mill.pk + 1000))
+
+
+def create_purchase_request(offer, mill, quantity, day=0, request_status='A'):
+    request_date = date(2023, 11, 1) + timedelta(days=day)
+    return OlivePurchaseRequest.objects.create(olive_sale_offer=offer, mill=mill, requested_quantity=quantity,
+                                               requested_price=2.5, request_date=request_date, buyer_appreciation=0,
+                                               buyer_feedback='', request_status=request_status,
+                                               status_update_date=request_date)
+
+
+class OlivePurchaseConfirmationTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.offer = create_olive_sale_offer(create_harvest(create_grove(self.farmer)), quantity=5.0)
+        self.mill = create_mill()
+        self.client.force_authenticate(self.mill.mill_manager)
+
+    def confirm(self, purchase_request):
+        return self.client.post(reverse('confirm_olive_purchase', args=[purchase_request.pk]))
+
+    def test_confirmations_take_quantity_and_close_the_offer(self):
+        first = create_purchase_request(self.offer, self.mill, 2.0, day=0)
+        second = create_purchase_request(self.offer, self.mill, 3.0, day=1)
+        # versioned before, as in a running system: the confirmation bumps it with one UPDATE
+        ResourceVersion.objects.create(name=versions.name_of(PurchasedOlive), version=1, updated_at=timezone.now())
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.confirm(first).status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(context.captured_queries), 9)
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.available_quantity_for_sell, self.offer.offer_status), (3.0, 'A'))
+
+        self.assertEqual(self.confirm(second).status_code, status.HTTP_200_OK)
+        self.offer.refresh_from_db()
+        self.assertEqual((self.offer.available_quantity_for_sell, self.offer.offer_status), (0.0, 'Cl'))
+        purchased = PurchasedOlive.objects.get(olive_purchase_request=second)
+        self.assertEqual((purchased.olives_variety, purchased.practice, purchased.mill), ('Chemlali', 'O', self.mill))
+        self.assertEqual(Notification.objects.filter(user=self.farmer, message__endswith='is closed.').count(), 1)
+        self.assertEqual(self.confirm(second).status_code, status.HTTP_409_CONFLICT)
+
+    def test_refused_confirmations_write_nothing(self):
+        too_big = create_purchase_request(self.offer, self.mill, 6.0, day=0)
+        pending = create_purchase_request(self.offer, self.mill, 1.0, day=1, request_status='P')
+        other = create_purchase_request(self.offer, create_mill('other@example.com', 'Other'), 1.0, day=2)
+        self.assertEqual(self.confirm(too_big).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.confirm(pending).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.confirm(other).status_code, status.HTTP_403_FORBIDDEN)
+        too_big.refresh_from_db()
+        self.offer.refresh_from_db()
+        self.assertEqual((too_big.request_status, self.offer.available_quantity_for_sell), ('A', 5.0))
+        self.assertFalse(PurchasedOlive.objects.exists() or Notification.objects.exists())
+
+    def test_cancelled_offers_are_not_sold(self):
+        purchase_request = create_purchase_request(self.offer, self.mill, 2.0)
+        OliveSaleOffer.objects.filter(pk=self.offer.pk).update(offer_status='Ca')
+        response = self.confirm(purchase_request)
+        self.assertEqual((response.status_code, response.data['error']),
+                         (status.HTTP_409_CONFLICT, 'The sale offer is no longer available'))
+        purchase_request.refresh_from_db()
+        self.offer.refresh_from_db()
+        self.assertEqual((purchase_request.request_status, self.offer.available_quantity_for_sell,
+                          self.offer.offer_status), ('A', 5.0, 'Ca'))
+
+        too_big = create_purchase_request(self.offer, self.mill, 6.0, day=1)
+        OliveSaleOffer.objects.filter(pk=self.offer.pk).update(offer_status='A')
+        self.assertEqual(self.confirm(too_big).data['error'],
+                         'The sale offer does not have the requested quantity left')
+
+    def test_purchase_requests_are_shown_to_both_parties(self):
+        purchase_request = create_purchase_request(self.offer, self.mill, 2.0)
+        create_purchase_request(self.offer, create_mill('other@example.com', 'Other'), 1.0, day=1)
+        detail = reverse('olive_purchase_request_detail', args=[purchase_request.pk])
+        for user, expected in ((self.mill.mill_manager, 1), (self.farmer, 2), (create_farmer('x@example.com'), 0)):
+            self.client.force_authenticate(user)
+            response = self.client.get(reverse('olive_purchase_request_list'))
+            self.assertEqual(len(response.data['results']), expected)
+            self.assertEqual(self.client.get(detail).status_code,
+                             status.HTTP_200_OK if expected else status.HTTP_404_NOT_FOUND)
+
+    def test_benchmark_command_reports_no_oversell(self):
+        out = StringIO()
+        call_command('benchmark_olive_purchases', workers=1, requests=8, offer_quantity=5, stdout=out)
+        self.assertIn('confirmed 5, refused (sold out) 3', out.getvalue())
+        self.assertFalse(OliveSaleOffer.objects.filter(harvest__grove__name__startswith='bench-').exists())
+
+
+class NotificationDispatcherTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.mill = create_mill()
+
+    def test_outbox_rows_are_written_once_after_a_restart(self):
+        intents = [{'user_id': self.farmer.id, 'oil_mill_id': None, 'message': 'sold', 'intent_id': 'a' * 32},
+                   {'user_id': None, 'oil_mill_id': self.mill.id, 'message': 'approved', 'intent_id': 'b' * 32}]
+        # committed by a process that stopped before writing them
+        NotificationOutbox.objects.create(payload=json.dumps(intents))
+
+        restarted = dispatcher.NotificationDispatcher(batch_size=1)
+        self.assertEqual(restarted.flush(), 2)
+        self.assertFalse(NotificationOutbox.objects.exists())
+        # a row read again after a crash between the insert and its removal is a no-op
+        NotificationOutbox.objects.create(payload=json.dumps(intents))
+        restarted.flush()
+        self.assertEqual(Notification.objects.count(), 2)
+        self.assertTrue(Notification.objects.filter(oil_mill=self.mill, message='approved').exists())
+
+    def test_thread_mode_writes_one_outbox_row_in_the_transaction(self):
+        with override_settings(NOTIFICATION_DISPATCHER={'MODE': 'thread'}):
+            with self.assertNumQueries(1), self.captureOnCommitCallbacks() as callbacks:
+                dispatcher.notify_many([{'message': 'sold', 'user_id': self.farmer.id},
+                                        {'message': 'bought', 'oil_mill_id': self.mill.id}])
+            # the thread is woken up once the transaction commits
+            self.assertEqual(len(callbacks), 1)
+            self.assertFalse(Notification.objects.exists())
+            self.assertEqual(dispatcher.NotificationDispatcher().flush(), 2)
+        self.assertEqual(set(Notification.objects.values_list('user_id', 'oil_mill_id')),
+                         {(self.farmer.id, None), (None, self.mill.id)})
+
+        # rolled back with the transaction sending them
+        with override_settings(NOTIFICATION_DISPATCHER={'MODE': 'thread'}):
+            with transaction.atomic():
+                dispatcher.notify('sold again', user_id=self.farmer.id)
+                transaction.set_rollback(True)
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_approving_a_request_notifies_the_mill(self):
+        offer = create_olive_sale_offer(create_harvest(create_grove(self.farmer)))
+        purchase_request = create_purchase_request(offer, self.mill, 1.0, request_status='P')
+        self.client.force_authenticate(self.farmer)
+        response = self.client.post(reverse('approve_olive_purchase_request', args=[purchase_request.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        purchase_request.refresh_from_db()
+        self.assertEqual(purchase_request.request_status, 'A')
+        self.assertEqual(Notification.objects.get(oil_mill=self.mill).user_id, None)
+
+        self.client.force_authenticate(create_farmer('other@example.com'))
+        response = self.client.post(reverse('approve_olive_purchase_request', args=[purchase_request.pk]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+def create_oil_product(code, mother=None, quantity=100.0, cause='E', unit='l', owner=None, **kwargs):
+    kwargs.setdefault('owner_category', 'F')
+    return OilProduct.objects.create(
+        production_date=date(2023, 11, 2), creation_cause=cause, produced_quantity=quantity,
+        remaining_quantity=quantity, quantity_unit=unit, owner=owner, mother_product=mother,
+        oil_product_code=code, **kwargs)
+
+
+class OilProductLineageTest(APITestCase):
+    def setUp(self):
+        # extraction -> storage -> two bottle lots, the first one resold
+        self.extraction = create_oil_product('extraction', quantity=1000)
+        self.stored = create_oil_product('stored', self.extraction, 600, cause='St')
+        self.bottles = create_oil_product('bottles', self.stored, 200, cause='P')
+        self.cans = create_oil_product('cans', self.stored, 150, cause='P', unit='kg')
+        self.resold = create_oil_product('resold', self.bottles, 50, cause='B')
+
+    def codes(self, products):
+        return [product.oil_product_code for product in products]
+
+    def assert_matches_rebuild(self):
+        links = set(OilProductLineage.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        lineage.rebuild()
+        self.assertEqual(set(OilProductLineage.objects.values_list('ancestor_id', 'descendant_id', 'depth')), links)
+
+    def test_lineage_is_read_in_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual([(product.oil_product_code, product.depth) for product in lineage.ancestors(self.resold.pk)],
+                             [('extraction', 3), ('stored', 2), ('bottles', 1)])
+        self.assertEqual(self.codes(lineage.descendants(self.stored.pk)), ['bottles', 'cans', 'resold'])
+        self.assertEqual(lineage.root_id(self.resold.pk), self.extraction.pk)
+        self.assertEqual(lineage.root_id(self.extraction.pk), self.extraction.pk)
+        self.assertEqual(lineage.subtree_quantities([self.stored.pk, self.resold.pk]),
+                         {self.stored.pk: {'l': 850.0, 'kg': 150.0}, self.resold.pk: {'l': 50.0}})
+        self.assert_matches_rebuild()
+
+    def test_re_parenting_and_deleting_keep_the_closure_consistent(self):
+        other = create_oil_product('other', quantity=300)
+        self.bottles.mother_product = other
+        self.bottles.save()
+        self.assertEqual(self.codes(lineage.ancestors(self.resold.pk)), ['other', 'bottles'])
+        self.assertEqual(self.codes(lineage.descendants(self.extraction.pk)), ['stored', 'cans'])
+        self.assert_matches_rebuild()
+
+        self.bottles.mother_product = self.resold
+        with self.assertRaises(ValidationError):
+            self.bottles.save()
+
+        self.stored.delete()
+        self.assertEqual(lineage.root_id(self.cans.pk), self.cans.pk)
+        self.assertEqual(self.codes(lineage.descendants(self.extraction.pk)), [])
+        self.assert_matches_rebuild()
+
+    def test_lineage_endpoint(self):
+        farmer = create_farmer()
+        OilProduct.objects.filter(pk=self.bottles.pk).update(owner=farmer)
+        self.client.force_authenticate(farmer)
+        response = self.client.get(reverse('oil_product_lineage', args=[self.bottles.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['root']['oil_product_code'], 'extraction')
+        self.assertEqual([product['depth'] for product in response.data['ancestors']], [2, 1])
+        self.assertEqual(response.data['remaining_quantity'], {'l': 250.0})
+        response = self.client.get(reverse('oil_product_lineage', args=[self.stored.pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def create_extraction(mill, harvest=None):
+    today = date(2023, 11, 2)
+    return ExtractionOperation.objects.create(
+        oil_mill=mill, harvest=harvest, reception_date=today, start_date=today, finish_date=today,
+        olives_quantity=1, water_per_100kg=0, mixing_duration=30, press_temperature=27, method='continuous',
+        produced_quantity=180, produced_quantity_unit='l')
+
+
+class OilProductOwnershipTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.mill = create_mill()
+
+    def test_farmer_oil_is_owned_with_its_splits(self):
+        extraction = create_extraction(self.mill, harvest=create_harvest(create_grove(self.farmer)))
+        oil = create_oil_product('oil', extraction_operation=extraction)
+        bottles = create_oil_product('bottles', oil, cause='P')
+        bought = create_oil_product('bought', bottles, cause='B', owner=self.mill.mill_manager, owner_category='M')
+        self.assertEqual((oil.owner_id, bottles.owner_id, bottles.owner_mill_id), (self.farmer.id, self.farmer.id, None))
+        self.assertEqual((bought.owner_id, bought.owner_mill_id), (self.mill.mill_manager_id, self.mill.id))
+        self.assertEqual(oil.get_owner_instance(), self.farmer)
+
+        self.assertNotIn('JOIN', str(OilProduct.objects.owned_by(self.farmer).query))
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get(reverse('oil_product_list'))
+        self.assertEqual([product['oil_product_code'] for product in response.data['results']], ['bottles', 'oil'])
+
+    def test_mill_oil_follows_purchased_olives_and_mill_manager(self):
+        extraction = create_extraction(self.mill)
+        oil = create_oil_product('oil', extraction_operation=extraction, owner_category='M')
+        stored = create_oil_product('stored', oil, cause='St', owner_category='M')
+        self.assertEqual((oil.owner_id, stored.owner_id), (None, None))
+
+        offer = create_olive_sale_offer(create_harvest(create_grove(self.farmer)))
+        purchased = PurchasedOlive.objects.create(
+            olive_quantity=1, purchase_date=date(2023, 11, 1), olives_variety='Chemlali', maturity_index='G',
+            characterization='Mono', cropping_system='R', practice='O', mill=self.mill,
+            olive_purchase_request=create_purchase_request(offer, self.mill, 1.0))
+        extraction.purchased_olives.add(purchased)
+        self.assertEqual(list(OilProduct.objects.owned_by(self.mill.mill_manager).order_by('id')), [oil, stored])
+
+        manager = MillManager.objects.create(email='new-manager@example.com', role='mill manager')
+        old_manager = self.mill.mill_manager
+        self.mill.mill_manager = manager
+        self.mill.save()
+        self.assertEqual(OilProduct.objects.owned_by(manager).count(), 2)
+        self.assertFalse(OilProduct.objects.owned_by(old_manager).exists())
+
+        OilProduct.objects.update(owner=None, owner_mill=None)
+        out = StringIO()
+        call_command('backfill_oil_product_owners', stdout=out)
+        self.assertIn('owner of 2 oil products', out.getvalue())
+        self.assertEqual(set(OilProduct.objects.values_list('owner_id', 'owner_mill_id')), {(manager.id, self.mill.id)})
+
+
+def create_olive_need(mill, day=0, price_min=2, price_max=3, region='Sfax', **kwargs):
+    need_date = date(2023, 11, 1) + timedelta(days=day)
+    values = dict(quantity=10, olives_variety='Chemlali', cropping_system='R', practice='O', need_status='P')
+    values.update(kwargs)
+    return OliveNeed.objects.create(oil_mill=mill, price_min=price_min, price_max=price_max, region=region,
+                                    country='Tunisia', need_date=need_date, status_update_date=need_date, **values)
+
+
+class OliveMatchingTest(APITestCase):
+    def setUp(self):
+        matching.reset_engine('MATCHING')
+        self.addCleanup(matching.reset_engine, 'MATCHING')
+        self.farmer = create_farmer()
+        self.mill = create_mill()
+        sfax = create_grove(self.farmer, 'sfax', address='Route de Tunis, Sfax')
+        sousse = create_grove(self.farmer, 'sousse', address='Sousse')
+        organic = create_grove(self.farmer, 'organic', address='Sfax', practice='C')
+        self.cheap = create_olive_sale_offer(create_harvest(sousse, day=0), day=0, price=2.0)
+        self.local = create_olive_sale_offer(create_harvest(sfax, day=1), day=1, price=2.8, quantity=1)
+        self.expensive = create_olive_sale_offer(create_harvest(sousse, day=2), day=2, price=3.5)
+        self.other_practice = create_olive_sale_offer(create_harvest(organic, day=3), day=3, price=2.2)
+        self.need = create_olive_need(self.mill, olives_variety='chemlali ', quantity=1)
+
+    def test_interval_index_matches_a_scan(self):
+        index, intervals = matching.IntervalIndex(), {}
+        index.block_size = 4
+        generator = random.Random(7)
+        for pk in range(300):
+            low = generator.uniform(0, 100)
+            intervals[pk] = (low, low + generator.uniform(0, 20))
+            index.add(*intervals[pk], pk)
+        for pk in range(0, 300, 3):
+            index.remove(*intervals.pop(pk), pk)
+        self.assertEqual(len(index), 200)
+        for point in (0, 13.5, 50, 99.9, 130):
+            self.assertEqual(sorted(index.stab(point)),
+                             sorted(pk for pk, (low, high) in intervals.items() if low <= point <= high))
+
+    def test_offers_and_needs_are_matched_both_ways(self):
+        engine = matching.get_engine()
+        self.assertEqual(engine.offers_for_need(self.need.pk), [(self.local.pk, True), (self.cheap.pk, False)])
+        self.assertEqual(engine.offers_for_need(self.need.pk, min_quantity=2), [(self.cheap.pk, False)])
+        self.assertEqual(engine.needs_for_offer(self.local.pk), [(self.need.pk, True)])
+        self.assertEqual(engine.needs_for_offer(self.expensive.pk), [])
+
+        # updated once the transactions commit
+        with self.captureOnCommitCallbacks(execute=True):
+            self.expensive.offer_price = 2.9
+            self.expensive.save()
+            self.cheap.offer_status = 'Cl'
+            self.cheap.save()
+            other = create_olive_need(create_mill('other@example.com', 'Other'), day=1, region='Sousse',
+                                      price_min=2.5, price_max=4, quantity=5)
+        self.assertEqual(engine.offers_for_need(self.need.pk), [(self.local.pk, True), (self.expensive.pk, False)])
+        self.assertEqual(engine.needs_for_offer(self.expensive.pk), [(other.pk, True), (self.need.pk, False)])
+
+    def test_offers_have_the_quantity_of_the_need(self):
+        engine = matching.get_engine()
+        big = create_olive_need(self.mill, day=1, quantity=4)
+        bigger = create_olive_need(self.mill, day=2, quantity=10)
+        self.assertEqual(engine.offers_for_need(big.pk), [(self.cheap.pk, False)])
+        self.assertEqual(engine.offers_for_need(bigger.pk), [])
+        self.assertEqual(engine.offers_for_need(bigger.pk, min_quantity=0), [(self.local.pk, True),
+                                                                              (self.cheap.pk, False)])
+        # and the other way around
+        self.assertEqual(engine.needs_for_offer(self.local.pk), [(self.need.pk, True)])
+        self.assertEqual(engine.needs_for_offer(self.cheap.pk), [(self.need.pk, False), (big.pk, False)])
+
+        self.client.force_authenticate(self.mill.mill_manager)
+        response = self.client.get(reverse('olive_need_matches', args=[big.pk]))
+        self.assertEqual([offer['id'] for offer in response.data['matches']], [self.cheap.pk])
+        response = self.client.get(reverse('olive_need_matches', args=[big.pk]), {'min_quantity': 1})
+        self.assertEqual([offer['id'] for offer in response.data['matches']], [self.local.pk, self.cheap.pk])
+        self.client.force_authenticate(self.farmer)
+        response = self.client.get(reverse('olive_sale_offer_matching_needs', args=[self.local.pk]))
+        self.assertEqual([need['need_code'] for need in response.data['matches']], [self.need.need_code])
+
+    def test_matches_endpoint(self):
+        self.client.force_authenticate(self.mill.mill_manager)
+        with self.assertNumQueries(4):
+            # the need, then the index load (needs and offers), then the matched offers
+            response = self.client.get(reverse('olive_need_matches', args=[self.need.pk]), {'k': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(offer['offer_code'], offer['same_region']) for offer in response.data['matches']],
+                         [(self.local.offer_code, True)])
+        self.assertEqual(self.client.get(reverse('olive_need_matches', args=[self.need.pk]), {'k': 0}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(self.farmer)
+        self.assertEqual(self.client.get(reverse('olive_need_matches', args=[self.need.pk])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('olive_sale_offer_matching_needs', args=[self.cheap.pk]))
+        self.assertEqual([need['need_code'] for need in response.data['matches']], [self.need.need_code])
+
+
+def create_oil_sale_offer(product, day=0, price=10, **kwargs):
+    creation_date = date(2023, 11, 1) + timedelta(days=day)
+    return OilSaleOffer.objects.create(
+        oil_product=product, initial_quantity_for_sell=50, available_quantity_for_sell=50, quantity_unit='l',
+        offered_price=price, transportation='D', creation_date=creation_date, update_date=creation_date,
+        type_of_packaging='DGbt', packaging_volume='1l', offer_status='A', **kwargs)
+
+
+def create_oil_need(consumer, day=0, price_min=8, price_max=12, **kwargs):
+    need_date = date(2023, 11, 1) + timedelta(days=day)
+    values = dict(quantity=20, quantity_unit='l', oil_quality='EVOO', flavour='fruity', packaged=True,
+                  production_year=date(2023, 1, 1), cropping_system='R', practice='O', need_status='P')
+    values.update(kwargs)
+    return OilNeed.objects.create(consumer=consumer, buyer_category='C', price_min=price_min, price_max=price_max,
+                                  region='Tunis', country='Tunisia', need_date=need_date,
+                                  status_update_date=need_date, **values)
+
+
+class OilMatchingTest(APITestCase):
+    def setUp(self):
+        matching.reset_engine('MATCHING')
+        self.addCleanup(matching.reset_engine, 'MATCHING')
+        self.farmer = create_farmer()
+        self.mill = create_mill()
+        self.consumer = Consumer.objects.create(email='consumer@example.com', role='consumer')
+        evoo = dict(oil_quality='EVOO', is_packaged=True)
+        self.bottles = create_oil_product('bottles', owner=self.farmer, **evoo)
+        mill_oil = create_oil_product('mill-oil', owner=self.mill.mill_manager, owner_category='M', **evoo)
+        self.offer = create_oil_sale_offer(mill_oil, day=0, price=10, oil_mill=self.mill)
+        create_oil_sale_offer(mill_oil, day=1, price=20, oil_mill=self.mill)
+        create_oil_sale_offer(create_oil_product('lampante', oil_quality='L', is_packaged=True), day=2,
+                              farmer=self.farmer)
+        create_oil_product('bulk', owner=self.farmer, oil_quality='EVOO')
+
+    def test_sellers_are_notified_of_a_new_need(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            need = create_oil_need(self.consumer)
+        self.assertEqual(matching.get_oil_engine().sellers_for_need(need.pk),
+                         {'offers': [self.offer.pk], 'products': [self.bottles.pk]})
+        self.assertIn(self.offer.offer_code, Notification.objects.get(oil_mill=self.mill).message)
+        self.assertIn('bottles match the oil need', Notification.objects.get(user=self.farmer).message)
+
+    def test_buyers_are_notified_of_a_new_offer(self):
+        need = create_oil_need(self.consumer)
+        create_oil_need(self.consumer, day=1, packaged=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            offer = create_oil_sale_offer(self.bottles, day=3, price=12, farmer=self.farmer)
+        self.assertEqual(matching.get_oil_engine().needs_for_offer(offer.pk), [need.pk])
+        notification = Notification.objects.get(user=self.consumer)
+        self.assertIn(need.need_code, notification.message)
+
+        # the offers follow the product they sell
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bottles.oil_quality = 'VOO'
+            self.bottles.save()
+        self.assertEqual(matching.get_oil_engine().needs_for_offer(offer.pk), [])
+        self.assertEqual(matching.get_oil_engine().sellers_for_need(need.pk)['products'], [])
+
+
+class GeoSearchTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.client.force_authenticate(self.farmer)
+        rng = random.Random(15)
+        self.points = [(34.0 + rng.random() * 3, 9.0 + rng.random() * 2) for i in range(200)]
+        for i, (latitude, longitude) in enumerate(self.points):
+            create_grove(self.farmer, name=f'grove-{i}', latitude=latitude, longitude=longitude)
+        create_grove(self.farmer, name='unlocated')
+
+    def brute_force(self, latitude, longitude):
+        return sorted((geo.distance_km(latitude, longitude, lat, lon), f'grove-{i}')
+                      for i, (lat, lon) in enumerate(self.points))
+
+    def test_geohash_prefixes_follow_distance(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        grove = OliveGrove.objects.get(name='grove-0')
+        self.assertEqual(grove.geohash, geo.encode(*self.points[0]))
+        self.assertIsNone(OliveGrove.objects.get(name='unlocated').geohash)
+
+    def test_within_and_nearest_match_brute_force(self):
+        for latitude, longitude in [(34.74, 10.76), (35.5, 10.0), (36.8, 10.18)]:
+            expected = self.brute_force(latitude, longitude)
+            for radius_km in (5, 25, 80):
+                found = geo.within(OliveGrove.objects.all(), latitude, longitude, radius_km)
+                self.assertEqual([grove.name for grove in found],
+                                 [name for distance, name in expected if distance <= radius_km])
+            nearest = geo.nearest(OliveGrove.objects.all(), latitude, longitude, 7)
+            self.assertEqual([grove.name for grove in nearest], [name for distance, name in expected[:7]])
+            self.assertAlmostEqual(nearest[0].distance_km, expected[0][0])
+
+    def test_search_reads_geohash_ranges(self):
+        with CaptureQueriesContext(connection) as queries:
+            geo.within(OliveGrove.objects.all(), 34.74, 10.76, 10)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"geohash" >=', queries[0]['sql'])
+        self.assertNotIn('LIKE', queries[0]['sql'])
+
+    def test_nearby_mills_able_to_extract_a_harvest(self):
+        grove = OliveGrove.objects.get(name='grove-0')
+        harvest = create_harvest(grove, quantity=20)
+        small, big, far = (create_mill(f'manager{i}@example.com', f'mill-{i}') for i in range(3))
+        big.milling_capacity = 50
+        far.milling_capacity, far.transformation_capacity_unit = 20000, 'kg'
+        for mill, offset in ((small, 0.01), (big, 0.05), (far, 0.5)):
+            mill.latitude, mill.longitude = grove.latitude + offset, grove.longitude
+            mill.save()
+
+        response = self.client.get(reverse('nearby', args=['oil-mills']), {'harvest': harvest.pk, 'k': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([mill['name'] for mill in response.data['results']], ['mill-1', 'mill-2'])
+
+        response = self.client.get(reverse('nearby', args=['olive-groves']),
+                                   {'latitude': 34.74, 'longitude': 10.76, 'radius_km': 25})
+        self.assertEqual([row['name'] for row in response.data['results']],
+                         [name for distance, name in self.brute_force(34.74, 10.76) if distance <= 25])
+
+        other = create_farmer('other@example.com')
+        self.client.force_authenticate(other)
+        response = self.client.get(reverse('nearby', args=['oil-mills']), {'harvest': harvest.pk})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('nearby', args=['oil-mills']))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_nearby_needs_both_coordinates(self):
+        for params in ({'latitude': 34.7}, {'longitude': 10.7}, {'latitude': 'north', 'longitude': 10.7}):
+            response = self.client.get(reverse('nearby', args=['olive-groves']), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_geocode_oil_mills(self):
+        located, unknown = create_mill(), create_mill('manager2@example.com', 'Nowhere')
+        OilMill.objects.filter(pk=located.pk).update(address='Route de Gabes km 4, Sfax')
+        OilMill.objects.filter(pk=unknown.pk).update(address='Atlantis')
+        out = StringIO()
+        call_command('geocode_oil_mills', stdout=out)
+        located.refresh_from_db()
+        self.assertAlmostEqual(located.latitude, 34.74, places=1)
+        self.assertEqual(located.geohash, geo.encode(located.latitude, located.longitude))
+        self.assertIsNone(OilMill.objects.get(pk=unknown.pk).latitude)
+        self.assertIn('Located 1 oil mills, 1 not found.', out.getvalue())
+
+
+class CodeAllocatorTest(APITestCase):
+    def setUp(self):
+        self.harvest = create_harvest(create_grove(create_farmer()))
+
+    def test_codes_are_numbered_before_the_insert(self):
+        first, second = create_olive_sale_offer(self.harvest), create_olive_sale_offer(self.harvest)
+        self.assertEqual(first.offer_code, 'olive selling-20231101-000001')
+        self.assertEqual(second.offer_code, 'olive selling-20231101-000002')
+        self.assertEqual(self.harvest.harvest_code, '000001-20231101-grove')
+        self.assertEqual(CodeSequence.objects.get(prefix='olive selling').last_value, 2)
+
+    def test_bulk_create_with_assigned_codes(self):
+        offers = [OliveSaleOffer(harvest=self.harvest, initial_quantity_for_sell=1, available_quantity_for_sell=1,
+                                 offer_price=2, availability_date=date(2023, 11, 1), transportation='D',
+                                 creation_date=date(2023, 11, 1), update_date=date(2023, 11, 1))
+                  for i in range(1000)]
+        offers[0].offer_code = 'imported'
+        with CaptureQueriesContext(connection) as queries:
+            codes.assign(offers)
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        # the sequence row does not exist yet: update, insert, read back
+        self.assertEqual(len(statements), 3)
+        OliveSaleOffer.objects.bulk_create(offers)
+        self.assertEqual(OliveSaleOffer.objects.values('offer_code').distinct().count(), 1000)
+        self.assertEqual(offers[-1].offer_code, 'olive selling-20231101-000999')
+        # in a transaction, nothing is kept for later: the next save() follows the block
+        self.assertEqual(create_olive_sale_offer(self.harvest).offer_code, 'olive selling-20231101-001000')
+
+    def test_service_requests_are_numbered_per_type(self):
+        request = ExtractionRequest.objects.create(
+            farmer=self.harvest.grove.farmer, harvest=self.harvest, considered_quantity=1, requested_price=1,
+            request_date=date(2023, 11, 2), request_status='P', status_update_date=date(2023, 11, 2))
+        self.assertEqual(request.request_code, 'extractionrequest-20231102-000001')
+
+
+class BulkImportTest(APITestCase):
+    grove_columns = 'name,farmer,address,latitude,trees_age,area,density,olives_variety,soil_type,fertilizers_used,' \
+                    'cropping_system,practice'
+
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.other = create_farmer('other@example.com')
+        create_grove(self.other, name='foreign')
+
+    def test_groves_imported_by_an_administrator(self):
+        self.client.force_authenticate(User.objects.create(email='admin@example.com', role='administrator'))
+        body = '\n'.join([
+            self.grove_columns,
+            'north,farmer@example.com,Sfax,34.7,20,3.5,120,Chemlali,SN,none,R,O',
+            'south,other@example.com,Gabes,,15,2,100,Chetoui,C,compost,I,C',
+            'east,nobody@example.com,Sfax,,15,2,100,Chetoui,C,compost,I,C',
+            'west,farmer@example.com,Sfax,,15,2,100,Chetoui,Rock,compost,I,C',
+            'north,farmer@example.com,Sfax,,15,2,100,Chetoui,C,compost,I,C',
+        ])
+        response = self.client.generic('POST', reverse('bulk_import', args=['olive-groves']), body,
+                                       content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['accepted'], response.data['committed_line']), (2, 6))
+        self.assertEqual(response.data['rejected'], [
+            {'line': 4, 'error': 'unknown farmer'},
+            {'line': 5, 'error': 'invalid soil_type'},
+            {'line': 6, 'error': 'duplicate name'},
+        ])
+        north = OliveGrove.objects.get(name='north')
+        self.assertEqual((north.farmer_id, north.latitude), (self.farmer.id, 34.7))
+        self.assertIsNone(north.geohash)
+        self.assertEqual(OliveGrove.objects.get(name='south').farmer_id, self.other.id)
+
+        self.client.force_authenticate(create_mill().mill_manager)
+        response = self.client.generic('POST', reverse('bulk_import', args=['olive-groves']), body,
+                                       content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_harvests_and_offers_imported_by_a_farmer(self):
+        create_grove(self.farmer, name='mine')
+        self.client.force_authenticate(self.farmer)
+        harvest = dict(harvest_date='2023-11-05', harvest_method='Mn', initial_quantity=12.5, maturity_index='G',
+                       characterization='Mono', containers='Bg')
+        body = '\n'.join(json.dumps(row) for row in [
+            dict(harvest, grove='mine', harvest_code='H-1'),
+            dict(harvest, grove='mine'),
+            dict(harvest, grove='foreign'),
+            dict(harvest, grove='mine', initial_quantity='a lot'),
+        ])
+        response = self.client.generic('POST', reverse('bulk_import', args=['harvests']), body,
+                                       content_type='application/x-ndjson')
+        self.assertEqual(response.data['accepted'], 2)
+        self.assertEqual(response.data['rejected'], [{'line': 3, 'error': 'unknown grove'},
+                                                     {'line': 4, 'error': 'invalid initial_quantity'}])
+        imported = Harvest.objects.get(harvest_code='H-1')
+        self.assertEqual(imported.remaining_quantity, 12.5)
+        self.assertTrue(Harvest.objects.filter(harvest_code='000001-20231105-mine').exists())
+
+        body = json.dumps(dict(harvest='H-1', initial_quantity_for_sell=5, offer_price='2.5', transportation='D',
+                               availability_date='2023-11-10', creation_date='2023-11-06'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.generic('POST', reverse('bulk_import', args=['olive-sale-offers']), body,
+                                           content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        offer = OliveSaleOffer.objects.get(harvest=imported)
+        self.assertEqual((offer.offer_code, offer.available_quantity_for_sell), ('olive selling-20231106-000001', 5))
+
+    def test_command_resumes_an_interrupted_import(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'harvests.csv')
+        checkpoint = os.path.join(directory.name, 'harvests.checkpoint')
+        create_grove(self.farmer, name='mine')
+        with open(path, 'w') as csv_file:
+            csv_file.write('grove,harvest_code,harvest_date,harvest_method,initial_quantity,maturity_index,'
+                           'characterization,containers\n')
+            for index in range(50):
+                csv_file.write(f'mine,H-{index},2023-11-05,Mn,{index + 1},G,Mono,Bg\n')
+        # a previous run committed the lines up to 21, then stopped
+        with open(checkpoint, 'w') as checkpoint_file:
+            checkpoint_file.write('21')
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_records', 'harvests', path, '--farmer', 'farmer@example.com', '--chunk-size', '10',
+                         '--checkpoint', checkpoint, stdout=out)
+        self.assertIn('Imported 30 harvests, skipped 0 already imported, rejected 0.', out.getvalue())
+        self.assertEqual(sorted(Harvest.objects.values_list('initial_quantity', flat=True)),
+                         [float(index) for index in range(21, 51)])
+        self.assertFalse(os.path.exists(checkpoint))
+        # a handful of statements per chunk of 10 rows, not per row
+        self.assertLess(len(queries), 60)
+
+        # keyed rows already imported are skipped
+        call_command('import_records', 'harvests', path, '--farmer', 'farmer@example.com', stdout=out)
+        self.assertIn('Imported 20 harvests, skipped 30 already imported', out.getvalue())
+
+
+class ExportTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.mill = create_mill()
+        harvest = create_harvest(create_grove(self.farmer))
+        self.extraction = create_extraction(self.mill, harvest=harvest)
+        self.oil = create_oil_product('oil', extraction_operation=self.extraction, owner=self.farmer)
+        for day in range(30):
+            product = create_oil_product(f'other-{day}', owner=create_farmer(f'farmer{day}@example.com'))
+            OilProduct.objects.filter(pk=product.pk).update(production_date=date(2023, 10, 1) + timedelta(days=day))
+
+    def export(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_of_the_rows_of_the_user(self):
+        self.client.force_authenticate(self.farmer)
+        content = self.export(reverse('export', args=['extraction-operations', 'csv']))
+        header, row = content.splitlines()
+        self.assertTrue(header.startswith('id,oil_mill.name,external_oil_mill,harvest.harvest_code'))
+        self.assertIn(f'{self.extraction.id},Huilerie,,', row)
+        self.assertTrue(row.endswith(',180.0,l,oil'))
+
+        self.client.force_authenticate(create_farmer('stranger@example.com'))
+        content = self.export(reverse('export', args=['extraction-operations', 'csv']))
+        self.assertEqual(len(content.splitlines()), 1)
+
+    def test_ndjson_export_streams_one_query(self):
+        self.client.force_authenticate(User.objects.create(email='admin@example.com', role='administrator'))
+        with CaptureQueriesContext(connection) as queries:
+            content = self.export(reverse('export', args=['oil-products', 'ndjson']), start='2023-10-10',
+                                  end='2023-10-19')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['oil_product_code'] for row in rows], [f'other-{day}' for day in range(9, 19)])
+        self.assertEqual(rows[0]['owner.email'], 'farmer9@example.com')
+        self.assertEqual(rows[0]['production_date'], '2023-10-10')
+        self.assertEqual(len(queries), 1)
+
+    def test_writers_yield_chunks(self):
+        rows = ((index, f'row {index}') for index in range(5))
+        self.assertEqual(list(exports.csv_chunks(['id', 'name'], rows, chunk_size=2)),
+                         ['id,name\r\n0,row 0\r\n1,row 1\r\n', '2,row 2\r\n3,row 3\r\n', '4,row 4\r\n'])
+
+    def test_unknown_export_and_bad_dates(self):
+        self.client.force_authenticate(self.farmer)
+        self.assertEqual(self.client.get(reverse('export', args=['users', 'csv'])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('export', args=['packagings', 'csv']), {'start': 'autumn'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TokenClaimsTest(APITestCase):
+    def setUp(self):
+        self.mill = create_mill()
+        self.manager = self.mill.mill_manager
+        self.manager.set_password('secret')
+        self.manager.save()
+
+    def list_queries(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('purchased_olive_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [query['sql'] for query in queries]
+
+    def test_login_tokens_carry_role_and_mill(self):
+        response = self.client.post(reverse('login'), {'email': 'manager@example.com', 'password': 'secret'})
+        access = AccessToken(response.data['access'])
+        self.assertEqual((access['user_id'], access['role'], access['oil_mill_id']),
+                         (self.manager.id, 'mill manager', self.mill.id))
+
+    def test_read_endpoints_do_not_load_the_user(self):
+        with_claims = self.list_queries(tokens_for(self.manager).access_token)
+        self.assertFalse([sql for sql in with_claims if 'dbmanage_user' in sql or 'dbmanage_oilmill' in sql])
+        # tokens issued before the claims still authenticate, loading the user and its mill
+        without_claims = self.list_queries(RefreshToken.for_user(self.manager).access_token)
+        self.assertEqual(len(without_claims), len(with_claims) + 2)
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(create_farmer()).access_token}')
+        self.assertEqual(self.client.get(reverse('purchased_olive_list')).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_refresh_reads_the_claims_again(self):
+        manager = MillManager.objects.create(email='new@example.com', role='mill manager')
+        refresh = tokens_for(manager)
+        self.assertIsNone(refresh['oil_mill_id'])
+        mill = create_mill('other@example.com', 'Second mill')
+        mill.mill_manager = manager
+        mill.save()
+        response = self.client.post(reverse('refresh-token'), {'refresh': str(refresh)})
+        self.assertEqual(AccessToken(response.data['access'])['oil_mill_id'], mill.id)
+
+
+class PasswordHashingTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email='legacy@example.com', role='farmer',
+                                        password=make_password('secret', hasher='sha1'))
+
+    def login(self, password='secret'):
+        return self.client.post(reverse('login'), {'email': 'legacy@example.com', 'password': password}, format='json')
+
+    def test_login_upgrades_the_stored_hash(self):
+        self.assertEqual(self.login('wrong').status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('sha1$'))
+
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith(f'pbkdf2_sha256${passwords.get_settings()["ITERATIONS"]}$'))
+        self.assertTrue(check_password('secret', self.user.password))
+
+        # a new cost applies at the next login
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': 1200}):
+            self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1200$'))
+
+    def test_register_hashes_with_the_configured_cost(self):
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': 1500}):
+            response = self.client.post(reverse('register'), {'role': 'consumer', 'email': 'new@example.com',
+                                                              'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(User.objects.get(email='new@example.com').password.startswith('pbkdf2_sha256$1500$'))
+
+    def test_saturated_pool_answers_503(self):
+        with override_settings(PASSWORD_HASHING={'MAX_PENDING': 0}):
+            response = self.login()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(self.login().status_code, status.HTTP_200_OK)
+
+    def test_login_rejects_other_methods(self):
+        self.assertEqual(self.client.get(reverse('login')).status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        response = self.client.post(reverse('login'), '{', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ServerTimingTest(APITestCase):
+    def setUp(self):
+        perf.get_monitor().reset()
+        self.mill = create_mill()
+        self.client.force_authenticate(self.mill.mill_manager)
+
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('purchased_olive_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entries = dict(entry.split(';', 1) for entry in response['Server-Timing'].split(', '))
+        self.assertEqual(set(entries), {'db', 'serializer', 'view', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries"', entries['db'])
+
+        with override_settings(PERFORMANCE_MONITOR={'SERVER_TIMING': False}):
+            self.assertFalse(self.client.get(reverse('purchased_olive_list')).has_header('Server-Timing'))
+
+    def test_summary_per_url_name(self):
+        for _ in range(3):
+            self.client.get(reverse('purchased_olive_list'))
+        self.client.get(reverse('login'))
+        self.assertEqual(self.client.get(reverse('perf_summary')).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(User.objects.create(email='admin@example.com', role='administrator'))
+        summary = self.client.get(reverse('perf_summary')).data
+        self.assertEqual(summary['purchased_olive_list']['requests'], 3)
+        self.assertEqual(summary['login']['requests'], 1)
+        timings = summary['purchased_olive_list']
+        self.assertEqual(set(timings['queries']), {'p50', 'p95', 'p99'})
+        self.assertGreater(timings['queries']['p50'], 0)
+        self.assertLessEqual(timings['total_ms']['p50'], timings['total_ms']['p99'])
+
+    def test_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([perf.percentile(ordered, rank) for rank in perf.PERCENTILES], [50, 95, 99])
+        self.assertEqual(perf.percentile([7], 99), 7)
+
+
+QUERY_BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+
+
+def sql_fingerprint(sql):
+    # the statement without its values: literals and IN lists become ?, savepoint names s?
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'"s\d+_x\d+"', 's?', sql)
+    sql = re.sub(r'(?<![\w"])-?\d+(?:\.\d+)?(?:e[+-]?\d+)?(?![\w"])', '?', sql)
+    sql = re.sub(r'\(\?(?:, \?)*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def get_endpoints(resolver=None, namespace=''):
+    # names of the URL patterns of the dbmanage views answering GET, the router ones included
+    names = set()
+    for pattern in (resolver or get_resolver()).url_patterns:
+        if isinstance(pattern, URLResolver):
+            names |= get_endpoints(pattern, f'{namespace}{pattern.namespace}:' if pattern.namespace else namespace)
+            continue
+        view = getattr(pattern.callback, 'cls', None) or getattr(pattern.callback, 'view_class', None)
+        if view is None or not view.__module__.startswith('dbmanage'):
+            continue
+        actions = getattr(pattern.callback, 'actions', None)
+        if ('get' in actions) if actions is not None else hasattr(view, 'get'):
+            names.add(namespace + pattern.name)
+    return names
+
+
+class QueryBudgetTest(APITestCase):
+    """
+    Calls every GET endpoint with results of 1, 10 and 100 rows over a fixture of about 120 rows of
+    each model: each must answer 200 to its caller, its queries must not depend on the number of
+    rows and must match the checked in
+    dbmanage/query_budgets.json. After an intended change, rewrite it with
+    UPDATE_QUERY_BUDGETS=1 python manage.py test dbmanage.tests.QueryBudgetTest
+    and review its diff.
+    """
+    rows = 120
+    sizes = (1, 10, 100)
+    # label: (URL name, caller, URL arguments, query parameters, parameter of the number of results)
+    endpoints = {
+        'api:user-list': ('api:user-list', 'admin', lambda test: [], {}, None),
+        'api:user-detail': ('api:user-detail', 'admin', lambda test: [test.farmer.pk], {}, None),
+        'api:olive-grove-list': ('api:olive-grove-list', 'farmer', lambda test: [], {}, None),
+        'api:olive-grove-detail': ('api:olive-grove-detail', 'farmer', lambda test: [test.grove.name], {}, None),
+        'api:olive-grove-objects-list': ('api:olive-grove-objects-list', 'farmer', lambda test: [], {}, None),
+        'api:olive-grove-objects-detail': ('api:olive-grove-objects-detail', 'farmer', lambda test: [test.grove.pk],
+                                           {}, None),
+        'farmer-list': ('farmer-list', 'admin', lambda test: [], {}, None),
+        'farmer-detail': ('farmer-detail', 'admin', lambda test: [test.farmer.pk], {}, None),
+        'consumer-list': ('consumer-list', 'admin', lambda test: [], {}, None),
+        'consumer-detail': ('consumer-detail', 'admin', lambda test: [test.consumer.pk], {}, None),
+        'mill-manager-detail': ('mill-manager-detail', 'admin', lambda test: [test.manager.pk], {}, None),
+        'olive_sale_offers_list': ('olive_sale_offers_list', 'consumer', lambda test: [], {}, 'page_size'),
+        'olive_sale_offer_details': ('olive_sale_offer_details', 'consumer', lambda test: [test.offer.pk], {}, None),
+        'olive_sale_offer_farmer_profile': ('olive_sale_offer_farmer_profile', 'consumer',
+                                            lambda test: [test.offer.pk], {}, None),
+        'offer_search': ('offer_search', 'manager', lambda test: [], {'q': 'chemlali'}, 'limit'),
+        'olive_sale_offer_matching_needs': ('olive_sale_offer_matching_needs', 'farmer', lambda test: [test.offer.pk],
+                                            {}, None),
+        # k stays the default: the nearest search widens its cells until it has k results, its queries depend on
+        # the density of the places around
+        'nearby[oil-mills]': ('nearby', 'farmer', lambda test: ['oil-mills'],
+                              {'latitude': 34.74, 'longitude': 10.76}, None),
+        'nearby[olive-groves]': ('nearby', 'manager', lambda test: ['olive-groves'], {}, None),
+        'nearby[storage-areas]': ('nearby', 'manager', lambda test: ['storage-areas'], {}, None),
+        'olive_need_matches': ('olive_need_matches', 'manager', lambda test: [test.need.pk], {}, 'k'),
+        'export[extraction-operations]': ('export', 'manager', lambda test: ['extraction-operations', 'csv'], {},
+                                          None),
+        'export[oil-products]': ('export', 'manager', lambda test: ['oil-products', 'ndjson'], {}, None),
+        'export[packagings]': ('export', 'manager', lambda test: ['packagings', 'csv'], {}, None),
+        'export[purchased-olives]': ('export', 'farmer', lambda test: ['purchased-olives', 'csv'], {}, None),
+        'export[oil-purchase-requests]': ('export', 'admin', lambda test: ['oil-purchase-requests', 'csv'], {}, None),
+        'perf_summary': ('perf_summary', 'admin', lambda test: [], {}, None),
+        'sensor_series': ('sensor_series', 'farmer', lambda test: [test.sensor.pk],
+                          {'parameter': 'temperature', 'start': '2023-11-01T00:00:00Z',
+                           'end': '2023-11-08T00:00:00Z', 'resolution': 'raw'}, 'points'),
+        'oil_product_list': ('oil_product_list', 'manager', lambda test: [], {}, 'page_size'),
+        'oil_product_lineage': ('oil_product_lineage', 'manager', lambda test: [test.product.pk], {}, None),
+        'olive_purchase_request_list': ('olive_purchase_request_list', 'manager', lambda test: [], {}, 'page_size'),
+        'olive_purchase_request_detail': ('olive_purchase_request_detail', 'manager',
+                                          lambda test: [test.purchase_request.pk], {}, None),
+        'purchased_olive_list': ('purchased_olive_list', 'manager', lambda test: [], {}, 'page_size'),
+        'purchased_olive_detail': ('purchased_olive_detail', 'manager', lambda test: [test.purchased_olive.pk], {},
+                                   None),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.farmer = create_farmer()
+        cls.mill = create_mill()
+        cls.mill.latitude, cls.mill.longitude = 34.74, 10.76
+        cls.mill.save()
+        cls.manager = cls.mill.mill_manager
+        cls.consumer = Consumer.objects.create(email='consumer@example.com', role='consumer')
+        cls.admin = User.objects.create(email='admin@example.com', role='administrator')
+        storage_area = StorageArea.objects.create(local_type='cellar', address='Sfax', container_type='inox',
+                                                  container_number=4, oil_mill=cls.mill, latitude=34.7,
+                                                  longitude=10.7)
+        cls.sensor = create_sensor(cls.farmer)
+        mother = None
+        for index in range(cls.rows):
+            create_farmer(f'farmer{index}@example.com')
+            Consumer.objects.create(email=f'consumer{index}@example.com', role='consumer')
+            mill = create_mill(f'manager{index}@example.com', f'Huilerie {index}')
+            mill.latitude, mill.longitude = 34.7 + index / 1000, 10.8
+            mill.save()
+            StorageArea.objects.create(local_type='cellar', address='Sfax', container_type='inox',
+                                       container_number=2, oil_mill=cls.mill, latitude=34.7 + index / 1000,
+                                       longitude=10.7)
+            grove = create_grove(cls.farmer, f'grove-{index}', latitude=34.7 + index / 1000, longitude=10.7)
+            offer = create_olive_sale_offer(create_harvest(grove, day=index % 30), day=index % 30,
+                                            price=2 + index % 5 / 10)
+            purchase_request = create_purchase_request(offer, cls.mill, 1, day=index % 30)
+            PurchasedOlive.objects.create(olive_purchase_request=purchase_request, mill=cls.mill, olive_quantity=1,
+                                          purchase_date=date(2023, 11, 2), olives_variety='Chemlali',
+                                          maturity_index='G', characterization='Mono', cropping_system='R',
+                                          practice='O')
+            create_olive_need(cls.mill, day=index % 30, quantity=5)
+            extraction = create_extraction(cls.mill, offer.harvest)
+            # lots split from each other, the lineage goes back a few generations
+            mother = create_oil_product(f'lot-{index}', mother if index % 4 else None, quantity=1000 - index,
+                                        owner=cls.manager, owner_category='M', owner_mill=cls.mill,
+                                        extraction_operation=None if index % 4 else extraction)
+            SensorMeasurement.objects.create(sensor=cls.sensor, parameter='temperature', value=15 + index % 10,
+                                             date=date(2023, 11, 2),
+                                             measured_at=parse_datetime(f'2023-11-02T{index % 24:02}:{index // 24:02}Z'))
+        cls.grove = grove
+        cls.offer = offer
+        cls.need = OliveNeed.objects.filter(oil_mill=cls.mill).last()
+        cls.purchase_request = purchase_request
+        cls.purchased_olive = PurchasedOlive.objects.last()
+        cls.product = mother
+
+    def setUp(self):
+        matching.reset_engine('MATCHING')
+        self.addCleanup(matching.reset_engine, 'MATCHING')
+        profile_cache.reset_cache('PROFILE_CACHE')
+
+    def call(self, url, caller, params):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(getattr(self, caller)).access_token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return {'status': response.status_code, 'queries': len(queries),
+                'sql': [sql_fingerprint(query['sql']) for query in queries]}
+
+    def measure(self, label):
+        name, caller, args, params, size_param = self.endpoints[label]
+        url = reverse(name, args=args(self))
+        # warms the caches first: the budgets are those of a running server
+        self.call(url, caller, params)
+        results = [self.call(url, caller, dict(params, **{size_param or 'page_size': size})) for size in self.sizes]
+        for size, result in zip(self.sizes[1:], results[1:]):
+            if result != results[0]:
+                self.fail(f'{label}: {result["queries"]} queries for {size} results, {results[0]["queries"]} for '
+                          f'{self.sizes[0]}:\n' + '\n'.join(difflib.unified_diff(results[0]['sql'], result['sql'],
+                                                                                  lineterm='')))
+        return results[0]
+
+    def test_every_endpoint_has_a_budget(self):
+        self.assertEqual(get_endpoints(), {name for name, *rest in self.endpoints.values()})
+
+    def test_query_budgets(self):
+        with open(QUERY_BUDGETS_PATH) as budgets_file:
+            budgets = json.load(budgets_file)
+        measured = {}
+        for label in self.endpoints:
+            with self.subTest(endpoint=label):
+                measured[label] = self.measure(label)
+                # a budget is the cost of a working endpoint, never the one of an error
+                self.assertEqual(measured[label]['status'], status.HTTP_200_OK, label)
+                if os.environ.get('UPDATE_QUERY_BUDGETS'):
+                    continue
+                self.assertIn(label, budgets, 'no budget, see the docstring of QueryBudgetTest')
+                budget = budgets[label]
+                diff = '\n'.join(difflib.unified_diff(budget['sql'], measured[label]['sql'], 'budget', 'measured',
+                                                      lineterm=''))
+                self.assertEqual((measured[label]['status'], measured[label]['queries']),
+                                 (budget['status'], budget['queries']), f'{label}:\n{diff}')
+                self.assertEqual(measured[label]['sql'], budget['sql'], f'{label}:\n{diff}')
+        if os.environ.get('UPDATE_QUERY_BUDGETS'):
+            with open(QUERY_BUDGETS_PATH, 'w') as budgets_file:
+                json.dump(measured, budgets_file, indent=2, sort_keys=True)
+                budgets_file.write('\n')
+
+    def test_sql_fingerprint(self):
+        self.assertEqual(sql_fingerprint('SELECT "t"."id" FROM "t" WHERE "t"."name" = \'it\'\'s\' AND "t"."id" IN '
+                                         '(1, 2, 3) AND "t"."price" >= -2.5 LIMIT 21'),
+                         'SELECT "t"."id" FROM "t" WHERE "t"."name" = ? AND "t"."id" IN (...) AND "t"."price" >= ? '
+                         'LIMIT ?')
+
+
+class SyntheticDatasetTest(TestCase):
+    def generate(self, seed):
+        # rolled back, so that each run starts from the same empty database
+        with transaction.atomic():
+            counts = synthetic.DatasetGenerator(40, seed=seed, seasons=2, chunk_size=100).run()
+            snapshot = [list(model.objects.order_by('id').values_list())
+                        for model in (OliveGrove, Harvest, OlivePurchaseRequest, OilProduct, OilPurchaseRequest)]
+            transaction.set_rollback(True)
+        return counts, snapshot
+
+    def test_same_seed_same_dataset(self):
+        counts, snapshot = self.generate(seed=3)
+        self.assertEqual(self.generate(seed=3), (counts, snapshot))
+        self.assertNotEqual(self.generate(seed=4)[1], snapshot)
+        self.assertEqual(counts['dbmanage_farmer'], 40)
+        self.assertEqual(counts['dbmanage_oilmill'], 1)
+
+    def test_dataset_is_consistent(self):
+        counts = synthetic.DatasetGenerator(40, seed=5, chunk_size=100).run()
+        self.assertEqual(counts['dbmanage_harvest'], 3 * OliveGrove.objects.count())
+        # owners as resolve_owner() gives them, lineage as rebuild() computes it
+        self.assertEqual(ownership.backfill(), 0)
+        links = set(OilProductLineage.objects.values_list('ancestor_id', 'descendant_id', 'depth'))
+        self.assertEqual(lineage.rebuild(), counts['dbmanage_oilproductlineage'])
+        self.assertEqual(set(OilProductLineage.objects.values_list('ancestor_id', 'descendant_id', 'depth')), links)
+        self.assertFalse(OlivePurchaseRequest.objects.filter(request_status='B', purchasedolive__isnull=True).exists())
+        self.assertFalse(PurchasedOlive.objects.exclude(
+            olive_quantity=F('olive_purchase_request__requested_quantity')).exists())
+        self.assertFalse(OilProduct.objects.filter(remaining_quantity__gt=F('produced_quantity')).exists())
+        self.assertFalse(OilSaleOffer.objects.filter(
+            available_quantity_for_sell__gt=F('initial_quantity_for_sell')).exists())
+        # the ids and codes given by the ORM afterwards follow the generated ones
+        product = create_oil_product('', quantity=10)
+        self.assertEqual(product.pk, OilProduct.objects.order_by('-pk').values_list('pk', flat=True)[1] + 1)
+        self.assertEqual(OilProduct.objects.filter(oil_product_code=product.oil_product_code).count(), 1)
+
+
+class TestClientTransport:
+    # loadsim.Client over the test client
+    def __init__(self, client):
+        self.client = client
+
+    def request(self, method, path, data=None, token=None):
+        extra = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        response = self.client.generic(method, path, json.dumps(data) if data is not None else '',
+                                       content_type='application/json', **extra)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, response.content
+
+
+class MarketplaceSimulationTest(APITestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.harvest = create_harvest(create_grove(self.farmer))
+        self.mill = create_mill()
+        self.consumer = Consumer.objects.create(email='consumer@example.com', role='consumer')
+        User.objects.update(password=make_password('season'))
+        self.simulation = loadsim.Simulation(TestClientTransport(self.client), {
+            'farmer': [loadsim.Actor(self.farmer.id, 'farmer', self.farmer.email, [self.harvest.id])],
+            'mill': [loadsim.Actor(self.mill.mill_manager_id, 'mill', self.mill.mill_manager.email)],
+            'consumer': [loadsim.Actor(self.consumer.id, 'consumer', self.consumer.email)],
+        }, 'season')
+
+    def test_a_purchase_goes_through_the_api(self):
+        farmer, mill, consumer = (self.simulation.actors[role][0] for role in loadsim.ROLES)
+        rng = random.Random(0)
+        # publish, request, approve, confirm
+        for role, actor in (('farmer', farmer), ('mill', mill), ('farmer', farmer), ('mill', mill),
+                            ('consumer', consumer)):
+            self.simulation.step(role, actor, rng)
+        operations = self.simulation.recorder.summary(1.0)['operations']
+        for operation in ('publish_offer', 'browse_offers', 'request_olives', 'approve_request', 'confirm_purchase'):
+            self.assertEqual((operations[operation]['requests'], operations[operation]['ok']), (1, 1), operation)
+        self.assertEqual(operations['login']['ok'], 3)
+
+        offer = OliveSaleOffer.objects.get(harvest=self.harvest)
+        purchased = PurchasedOlive.objects.get(olive_purchase_request__olive_sale_offer=offer)
+        self.assertEqual(purchased.mill_id, self.mill.id)
+        self.assertEqual(offer.available_quantity_for_sell,
+                         offer.initial_quantity_for_sell - purchased.olive_quantity)
+        self.assertEqual(self.simulation.offers, {offer.id})
+        self.assertEqual(set(loadsim.check_inventory([offer.id]).values()), {0})
+        offer.available_quantity_for_sell += 1
+        offer.save()
+        self.assertEqual(loadsim.check_inventory([offer.id])['unbalanced'], 1)
+
+    def test_create_views_check_what_they_set(self):
+        self.client.force_authenticate(self.farmer)
+        other_harvest = create_harvest(create_grove(create_farmer('other@example.com'), name='other'))
+        response = self.client.post(reverse('olive_sale_offer_create'), {
+            'harvest': other_harvest.id, 'initial_quantity_for_sell': 2, 'offer_price': '2.5',
+            'availability_date': '2023-11-02', 'transportation': 'D'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OliveSaleOffer.objects.exists())
+
+        closed = create_olive_sale_offer(self.harvest, offer_status='Cl')
+        self.client.force_authenticate(self.mill.mill_manager)
+        response = self.client.post(reverse('olive_purchase_request_create'), {
+            'olive_sale_offer': closed.id, 'requested_quantity': 1, 'requested_price': '2.5'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(OlivePurchaseRequest.objects.exists())
+
+    def test_outcomes(self):
+        self.assertEqual([loadsim.outcome(code, b'') for code in (201, 409, 503, 404, 500, 0)],
+                         ['ok', 'conflict', 'locked', 'rejected', 'error', 'error'])
+        self.assertEqual(loadsim.outcome(500, b'OperationalError: database is locked'), 'locked')
+
+
+# versions are bumped once per transaction, which a TestCase would make one per test
+class ConditionalGetTest(APITransactionTestCase):
+    def setUp(self):
+        self.farmer = create_farmer()
+        self.offer = create_olive_sale_offer(create_harvest(create_grove(self.farmer)))
+        self.mill = create_mill()
+        self.consumer = Consumer.objects.create(email='consumer@example.com', role='consumer')
+        self.authenticate(self.consumer)
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(user).access_token}')
+
+    def test_unchanged_list_is_answered_not_modified(self):
+        response = self.client.get(reverse('olive_sale_offers_list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('private', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            cached = self.client.get(reverse('olive_sale_offers_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual((cached['ETag'], cached.content), (response['ETag'], b''))
+        self.assertEqual(len(queries), 1)
+
+        # the ETag is the one of the user and the URL
+        self.assertNotEqual(self.client.get(reverse('olive_sale_offers_list'), {'sort': 'price_asc'})['ETag'],
+                            response['ETag'])
+        self.authenticate(self.farmer)
+        self.assertNotEqual(self.client.get(reverse('olive_sale_offers_list'))['ETag'], response['ETag'])
+
+    def test_writes_change_the_etag(self):
+        url = reverse('olive_sale_offer_details', args=[self.offer.pk])
+        etag = self.client.get(url)['ETag']
+        # a nested representation changes
+        self.farmer.last_name = 'Trabelsi'
+        self.farmer.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['grove']['farmer']['last_name'], 'Trabelsi')
+
+    def test_bumps_are_written_once_in_the_transaction(self):
+        before = versions.current([OliveSaleOffer, Farmer])
+        self.assertEqual(list(before), ['dbmanage.olivesaleoffer', 'dbmanage.user'])
+        version = before['dbmanage.olivesaleoffer'][0]
+        with transaction.atomic():
+            for price in (3, 4):
+                self.offer.offer_price = price
+                self.offer.save()
+            self.assertEqual(versions.current([OliveSaleOffer])['dbmanage.olivesaleoffer'][0], version + 1)
+        self.assertEqual(versions.current([OliveSaleOffer])['dbmanage.olivesaleoffer'][0], version + 1)
+
+        # rolled back with the write, and bumped again by the next write of the transaction
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    self.offer.save()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            self.assertEqual(versions.current([OliveSaleOffer])['dbmanage.olivesaleoffer'][0], version + 1)
+            self.offer.save()
+        self.assertEqual(versions.current([OliveSaleOffer])['dbmanage.olivesaleoffer'][0], version + 2)
+
+    def test_confirmations_bump_what_they_update(self):
+        purchase_request = create_purchase_request(self.offer, self.mill, 2.0)
+        self.authenticate(self.mill.mill_manager)
+        etag = self.client.get(reverse('purchased_olive_list'))['ETag']
+        before = versions.current([PurchasedOlive, OliveSaleOffer])
+        purchases.confirm_olive_purchases([purchase_request.pk], self.mill.mill_manager_id)
+        after = versions.current([PurchasedOlive, OliveSaleOffer])
+        self.assertTrue(all(after[name][0] > before[name][0] for name in before))
+        response = self.client.get(reverse('purchased_olive_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.data['results'])), (status.HTTP_200_OK, 1))
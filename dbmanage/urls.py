@@ -56,6 +56,17 @@ urlpatterns = [
     # # /harvest-sale-offers/?price_min=10&price_max=50&quantity_min=100&quantity_max=500&transportation=1&olives_variety=xxx&sort_by=price_asc
     path('olive-sale-offers/<pk>/details/', OliveSaleOfferDetails.as_view(), name='olive_sale_offer_details'), #GET
     path('olive-sale-offers/<pk>/farmer-profile/', OliveSaleOfferFarmerProfile.as_view(), name='olive_sale_offer_farmer_profile'), #GET
+    path('search/', OfferSearchView.as_view(), name='offer_search'), #GET
+    path('olive-sale-offers/<int:pk>/matching-needs/', OliveSaleOfferMatchingNeedsView.as_view(), name='olive_sale_offer_matching_needs'), #GET
+    path('nearby/<str:kind>/', NearbyView.as_view(), name='nearby'), #GET
+    path('olive-needs/<int:pk>/matches/', OliveNeedMatchesView.as_view(), name='olive_need_matches'), #GET
+    path('sensor-measurements/bulk/', SensorMeasurementBulkIngestView.as_view(), name='sensor_measurements_bulk'), #POST
+    path('imports/<str:kind>/', BulkImportView.as_view(), name='bulk_import'), #POST
+    path('exports/<slug:kind>.<slug:file_format>', ExportView.as_view(), name='export'), #GET
+    path('_perf/', PerformanceSummaryView.as_view(), name='perf_summary'), #GET
+    path('iot-sensors/<int:pk>/series/', SensorSeriesView.as_view(), name='sensor_series'), #GET
+    path('oil-products/', OilProductListView.as_view(), name='oil_product_list'), #GET
+    path('oil-products/<int:pk>/lineage/', OilProductLineageView.as_view(), name='oil_product_lineage'), #GET
     path('olive-purchase-request/create/', OlivePurchaseRequestCreateView.as_view(), name='olive_purchase_request_create'),  #POST
     path('olive_purchase_request_detail/<int:pk>/', OlivePurchaseRequestDetail.as_view(), name='olive_purchase_request_detail'),
     path('olive-purchase-requests/', OlivePurchaseRequestList.as_view(), name='olive_purchase_request_list'),
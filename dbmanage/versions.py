@@ -0,0 +1,115 @@
+import hashlib
+import math
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from dbmanage.models import ResourceVersion
+
+
+def name_of(model):
+    # the rows of a multi-table inheritance child are versioned with the ones of its root parent
+    parents = model._meta.get_parent_list()
+    return (parents[-1] if parents else model)._meta.label_lower
+
+
+def _write(names, using):
+    now = timezone.now()
+    versions = ResourceVersion.objects.using(using)
+    if versions.filter(name__in=names).update(version=F('version') + 1, updated_at=now) == len(names):
+        return
+    # first bump of some of the names
+    for name in names - set(versions.filter(name__in=names).values_list('name', flat=True)):
+        try:
+            with transaction.atomic(using=using):
+                versions.create(name=name, version=1, updated_at=now)
+        except IntegrityError:
+            # created meanwhile by another writer
+            versions.filter(name=name).update(version=F('version') + 1, updated_at=now)
+
+
+class _Bumped:
+    # on_commit marker of the names a transaction has bumped: Django drops it with the savepoint
+    # it was registered in, so a name whose bump was rolled back is bumped again
+    def __init__(self, names):
+        self.names = names
+
+    def __call__(self):
+        pass
+
+
+def _bumped(connection):
+    return {name for sids, func in connection.run_on_commit if isinstance(func, _Bumped) for name in func.names}
+
+
+def bump(*models, using=None):
+    """
+    Increments the versions of `models` in the current transaction, once per transaction: the new
+    versions commit (or roll back) with the writes they describe, so a client never revalidates
+    against a version older than the data. The version rows stay locked by the writing transaction
+    from its first bump until it ends.
+    Signals call it for the saves and deletes of the versioned models; writers going around them
+    (queryset update(), bulk_create(), raw SQL) call it themselves.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = transaction.get_connection(using)
+    names = {name_of(model) for model in models}
+    if connection.in_atomic_block:
+        names -= _bumped(connection)
+    if names:
+        _write(names, using)
+        transaction.on_commit(_Bumped(names), using=using)
+
+
+def current(models, using=None):
+    """
+    {name: (version, last update)} of `models`, in one query; (0, None) for models never bumped.
+    """
+    names = {name_of(model) for model in models}
+    found = {name: (version, updated_at) for name, version, updated_at in ResourceVersion.objects.using(
+        using or DEFAULT_DB_ALIAS).filter(name__in=names).values_list('name', 'version', 'updated_at')}
+    return {name: found.get(name, (0, None)) for name in sorted(names)}
+
+
+class ConditionalGetMixin:
+    """
+    ETag and Last-Modified for the GET of a list or detail view, derived from the versions of the
+    `version_models` its response is built from (the nested serializers included) and from the user,
+    the URL and the Accept header. A request whose If-None-Match (or If-Modified-Since) still matches
+    is answered 304 after the version lookup, before any queryset or serializer work.
+
+    Last-Modified is rounded up to the second: two writes within a second can leave it unchanged, so
+    clients should revalidate with the ETag, which takes precedence when both are sent.
+    """
+    version_models = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().retrieve, *args, **kwargs)
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+        versions = current(self.version_models)
+        key = '|'.join((type(self).__name__, str(request.user.id), request.get_full_path(),
+                        request.META.get('HTTP_ACCEPT', ''),
+                        *(f'{name}:{version}' for name, (version, updated_at) in versions.items())))
+        etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+        updates = [updated_at for version, updated_at in versions.values() if updated_at is not None]
+        last_modified = math.ceil(max(updates).timestamp()) if updates else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # cached by the client only, and revalidated each time
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
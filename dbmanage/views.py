@@ -1,5 +1,6 @@
 from bdb import GENERATOR_AND_COROUTINE_FLAGS
-from django.contrib.auth.hashers import make_password
+import functools
+from asgiref.sync import sync_to_async
 from rest_framework import generics
 from rest_framework import status
 from rest_framework.views import APIView
@@ -7,22 +8,73 @@ from rest_framework.generics import ListAPIView, CreateAPIView, RetrieveAPIView
 from dbmanage.serializers import *
 from dbmanage.models import *
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
 from rest_framework.permissions import IsAuthenticated
 from dbmanage.permissions import *
+from dbmanage.pagination import KeysetPagination
+from dbmanage.versions import ConditionalGetMixin
+from dbmanage.authentication import token_claims, tokens_for
+from dbmanage import dispatcher, exports, geo, imports, ingest, lineage, matching, passwords, perf, purchases, rollups, search
 from django.db.models import Q
 from django.views import View
+from django.http import StreamingHttpResponse
 from django.urls import reverse
+from datetime import date, timedelta
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import render, get_object_or_404
 from rest_framework.viewsets import GenericViewSet, ViewSet, ModelViewSet
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 
-@api_view(['POST'])
-def register(request):
+def async_api_view(view):
+    """
+    Runs an async function view with the parsing and rendering of @api_view(['POST']): request.data
+    is read from JSON or form data and the returned Response is rendered as JSON. No session
+    authentication, so no CSRF check.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            response = Response({'detail': f'Method "{request.method}" not allowed.'},
+                                status=status.HTTP_405_METHOD_NOT_ALLOWED, headers={'Allow': 'POST'})
+        else:
+            request = Request(request, parsers=[JSONParser(), FormParser(), MultiPartParser()])
+            try:
+                response = await view(request, *args, **kwargs)
+            except APIException as error:
+                response = Response({'detail': error.detail}, status=error.status_code)
+        response.accepted_renderer = JSONRenderer()
+        response.accepted_media_type = response.accepted_renderer.media_type
+        response.renderer_context = {}
+        return response
+
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def hashing_saturated():
+    return Response({'detail': 'Too many logins at once, retry shortly.'},
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+
+
+def save_registration(serializer):
+    user = serializer.save()
+    if isinstance(user, OilMill):
+        user = user.mill_manager
+    return tokens_for(user)
+
+
+# async: the password is hashed on the pool of dbmanage.passwords, under ASGI the other requests go on meanwhile
+@async_api_view
+async def register(request):
     role = request.data.get('role')
     
     if role == 'farmer':
@@ -34,11 +86,13 @@ def register(request):
     else:
         return Response({'detail': 'Invalid role'}, status=status.HTTP_400_BAD_REQUEST)
 
-    if serializer.is_valid():
-        hashed_password = make_password(request.data.get('password'))
+    if await sync_to_async(serializer.is_valid)():
+        try:
+            hashed_password = await passwords.hash_password(request.data.get('password'))
+        except passwords.Saturated:
+            return hashing_saturated()
         serializer.validated_data['password'] = hashed_password
-        user = serializer.save()
-        refresh = RefreshToken.for_user(user)
+        refresh = await sync_to_async(save_registration)(serializer)
         response = {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -47,16 +101,18 @@ def register(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['POST'])
-def login(request):
+@async_api_view
+async def login(request):
     email = request.data.get('email')
     password = request.data.get('password')
 
-    user = authenticate(email=email, password=password)
+    try:
+        user = await passwords.authenticate(email, password)
+    except passwords.Saturated:
+        return hashing_saturated()
 
     if user is not None:
-        print("user not none")
-        refresh = RefreshToken.for_user(user)
+        refresh = await sync_to_async(tokens_for)(user)
         response = {
             'refresh': str(refresh),
             'access': str(refresh.access_token),
@@ -68,9 +124,19 @@ def login(request):
 @api_view(['POST'])
 def refresh_token(request):
     refresh_token = request.data.get('refresh')
-    token = RefreshToken(refresh_token)
+    try:
+        token = RefreshToken(refresh_token)
+    except TokenError as error:
+        return Response({'detail': str(error)}, status=status.HTTP_401_UNAUTHORIZED)
+    user = User.objects.filter(pk=token[jwt_settings.USER_ID_CLAIM]).first()
+    if user is None:
+        return Response({'detail': 'User not found'}, status=status.HTTP_401_UNAUTHORIZED)
+    access = token.access_token
+    # the role or the mill may have changed since the login
+    for claim, value in token_claims(user).items():
+        access[claim] = value
     response = {
-        'access': str(token.access_token),
+        'access': str(access),
     }
     return Response(response)
 
@@ -115,13 +181,20 @@ class MillManagerDetail(generics.RetrieveUpdateDestroyAPIView):
 
 
 # Shorter version of code and more accurate
-class OliveGroveListRetrieveViewSet(RetrieveModelMixin, ListModelMixin, GenericViewSet):
+class OliveGroveListRetrieveViewSet(ConditionalGetMixin, RetrieveModelMixin, ListModelMixin, GenericViewSet):
+    queryset = OliveGrove.objects.select_related('farmer')
     serializer_class = OliveGroveSerializer
     lookup_field = 'name'
+    version_models = (OliveGrove, User)
 
-class OliveGroveModelViewSet(ModelViewSet):
+class OliveGroveModelViewSet(ConditionalGetMixin, ModelViewSet):
     serializer_class = OliveGroveSerializer
     permission_classes = [IsAuthenticated, IsFarmer]
+    version_models = (OliveGrove, User)
+
+    def get_queryset(self):
+        # the groves of the farmer
+        return OliveGrove.objects.filter(farmer_id=self.request.user.id).select_related('farmer')
 
 # # get olive groves list, filter by practice (conventional or organic), by address
 # class OliveGroveList(generics.ListAPIView):
@@ -208,15 +281,21 @@ class OliveGroveModelViewSet(ModelViewSet):
 class HarvestListAPIView(ListAPIView):
     serializer_class = HarvestSerializer
     permission_classes = [IsAuthenticated, IsFarmer, IsOwnerOfHarvest]  # Use the custom permission class
+    pagination_class = KeysetPagination
+    sort_orderings = {
+        'quantity_asc': ('initial_quantity',),
+        'quantity_desc': ('-initial_quantity',),
+        'harvest_date': ('harvest_date',),
+    }
 
     def get_queryset(self):
         # Filter the queryset to include only harvests owned by the current user (farmer)
-        queryset = Harvest.objects.filter(grove__farmer=self.request.user)
+        queryset = Harvest.objects.filter(grove__farmer_id=self.request.user.id)
         # filter by quantity
         quantity_min = self.request.query_params.get('quantity_min')
         quantity_max = self.request.query_params.get('quantity_max')
         if quantity_min and quantity_max:
-            queryset = queryset.filter(quantity__range=[quantity_min, quantity_max])
+            queryset = queryset.filter(initial_quantity__range=[quantity_min, quantity_max])
         # filter by maturity
         maturity = self.request.query_params.get('maturity')
         if maturity:
@@ -228,14 +307,7 @@ class HarvestListAPIView(ListAPIView):
             queryset = queryset.filter(harvest_date=harvest_date)
         if year:
             queryset = queryset.filter(harvest_date__year=year)
-        # sorting
-        sort_by = self.request.query_params.get('sort_by')
-        if sort_by == 'quantity_asc':
-            queryset = queryset.order_by('quantity')
-        elif sort_by == 'quantity_desc':
-            queryset = queryset.order_by('-quantity')
-        elif sort_by == 'harvest_date':
-            queryset = queryset.order_by('harvest_date')
+        # sorting (sort_by) is applied by the paginator
         return queryset
 
 
@@ -261,7 +333,7 @@ class HarvestUpdateView(APIView):
 
     def put(self, request, pk):
         try:
-            harvest = Harvest.objects.get(pk=pk, grove__farmer=request.user)
+            harvest = Harvest.objects.get(pk=pk, grove__farmer_id=request.user.id)
         except Harvest.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -278,7 +350,7 @@ class HarvestDeleteView(APIView):
 
     def delete(self, request, pk):
         try:
-            harvest = Harvest.objects.get(pk=pk, grove__farmer=request.user)
+            harvest = Harvest.objects.get(pk=pk, grove__farmer_id=request.user.id)
         except Harvest.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -288,7 +360,7 @@ class HarvestDeleteView(APIView):
 
 # create an olive sale offer by the farmer
 class OliveSaleOfferCreateAPIView(generics.CreateAPIView):
-    serializer_class = OliveSaleOfferSerializer
+    serializer_class = OliveSaleOfferCreateSerializer
     permission_classes = [IsAuthenticated, IsFarmer]
 
     def perform_create(self, serializer):
@@ -296,12 +368,10 @@ class OliveSaleOfferCreateAPIView(generics.CreateAPIView):
         harvest_id = self.request.data.get('harvest')
 
         try:
-            harvest = Harvest.objects.get(pk=harvest_id, grove__farmer=self.request.user)
-        except Harvest.DoesNotExist:
-            return Response(
-                {"detail": "Harvest with the provided ID does not exist or does not belong to you."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            harvest = Harvest.objects.get(pk=harvest_id, grove__farmer_id=self.request.user.id)
+        except (Harvest.DoesNotExist, ValueError, TypeError):
+            raise ValidationError(
+                {"harvest": "Harvest with the provided ID does not exist or does not belong to you."})
 
         # Additional data for the sale offer
         creation_date = timezone.now().date()
@@ -330,7 +400,7 @@ class OliveSaleOfferUpdateAPIView(APIView):
             return Response({'error': 'Olive Sale Offer does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
         # Check if the request user is the owner of the offer's harvest
-        if offer.harvest.grove.farmer != request.user:
+        if offer.harvest.grove.farmer_id != request.user.id:
             return Response({'error': 'You do not have permission to update this offer'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -347,9 +417,17 @@ class OliveSaleOfferUpdateAPIView(APIView):
 
 # display the list of olive sale offers, every one can check the list
 # filter offers list by quantity, price, transportation and olives_variety, sort the list by quantity +/-, price +/-
-class OliveSaleOfferListAPIView(ListAPIView):
+class OliveSaleOfferListAPIView(ConditionalGetMixin, ListAPIView):
     serializer_class = OliveSaleOfferSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    version_models = (OliveSaleOffer, Harvest, OliveGrove, User)
+    sort_orderings = {
+        'price_asc': ('offer_price',),
+        'price_desc': ('-offer_price',),
+        'quantity_asc': ('available_quantity_for_sell',),
+        'quantity_desc': ('-available_quantity_for_sell',),
+    }
 
     def get_queryset(self):
         queryset = OliveSaleOffer.objects.all()
@@ -360,36 +438,67 @@ class OliveSaleOfferListAPIView(ListAPIView):
         quantity_max = self.request.query_params.get('quantity_max')
         transport_option = self.request.query_params.get('transportation')
         olives_variety = self.request.query_params.get('olives_variety')
-        sort_by = self.request.query_params.get('sort_by')
+        offer_status = self.request.query_params.get('offer_status')
+        # Filtering by status, available offers are served by a partial index
+        if offer_status == 'A':
+            queryset = queryset.available()
+        elif offer_status:
+            queryset = queryset.filter(offer_status=offer_status)
         # Filtering by price
         if price_min and price_max:
-            queryset = queryset.filter(price__range=[price_min, price_max])
+            queryset = queryset.filter(offer_price__range=[price_min, price_max])
         # Filtering by quantity
         if quantity_min and quantity_max:
-            queryset = queryset.filter(quantity__range=[quantity_min, quantity_max])
+            queryset = queryset.filter(available_quantity_for_sell__range=[quantity_min, quantity_max])
         # Filtering by transportation option
         if transport_option:
             queryset = queryset.filter(transportation=transport_option)
         # Filtering by olives variety
         if olives_variety:
-            queryset = queryset.filter(harvest__olives_variety=olives_variety)
-        # Sorting
-        if sort_by == 'price_asc':
-            queryset = queryset.order_by('price')
-        elif sort_by == 'price_desc':
-            queryset = queryset.order_by('-price')
-        elif sort_by == 'quantity_asc':
-            queryset = queryset.order_by('quantity')
-        elif sort_by == 'quantity_desc':
-            queryset = queryset.order_by('-quantity')
+            queryset = queryset.filter(harvest__grove__olives_variety=olives_variety)
+        # Sorting (sort_by) is applied by the paginator
         return queryset
 
 
+# full-text search across olive and oil sale offers, ranked, with facet counts
+# /search/?q=chemlali sfax&kind=oil&packaging=Dark Glass Bottles&limit=20&offset=0
+class OfferSearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_limit = 100
+
+    def get(self, request):
+        if not search.is_available():
+            return Response({'error': 'Full-text search is not available on this database backend'},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        try:
+            limit = min(int(request.query_params.get('limit', 20)), self.max_limit)
+            offset = int(request.query_params.get('offset', 0))
+        except ValueError:
+            return Response({'error': 'limit and offset must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            # a negative LIMIT is no limit in SQLite
+            return Response({'error': f'limit must be between 1 and {self.max_limit}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        filters = {facet: request.query_params.get(facet) for facet in search.FACETS}
+        results, facets = search.search(request.query_params.get('q'), filters, limit=limit, offset=max(offset, 0))
+        return Response({
+            'count': sum(facet['count'] for facet in facets.get('kind', [])),
+            'results': results,
+            'facets': facets,
+        }, status=status.HTTP_200_OK)
+
+
 # check the corresponding harvest details for each olive sale offer through its ID
-class OliveSaleOfferDetails(APIView):
+class OliveSaleOfferDetails(ConditionalGetMixin, APIView):
+    version_models = (OliveSaleOffer, Harvest, OliveGrove, User)
+
     def get(self, request, pk):
+        return self.conditional_get(request, self.get_harvest, pk)
+
+    def get_harvest(self, request, pk):
         try:
-            olive_sale_offer = OliveSaleOffer.objects.get(pk=pk)
+            # the farmer of the grove is served by the profile cache
+            olive_sale_offer = OliveSaleOffer.objects.select_related('harvest__grove').get(pk=pk)
             harvest = olive_sale_offer.harvest
             harvest_serializer = HarvestSerializer(harvest)
             return Response(harvest_serializer.data, status=status.HTTP_200_OK)
@@ -402,51 +511,64 @@ class OliveSaleOfferDetails(APIView):
 # check the farmer profile for each harvest sale offer through its ID
 class OliveSaleOfferFarmerProfile(APIView):
     def get(self, request, pk):
-        try:
-            olive_sale_offer = OliveSaleOffer.objects.get(pk=pk)
-            farmer = olive_sale_offer.harvest.grove.farmer
-            farmer_serializer = FarmerSerializer(farmer)
-            return Response(farmer_serializer.data, status=status.HTTP_200_OK)
-        except OliveSaleOffer.DoesNotExist:
+        # only the farmer id is read, the profile itself comes from the profile cache
+        farmer_ids = OliveSaleOffer.objects.filter(pk=pk).values_list('harvest__grove__farmer_id', flat=True)
+        if not farmer_ids:
             return Response({'error': 'Olive Sale Offer does not exist'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(FarmerSerializer.cached_representation(farmer_ids[0]), status=status.HTTP_200_OK)
 
 
 # create an olive purchase request, by the oil mill, as a reply to the olive sale offer published by the farmer
 class OlivePurchaseRequestCreateView(generics.CreateAPIView):
     queryset = OlivePurchaseRequest.objects.all()
-    serializer_class = OlivePurchaseRequestSerializer
+    serializer_class = OlivePurchaseRequestCreateSerializer
     permission_classes = [IsAuthenticated, IsOilMill]
 
     def perform_create(self, serializer):
-        # Get the sale offer ID from the request data
-        sale_offer_id = self.request.data.get('olive_sale_offer')
-
-        try:
-            sale_offer = OliveSaleOffer.objects.get(pk=sale_offer_id)
-        except OliveSaleOffer.DoesNotExist:
-            return Response(
-                {"detail": "OliveSaleOffer with the provided ID does not exist."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        # the sale offer is resolved by the serializer, only offers still available can be requested
+        if serializer.validated_data['olive_sale_offer'].offer_status != 'A':
+            raise ValidationError({"olive_sale_offer": "This olive sale offer is no longer available."})
 
+        today = timezone.now().date()
         serializer.save(
-            olive_sale_offer=sale_offer,
-            request_date=timezone.now().date(),
+            request_date=today,
             request_status='P',  # Set the request status to 'Pending'.
-            mill=self.request.user,  # Assuming the mill is the currently authenticated user.
+            status_update_date=today,
+            buyer_appreciation=0,
+            buyer_feedback='',
+            mill_id=self.request.user.oil_mill_id,  # the mill of the authenticated mill manager
         )
 
 
-class OlivePurchaseRequestList(generics.ListCreateAPIView):
-    queryset = OlivePurchaseRequest.objects.all()
+def visible_purchase_requests(user):
+    # the requests sent by the mill of a manager, or received on the offers of a farmer
+    if user.role == 'farmer':
+        return OlivePurchaseRequest.objects.filter(olive_sale_offer__harvest__grove__farmer_id=user.id)
+    return OlivePurchaseRequest.objects.filter(mill_id=user.oil_mill_id)
+
+
+# purchase requests are created through OlivePurchaseRequestCreateView
+class OlivePurchaseRequestList(ListAPIView):
     serializer_class = OlivePurchaseRequestSerializer
-    permission_classes = [IsAuthenticated, IsOilMill, IsFarmer]
+    permission_classes = [IsAuthenticated, IsOilMill | IsFarmer]
+    pagination_class = KeysetPagination
+    sort_orderings = {
+        'price_asc': ('requested_price',),
+        'price_desc': ('-requested_price',),
+        'quantity_asc': ('requested_quantity',),
+        'quantity_desc': ('-requested_quantity',),
+    }
+
+    def get_queryset(self):
+        return visible_purchase_requests(self.request.user)
 
 
-class OlivePurchaseRequestDetail(View):
-    def get(self, request, pk):
-        olive_purchase_request = get_object_or_404(OlivePurchaseRequest, pk=pk)
-        return render(request, 'olive_purchase_request_detail.html', {'olive_purchase_request': olive_purchase_request})
+class OlivePurchaseRequestDetail(RetrieveAPIView):
+    serializer_class = OlivePurchaseRequestSerializer
+    permission_classes = [IsAuthenticated, IsOilMill | IsFarmer]
+
+    def get_queryset(self):
+        return visible_purchase_requests(self.request.user)
 
 
 # when the oil mill send the OlivePurchaseRequest, the farmer can approve the request (request_status set to Approved)
@@ -456,12 +578,12 @@ class ApproveOlivePurchaseRequest(APIView):
 
     def post(self, request, pk):
         try:
-            purchase_request = OlivePurchaseRequest.objects.get(pk=pk)
+            purchase_request = OlivePurchaseRequest.objects.select_related('olive_sale_offer__harvest__grove').get(pk=pk)
         except OlivePurchaseRequest.DoesNotExist:
             return Response({'error': 'Olive Purchase Request does not exist'}, status=status.HTTP_404_NOT_FOUND)
 
         # Check if the request user is the owner of the grove associated with the request
-        if purchase_request.olive_sale_offer.harvest.grove.farmer != request.user:
+        if purchase_request.olive_sale_offer.harvest.grove.farmer_id != request.user.id:
             return Response({'error': 'You do not have permission to approve this request'},
                             status=status.HTTP_403_FORBIDDEN)
 
@@ -470,13 +592,9 @@ class ApproveOlivePurchaseRequest(APIView):
         purchase_request.status_update_date = timezone.now().date()
         purchase_request.save()
 
-        # Trigger a notification to the oil mill
-        oil_mill = purchase_request.mill
+        # Trigger a notification to the oil mill, written off the request path
         notification_message = f'Your olive purchase request for {purchase_request.requested_quantity} {purchase_request.quantity_unit} has been approved by the farmer.'
-        Notification.objects.create(
-            oil_mill=oil_mill,  # Assuming 'user' is the field for the oil mill's user
-            message=notification_message,
-        )
+        dispatcher.notify(notification_message, oil_mill_id=purchase_request.mill_id)
 
         return Response({'message': 'Olive Purchase Request approved'}, status=status.HTTP_200_OK)
 
@@ -486,56 +604,11 @@ class ConfirmOlivePurchase(APIView):
     permission_classes = [IsAuthenticated, IsOilMill]
 
     def post(self, request, pk):
+        # one transaction, the quantity is taken from the offer by a conditional update (no oversell)
         try:
-            purchase_request = OlivePurchaseRequest.objects.get(pk=pk)
-        except OlivePurchaseRequest.DoesNotExist:
-            return Response({'error': 'Olive Purchase Request does not exist'}, status=status.HTTP_404_NOT_FOUND)
-
-        # Check if the request user is the owner of the olive mill associated with the request
-        if purchase_request.mill != request.user:
-            return Response({'error': 'You do not have permission to confirm this purchase'},
-                            status=status.HTTP_403_FORBIDDEN)
-
-        # Update the request_status to "Bought"
-        purchase_request.request_status = 'B'
-        purchase_request.status_update_date = timezone.now().date()
-        purchase_request.save()
-
-        if purchase_request.requested_quantity == purchase_request.olive_sale_offer.available_quantity_for_sell:
-            purchase_request.olive_sale_offer.offer_status = 'Cl'
-        else:
-            remaining_quantity = purchase_request.olive_sale_offer.available_quantity_for_sell - purchase_request.requested_quantity
-            purchase_request.olive_sale_offer.available_quantity_for_sell = remaining_quantity
-
-        purchase_request.olive_sale_offer.save()
-
-        purchased_olive = PurchasedOlive(
-            olive_quantity=purchase_request.requested_quantity,
-            quantity_unit=purchase_request.quantity_unit,
-            purchase_date=timezone.now().date(),
-            olives_variety=purchase_request.olive_sale_offer.harvest.olives_variety,
-            maturity_index=purchase_request.olive_sale_offer.harvest.maturity_index,
-            characterization=purchase_request.olive_sale_offer.harvest.characterization,
-            classification_by_maturity=purchase_request.olive_sale_offer.harvest.classification_by_maturity,
-            cropping_system=purchase_request.olive_sale_offer.harvest.cropping_system,
-            practice=purchase_request.olive_sale_offer.harvest.practice,
-            mill=purchase_request.mill,
-            olive_purchase_request=purchase_request
-        )
-        purchased_olive.save()
-
-        # Create a notification for the farmer
-        user = purchase_request.olive_sale_offer.harvest.grove.farmer
-        if purchase_request.requested_quantity == purchase_request.olive_sale_offer.available_quantity_for_sell:
-            notification_message = f'The purchase of {purchase_request.olive_sale_offer.available_quantity_for_sell} {purchase_request.quantity_unit} of olives has been confirmed and your sale offer is closed.'
-        else:
-            notification_message = f'The purchase of {purchase_request.requested_quantity} {purchase_request.quantity_unit} of olives has been confirmed and your sale offer is remaining available.'
-
-        Notification.objects.create(
-            user=user,  # Assuming 'user' is the field for the oil mill's user
-            message=notification_message,
-        )
-
+            purchases.confirm_olive_purchases([pk], mill_manager_id=request.user.id)
+        except purchases.PurchaseConfirmationError as error:
+            return Response({'error': error.message}, status=error.status_code)
         return Response({'message': 'Olive Purchase confirmed'}, status=status.HTTP_200_OK)
 
 
@@ -554,7 +627,7 @@ class PurchasedOliveUpdateView(APIView):
 
     def put(self, request, pk):
         try:
-            purchased_olive = PurchasedOlive.objects.get(pk=pk, mill=request.user)
+            purchased_olive = PurchasedOlive.objects.get(pk=pk, mill_id=request.user.oil_mill_id)
         except PurchasedOlive.DoesNotExist:
             return Response(status=status.HTTP_404_NOT_FOUND)
 
@@ -566,19 +639,27 @@ class PurchasedOliveUpdateView(APIView):
 
 
 # retrieve all purchased olives, only the owner is authorized to check the list
-class PurchasedOliveListView(ListAPIView):
+class PurchasedOliveListView(ConditionalGetMixin, ListAPIView):
     serializer_class = PurchasedOliveSerializer
     permission_classes = [IsAuthenticated, IsOilMill]
+    pagination_class = KeysetPagination
+    version_models = (PurchasedOlive, OlivePurchaseRequest, OliveSaleOffer, Harvest, OliveGrove, OilMill, User)
+    sort_orderings = {
+        'quantity_asc': ('olive_quantity',),
+        'quantity_desc': ('-olive_quantity',),
+        'purchase_date': ('purchase_date',),
+    }
 
     def get_queryset(self):
         # Filter the queryset to include only purchased olives belonging to the current oil mill
-        return PurchasedOlive.objects.filter(mill=self.request.user)
+        return PurchasedOlive.objects.filter(mill_id=self.request.user.oil_mill_id)
 
 
-class PurchasedOliveRetrieveAPIView(RetrieveAPIView):
+class PurchasedOliveRetrieveAPIView(ConditionalGetMixin, RetrieveAPIView):
     serializer_class = PurchasedOliveSerializer
     queryset = PurchasedOlive.objects.all()
     permission_classes = [IsAuthenticated, IsOilMill, IsOwnerOfPurchasedOlive]
+    version_models = (PurchasedOlive, OlivePurchaseRequest, OliveSaleOffer, Harvest, OliveGrove, OilMill, User)
 
 
 class MachineList(generics.ListCreateAPIView):
@@ -647,6 +728,299 @@ class IoTSensorDetailView(RetrieveAPIView):
 class SensorMeasurementListView(ListAPIView):
     queryset = SensorMeasurement.objects.all()
     serializer_class = SensorMeasurementSerializer
+    pagination_class = KeysetPagination
+    default_ordering = ('-date',)
+
+
+def owned_sensors(user):
+    # the sensors of the storage areas owned by the user (farmer or mill manager)
+    return IoTSensor.objects.filter(Q(storage_area__farmer_id=user.id) |
+                                    Q(storage_area__oil_mill__mill_manager_id=user.id))
+
+
+# bulk ingestion of sensor measurements, NDJSON (application/x-ndjson) or CSV (text/csv) body, one
+# measurement per line: {"sensor_id": "...", "parameter": "temperature", "value": 18.5, "date": "2023-11-02"}
+class SensorMeasurementBulkIngestView(APIView):
+    permission_classes = [IsAuthenticated]
+    readers = {
+        'application/x-ndjson': ingest.iter_ndjson,
+        'application/ndjson': ingest.iter_ndjson,
+        'application/jsonl': ingest.iter_ndjson,
+        'text/csv': ingest.iter_csv,
+    }
+
+    def post(self, request):
+        content_type = request.content_type.split(';')[0].strip()
+        reader = self.readers.get(content_type)
+        if reader is None:
+            return Response({'error': f'Unsupported content type, use one of {", ".join(self.readers)}'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        sensors = owned_sensors(request.user)
+        # the body is streamed line by line, it is never loaded as a whole
+        lines = (line.decode('utf-8', errors='replace') for line in request.stream or ())
+        report = ingest.ingest_measurements(reader(lines), sensor_queryset=sensors)
+        response_status = status.HTTP_201_CREATED if report.accepted else status.HTTP_400_BAD_REQUEST
+        return Response(report.as_dict(), status=response_status)
+
+
+# bulk import of olive groves, harvests or olive sale offers (onboarding of cooperatives), CSV (text/csv,
+# header line with the field names) or NDJSON body, one record per line. Farmers import their own
+# records, administrators those of every farmer (groves name their farmer by email). An interrupted
+# import is resumed with ?resume_after=<committed_line of the report>
+class BulkImportView(APIView):
+    permission_classes = [IsAuthenticated]
+    readers = dict(SensorMeasurementBulkIngestView.readers, **{'text/csv': imports.iter_csv})
+
+    def post(self, request, kind):
+        importer_class = imports.IMPORTERS.get(kind)
+        if importer_class is None:
+            return Response({'error': f'kind must be one of {", ".join(imports.IMPORTERS)}'},
+                            status=status.HTTP_404_NOT_FOUND)
+        if request.user.role not in ('farmer', 'administrator'):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        content_type = request.content_type.split(';')[0].strip()
+        reader = self.readers.get(content_type)
+        if reader is None:
+            return Response({'error': f'Unsupported content type, use one of {", ".join(self.readers)}'},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        try:
+            resume_after = int(request.query_params.get('resume_after', 0))
+        except ValueError:
+            return Response({'error': 'resume_after must be a line number'}, status=status.HTTP_400_BAD_REQUEST)
+        importer = importer_class(farmer=request.user if request.user.role == 'farmer' else None)
+        lines = (line.decode('utf-8', errors='replace') for line in request.stream or ())
+        report = imports.import_records(importer, reader(lines), resume_after=resume_after)
+        if report.failed:
+            response_status = status.HTTP_503_SERVICE_UNAVAILABLE
+        elif report.accepted or not report.rejected_count:
+            response_status = status.HTTP_201_CREATED if report.accepted else status.HTTP_200_OK
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(report.as_dict(), status=response_status)
+
+
+# full dumps for regulators and accountants, streamed: GET /exports/oil-products.csv?start=2023-10-01&end=2024-03-31
+# (or .ndjson). Administrators export every row, the other users the rows they take part in
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def perform_content_negotiation(self, request, force=False):
+        # the body is not rendered by DRF, only the errors are
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request, kind, file_format):
+        export = exports.EXPORTS.get(kind)
+        if export is None or file_format not in exports.WRITERS:
+            return Response({'error': f'export one of {", ".join(exports.EXPORTS)} as '
+                                      f'{" or ".join(exports.WRITERS)}'}, status=status.HTTP_404_NOT_FOUND)
+        if request.user.role == 'visitor':
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        try:
+            start, end = (date.fromisoformat(request.query_params[name]) if name in request.query_params else None
+                          for name in ('start', 'end'))
+        except ValueError:
+            return Response({'error': 'start and end must be ISO dates'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = export.queryset(None if request.user.role == 'administrator' else request.user, start, end)
+        content_type, writer = exports.WRITERS[file_format]
+        response = StreamingHttpResponse(writer(export.headers, export.rows(queryset)), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{file_format}"'
+        return response
+
+
+# p50/p95/p99 of the total, view, database and serializer times and of the queries of each URL name,
+# over the last requests handled by this process (dbmanage.perf)
+class PerformanceSummaryView(APIView):
+    permission_classes = [IsAuthenticated, IsAdministrator]
+
+    def get(self, request):
+        return Response(perf.get_monitor().summary())
+
+
+# history of a sensor parameter, downsampled to the point budget
+# GET /iot-sensors/1/series/?parameter=temperature&start=2023-01-01T00:00:00Z&end=2024-01-01T00:00:00Z&points=500
+class SensorSeriesView(APIView):
+    permission_classes = [IsAuthenticated]
+    default_range = timedelta(days=7)
+
+    def get(self, request, pk):
+        sensor = get_object_or_404(owned_sensors(request.user), pk=pk)
+        parameter = request.query_params.get('parameter')
+        if not parameter:
+            return Response({'error': 'parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            end = self.get_time(request, 'end') or timezone.now()
+            start = self.get_time(request, 'start') or end - self.default_range
+            points = int(request.query_params.get('points', rollups.DEFAULT_POINTS))
+        except ValueError:
+            return Response({'error': 'start and end must be ISO timestamps, points an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start >= end or not 0 < points <= rollups.MAX_POINTS:
+            return Response({'error': f'start must be before end and points between 1 and {rollups.MAX_POINTS}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        resolution = request.query_params.get('resolution')
+        if resolution not in (None, rollups.RAW, *rollups.BUCKET_SIZES):
+            return Response({'error': 'resolution must be raw, h or d'}, status=status.HTTP_400_BAD_REQUEST)
+        resolution, series = rollups.series(sensor.pk, parameter, start, end, points=points, resolution=resolution,
+                                            chunked=sensor.series_storage == IoTSensor.CHUNKED)
+        return Response({
+            'sensor': sensor.sensor_id,
+            'parameter': parameter,
+            'resolution': resolution,
+            'points': series,
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def get_time(request, name):
+        value = request.query_params.get(name)
+        if value is None:
+            return None
+        timestamp = parse_datetime(value)
+        if timestamp is None:
+            raise ValueError(name)
+        if timezone.is_naive(timestamp):
+            timestamp = timezone.make_aware(timestamp, timezone.utc)
+        return timestamp
+
+
+# the available olive sale offers compatible with a pending olive need of the mill, best first:
+# /olive-needs/<id>/matches/?k=10&min_quantity=2
+class OliveNeedMatchesView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        need = get_object_or_404(OliveNeed.objects.filter(oil_mill__mill_manager_id=request.user.id), pk=pk)
+        try:
+            k = int(request.query_params.get('k', matching.DEFAULT_MATCHES))
+            # the quantity of the need by default
+            min_quantity = request.query_params.get('min_quantity')
+            min_quantity = float(min_quantity) if min_quantity is not None else None
+        except ValueError:
+            return Response({'error': 'k and min_quantity must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < k <= matching.MAX_MATCHES:
+            return Response({'error': f'k must be between 1 and {matching.MAX_MATCHES}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        matches = dict(matching.get_engine().offers_for_need(need.pk, k=k, min_quantity=min_quantity))
+        offers = OliveSaleOffer.objects.available().filter(pk__in=matches).select_related('harvest__grove')
+        order = list(matches)
+        offers = sorted(offers, key=lambda offer: order.index(offer.id))
+        return Response({
+            'need': need.need_code,
+            'matches': [{
+                'id': offer.id,
+                'offer_code': offer.offer_code,
+                'olives_variety': offer.harvest.grove.olives_variety,
+                'address': offer.harvest.grove.address,
+                'offer_price': offer.offer_price,
+                'price_unit': offer.price_unit,
+                'available_quantity_for_sell': offer.available_quantity_for_sell,
+                'quantity_unit': offer.quantity_unit,
+                'farmer': offer.harvest.grove.farmer_id,
+                'same_region': matches[offer.id],
+            } for offer in offers],
+        }, status=status.HTTP_200_OK)
+
+
+# the pending olive needs an available sale offer of the farmer is compatible with
+class OliveSaleOfferMatchingNeedsView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        offer = get_object_or_404(OliveSaleOffer.objects.filter(harvest__grove__farmer_id=request.user.id), pk=pk)
+        matches = dict(matching.get_engine().needs_for_offer(offer.pk))
+        needs = OliveNeed.objects.filter(pk__in=matches, need_status='P').select_related('oil_mill')
+        order = list(matches)
+        needs = sorted(needs, key=lambda need: order.index(need.id))
+        return Response({
+            'offer': offer.offer_code,
+            'matches': [{
+                'id': need.id,
+                'need_code': need.need_code,
+                'quantity': need.quantity,
+                'quantity_unit': need.quantity_unit,
+                'price_min': need.price_min,
+                'price_max': need.price_max,
+                'price_unit': need.price_unit,
+                'region': need.region,
+                'oil_mill': need.oil_mill.name if need.oil_mill else None,
+                'same_region': matches[need.id],
+            } for need in needs],
+        }, status=status.HTTP_200_OK)
+
+
+# proximity search over the located oil mills, olive groves and storage areas, around a point
+# (latitude, longitude), a harvest of the farmer or by default the mill of the mill manager:
+# /nearby/oil-mills/?harvest=<id>&k=5 (mills able to extract the harvest), /nearby/olive-groves/?radius_km=30
+class NearbyView(APIView):
+    permission_classes = [IsAuthenticated]
+    max_results = 100
+    max_radius_km = 500
+    kinds = {
+        'oil-mills': (OilMill, ('name', 'address', 'country', 'milling_capacity', 'transformation_capacity_unit',
+                                'has_lab', 'has_pack_unit')),
+        'olive-groves': (OliveGrove, ('name', 'address', 'olives_variety', 'area', 'practice', 'farmer_id')),
+        'storage-areas': (StorageArea, ('local_type', 'address', 'container_type', 'container_number', 'oil_mill_id',
+                                        'farmer_id')),
+    }
+
+    def get(self, request, kind):
+        if kind not in self.kinds:
+            return Response({'error': f'kind must be one of {", ".join(self.kinds)}'},
+                            status=status.HTTP_404_NOT_FOUND)
+        model, fields = self.kinds[kind]
+        queryset = model.objects.all()
+        try:
+            center = self.get_center(request)
+            k = int(request.query_params.get('k', 10))
+            radius_km = request.query_params.get('radius_km')
+            radius_km = float(radius_km) if radius_km is not None else None
+        except ValueError:
+            return Response({'error': 'latitude, longitude and radius_km must be numbers, k an integer'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if center is None:
+            return Response({'error': 'give latitude and longitude, or a harvest with a located grove'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not 0 < k <= self.max_results or radius_km is not None and not 0 < radius_km <= self.max_radius_km:
+            return Response({'error': f'k must be between 1 and {self.max_results}, radius_km between 0 and '
+                                      f'{self.max_radius_km}'}, status=status.HTTP_400_BAD_REQUEST)
+        latitude, longitude, harvest = center
+        if kind == 'oil-mills' and harvest is not None:
+            queryset = queryset.filter(self.can_extract(harvest))
+        if radius_km is not None:
+            results = geo.within(queryset, latitude, longitude, radius_km)[:self.max_results]
+        else:
+            results = geo.nearest(queryset, latitude, longitude, k)
+        return Response({
+            'latitude': latitude,
+            'longitude': longitude,
+            'results': [dict({name: getattr(obj, name) for name in ('id', *fields, 'latitude', 'longitude')},
+                             distance_km=round(obj.distance_km, 3)) for obj in results],
+        }, status=status.HTTP_200_OK)
+
+    def get_center(self, request):
+        # (latitude, longitude, harvest or None), None when the request has no located center
+        params = request.query_params
+        if 'latitude' in params or 'longitude' in params:
+            if 'latitude' not in params or 'longitude' not in params:
+                return None
+            return float(params['latitude']), float(params['longitude']), None
+        if 'harvest' in params:
+            harvest = get_object_or_404(Harvest.objects.select_related('grove'), pk=int(params['harvest']),
+                                        grove__farmer_id=request.user.id)
+            if harvest.grove.geohash is None:
+                return None
+            return harvest.grove.latitude, harvest.grove.longitude, harvest
+        mill = OilMill.objects.filter(mill_manager_id=request.user.id).exclude(geohash=None).first()
+        if mill is None:
+            return None
+        return mill.latitude, mill.longitude, None
+
+    @staticmethod
+    def can_extract(harvest):
+        # mills whose milling capacity covers what remains of the harvest, when the units compare
+        if not harvest.quantity_unit.lower().startswith('t'):
+            return Q()
+        return Q(transformation_capacity_unit='t', milling_capacity__gte=harvest.remaining_quantity) | Q(
+            transformation_capacity_unit='kg', milling_capacity__gte=harvest.remaining_quantity * 1000)
 
 
 # create a packaging operation
@@ -672,10 +1046,43 @@ class OilProductCreateAPIView(generics.CreateAPIView):
 class OilProductDetailView(RetrieveAPIView):
     queryset = OilProduct.objects.all()
     serializer_class = OilProductSerializer
-    permission_classes = [IsAuthenticated, IsOilMill, IsFarmer]
+    permission_classes = [IsAuthenticated, IsOwnerOfOilProduct]
     lookup_field = 'pk'
 
 
+# the oil products of the user, or of the mill the user manages
+class OilProductListView(ConditionalGetMixin, ListAPIView):
+    serializer_class = OilProductSummarySerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    version_models = (OilProduct,)
+    default_ordering = ('-production_date',)
+    sort_orderings = {
+        'date_asc': ('production_date',),
+        'date_desc': ('-production_date',),
+    }
+
+    def get_queryset(self):
+        return OilProduct.objects.owned_by(self.request.user)
+
+
+# genealogy of an oil product: the lots it was split from up to its extraction, the lots split from it
+# and what remains of them
+class OilProductLineageView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        product = get_object_or_404(OilProduct.objects.owned_by(request.user), pk=pk)
+        ancestors = list(lineage.ancestors(product.pk))
+        return Response({
+            'product': OilProductLineageSerializer(product).data,
+            'root': OilProductLineageSerializer(ancestors[0] if ancestors else product).data,
+            'ancestors': OilProductLineageSerializer(ancestors, many=True).data,
+            'descendants': OilProductLineageSerializer(lineage.descendants(product.pk), many=True).data,
+            'remaining_quantity': lineage.subtree_quantities([product.pk])[product.pk],
+        }, status=status.HTTP_200_OK)
+
+
 class OilAnalysisCreateView(CreateAPIView):
     queryset = OilAnalysis.objects.all()
     serializer_class = OilAnalysisSerializer
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Server-Timing headers and the per URL timings of /_perf/ (dbmanage.perf), first to time the others
+    'dbmanage.perf.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,9 +66,43 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication reading the role and mill claims instead of the User row
+        'dbmanage.authentication.ClaimsJWTAuthentication',
     ],
-   'NON_FIELD_ERRORS_KEY': 'error',   
+    # joins/prefetches derived from the serializer of each generic view
+    'DEFAULT_FILTER_BACKENDS': [
+        'dbmanage.query_optimizer.SerializerQueryOptimizationBackend',
+    ],
+   'NON_FIELD_ERRORS_KEY': 'error',
+}
+
+# serialized farmer/consumer/mill profiles (dbmanage.profile_cache). The in-process LRU is per worker:
+# with several workers use the shared backend, e.g.
+# {'BACKEND': 'dbmanage.profile_cache.DjangoCacheBackend', 'OPTIONS': {'alias': 'default', 'timeout': 3600}}
+PROFILE_CACHE = {
+    'BACKEND': 'dbmanage.profile_cache.LRUBackend',
+    'OPTIONS': {'max_entries': 10000, 'timeout': 300},
+}
+
+# notifications sent by the API (dbmanage.dispatcher): one outbox row per call in the request
+# transaction, written to Notification in batches by a background thread, or 'sync': every
+# notification written in the request transaction
+NOTIFICATION_DISPATCHER = {
+    'MODE': 'thread',
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 5,
+}
+
+# olive need / sale offer matching index (dbmanage.matching): in memory in every process, reloaded
+# after REFRESH_INTERVAL seconds to pick up the writes of the other processes
+MATCHING = {
+    'REFRESH_INTERVAL': 300,
+}
+
+# request timings kept per URL name for the p50/p95/p99 of /_perf/ (dbmanage.perf), in every process
+PERFORMANCE_MONITOR = {
+    'SAMPLE_SIZE': 1000,
+    'SERVER_TIMING': True,
 }
 
 CORS_ORIGIN_ALLOW_ALL = True
@@ -94,10 +130,21 @@ TEMPLATES = [
     },
 ]
 
+# PBKDF2 with the iterations of PASSWORD_HASHING. The SHA1 hashes stored before are still checked and
+# replaced by PBKDF2 ones at the next login of their user
 PASSWORD_HASHERS = [
+    'dbmanage.passwords.PBKDF2PasswordHasher',
     'django.contrib.auth.hashers.SHA1PasswordHasher',
 ]
 
+# password hashing of login and register (dbmanage.passwords): on a pool of WORKERS threads, at most
+# MAX_PENDING hashes queued before answering 503
+PASSWORD_HASHING = {
+    'ITERATIONS': 260000,
+    'WORKERS': os.cpu_count() or 1,
+    'MAX_PENDING': 64,
+}
+
 WSGI_APPLICATION = 'oil4medProject.wsgi.application'
 
 # Database